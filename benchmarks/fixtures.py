@@ -0,0 +1,235 @@
+"""Synthetic apps, scripts, TCC databases and stand-in `codesign`/`security` tools for the benchmarks.
+
+The stand-in tools are small Python scripts that sleep for a configurable latency, then print output in the same form
+as the real tools. Point tccprofile.py at them with PrivacyProfiles.CODESIGN and PrivacyProfiles.SECURITY, or the
+TCCPROFILE_CODESIGN and TCCPROFILE_SECURITY environment variables, so the benchmarks run on machines without them.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import plistlib
+import sqlite3
+import stat
+import struct
+import sys
+
+BUNDLE_ID_PREFIX = 'com.example.bench'
+
+# A 64-bit little endian Mach-O header with no load commands. It has no code signature, so tccprofile.py falls back
+# to `codesign` for apps using it, which lets the stand-in tool's latency be measured.
+MACHO_HEADER = struct.pack('<8I', 0xfeedfacf, 0x01000007, 3, 2, 0, 0, 0, 0)
+# The same header with an LC_CODE_SIGNATURE command, pointing to an embedded signature with no requirements. It counts
+# as a signed executable when looking for helpers and scanning, but its requirement still comes from `codesign`.
+SIGNED_MACHO = (struct.pack('<8I', 0xfeedfacf, 0x01000007, 3, 2, 1, 16, 0, 0) + struct.pack('<4I', 0x1d, 16, 48, 12) +
+                struct.pack('>3I', 0xfade0cc0, 12, 0))
+
+# Environment variables read by the stand-in tools
+LATENCY_VARIABLE = 'FAKE_TOOL_LATENCY'  # Seconds each tool invocation sleeps for
+LOG_VARIABLE = 'FAKE_TOOL_LOG'  # File each tool invocation appends its arguments to
+
+FAKE_TOOL_HEADER = '''#!{python}
+"""Stand-in for {tool}, created by benchmarks/fixtures.py."""
+import os
+import plistlib
+import sys
+import time
+
+time.sleep(float(os.environ.get('{latency_variable}', '{latency}')))
+if os.environ.get('{log_variable}'):
+    with open(os.environ['{log_variable}'], 'a') as log:
+        log.write(' '.join(['{tool}'] + sys.argv[1:]) + '\\n')
+'''
+
+FAKE_CODESIGN = FAKE_TOOL_HEADER + '''
+
+def identifier(path):
+    """Returns the bundle identifier of an app bundle, or the file name for anything else."""
+    try:
+        with open(os.path.join(path, 'Contents/Info.plist'), 'rb') as f:
+            info = plistlib.load(f) if hasattr(plistlib, 'load') else plistlib.readPlist(f)
+        return info['CFBundleIdentifier'], os.path.join(path, 'Contents/MacOS', info['CFBundleExecutable'])
+    except (IOError, OSError, KeyError):
+        return os.path.basename(path), path
+
+
+# Only `codesign -dr - <path> [<path> ...]` is supported. Each path is reported in turn, the same as codesign does:
+# 'Executable=' on stderr followed by the designated requirement on stdout, or an error on stderr.
+paths = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+status = 0
+for path in paths:
+    if not os.path.exists(path):
+        sys.stderr.write('{{}}: No such file or directory\\n'.format(path))
+        status = 1
+    elif 'unsigned' in os.path.basename(path.rstrip('/')):
+        sys.stderr.write('{{}}: code object is not signed at all\\n'.format(path))
+        status = 1
+    else:
+        bundle_id, executable = identifier(path.rstrip('/'))
+        sys.stderr.write('Executable={{}}\\n'.format(executable))
+        sys.stdout.write('designated => identifier "{{}}" and anchor apple generic and certificate leaf[subject.OU] = BENCH000000\\n'.format(bundle_id))
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+sys.exit(status)
+'''
+
+FAKE_SECURITY = FAKE_TOOL_HEADER + '''
+import shutil
+
+# Supports `cms -S ... -i <in> -o <out>` (copies the profile unsigned), `cms -D -i <in>` and `find-identity`.
+args = sys.argv[1:]
+if args[:1] == ['find-identity']:
+    print('  1) 0000000000000000000000000000000000000000 "Developer ID Application: Benchmark (BENCH000000)"')
+    print('     1 valid identities found')
+elif args[:2] == ['cms', '-S']:
+    shutil.copyfile(args[args.index('-i') + 1], args[args.index('-o') + 1])
+elif args[:2] == ['cms', '-D']:
+    with open(args[args.index('-i') + 1], 'rb') as f:
+        getattr(sys.stdout, 'buffer', sys.stdout).write(f.read())
+else:
+    sys.stderr.write('security: unsupported arguments: {{}}\\n'.format(' '.join(args)))
+    sys.exit(1)
+'''
+
+
+def _write_tool(path, template, tool, latency):
+    with open(path, 'w') as f:
+        f.write(template.format(python=sys.executable, tool=tool, latency=latency,
+                                latency_variable=LATENCY_VARIABLE, log_variable=LOG_VARIABLE))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    return path
+
+
+def make_fake_tools(directory, latency=0.0):
+    """Creates stand-in codesign and security tools in directory. Returns a dict of their paths, keyed by tool name."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    return {
+        'codesign': _write_tool(os.path.join(directory, 'codesign'), FAKE_CODESIGN, 'codesign', latency),
+        'security': _write_tool(os.path.join(directory, 'security'), FAKE_SECURITY, 'security', latency),
+    }
+
+
+def _write_plist(value, path):
+    if hasattr(plistlib, 'dump'):
+        with open(path, 'wb') as f:
+            plistlib.dump(value, f)
+    else:
+        plistlib.writePlist(value, path)
+
+
+def make_app(directory, name, signed=False):
+    """Creates a minimal .app bundle with an Info.plist and a Mach-O executable, with an embedded signature if signed
+    is True. Returns its path."""
+    path = os.path.join(directory, '{}.app'.format(name))
+    os.makedirs(os.path.join(path, 'Contents/MacOS'))
+    _write_plist({
+        'CFBundleExecutable': name,
+        'CFBundleIdentifier': '{}.{}'.format(BUNDLE_ID_PREFIX, name.lower()),
+        'CFBundleName': name,
+        'CFBundleShortVersionString': '1.0',
+        'CFBundleVersion': '1',
+    }, os.path.join(path, 'Contents/Info.plist'))
+
+    executable = os.path.join(path, 'Contents/MacOS', name)
+    with open(executable, 'wb') as f:
+        f.write(SIGNED_MACHO if signed else MACHO_HEADER)
+    os.chmod(executable, 0o755)
+
+    return path
+
+
+def make_script(directory, name, signed=True, interpreter='/bin/sh'):
+    """Creates an executable script. The stand-in codesign reports scripts with 'unsigned' in their name as not signed,
+    so tccprofile.py uses the requirement of their interpreter. Returns its path."""
+    path = os.path.join(directory, '{}{}.sh'.format('' if signed else 'unsigned_', name))
+    with open(path, 'w') as f:
+        f.write('#!{}\necho {}\n'.format(interpreter, name))
+    os.chmod(path, 0o755)
+
+    return path
+
+
+def make_apps(directory, apps, scripts=0, unsigned_scripts=0):
+    """Creates apps app bundles, scripts signed scripts and unsigned_scripts unsigned scripts in directory.
+    Returns the list of their paths."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    paths = [make_app(directory, 'BenchApp{}'.format(i)) for i in range(apps)]
+    paths.extend(make_script(directory, 'bench_script{}'.format(i)) for i in range(scripts))
+    paths.extend(make_script(directory, 'bench_script{}'.format(i), signed=False) for i in range(unsigned_scripts))
+
+    return paths
+
+
+def requirement_blob(identifier):
+    """Returns a compiled requirement blob for 'identifier "<identifier>" and anchor apple', as stored in the csreq
+    column of TCC.db."""
+    identifier = identifier.encode('utf-8')
+    padding = b'\0' * (-len(identifier) % 4)
+    expression = struct.pack('>3I', 6, 2, len(identifier)) + identifier + padding + struct.pack('>I', 3)  # and, ident, anchor apple
+
+    return struct.pack('>3I', 0xfade0c00, 12 + len(expression), 1) + expression
+
+
+# The access table of a macOS 10.15 TCC.db
+TCC_SCHEMA = '''CREATE TABLE access (
+    service TEXT NOT NULL,
+    client TEXT NOT NULL,
+    client_type INTEGER NOT NULL,
+    allowed INTEGER NOT NULL,
+    prompt_count INTEGER NOT NULL,
+    csreq BLOB,
+    policy_id INTEGER,
+    indirect_object_identifier_type INTEGER,
+    indirect_object_identifier TEXT,
+    indirect_object_code_identity BLOB,
+    flags INTEGER,
+    last_modified INTEGER NOT NULL DEFAULT (CAST(strftime('%s','now') AS INTEGER)),
+    PRIMARY KEY (service, client, client_type, indirect_object_identifier)
+)'''
+
+TCC_SERVICES = [
+    'kTCCServiceAccessibility',
+    'kTCCServiceAddressBook',
+    'kTCCServiceAppleEvents',
+    'kTCCServiceCalendar',
+    'kTCCServiceCamera',
+    'kTCCServiceMicrophone',
+    'kTCCServicePhotos',
+    'kTCCServicePostEvent',
+    'kTCCServiceReminders',
+    'kTCCServiceScreenCapture',
+    'kTCCServiceSystemPolicyAllFiles',
+    'kTCCServiceSystemPolicyDesktopFolder',
+]
+
+
+def make_tcc_db(path, rows, last_modified=1570000000):
+    """Creates a TCC.db with rows rows in the access table, spread across TCC_SERVICES. Every tenth client is a path
+    (client_type 1) rather than a bundle identifier, and AppleEvents rows target com.apple.finder. Returns path."""
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(TCC_SCHEMA)
+
+        def _rows():
+            for i in range(rows):
+                service = TCC_SERVICES[i % len(TCC_SERVICES)]
+                client_type = 1 if i % 10 == 0 else 0
+                client = '/usr/local/bin/bench{}'.format(i) if client_type else '{}.client{}'.format(BUNDLE_ID_PREFIX, i)
+                if service == 'kTCCServiceAppleEvents':
+                    indirect = (0, 'com.apple.finder', sqlite3.Binary(requirement_blob('com.apple.finder')))
+                else:
+                    indirect = (0, 'UNUSED', None)
+                yield (service, client, client_type, i % 3 != 0, i % 2, sqlite3.Binary(requirement_blob(client)), None) + indirect + (0, last_modified + i)
+
+        connection.executemany('INSERT INTO access VALUES ({})'.format(', '.join(['?'] * 12)), _rows())
+        connection.commit()
+    finally:
+        connection.close()
+
+    return path
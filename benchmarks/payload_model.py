@@ -0,0 +1,138 @@
+#!/usr/bin/python
+"""Reports the build time and peak memory of a profile with a large number of entries.
+
+Apps are not resolved: every app is given a pre-made AppInspection, so only set_services_dict(), build_profile()
+and write() are measured. Each size is run in a fresh interpreter so the peak memory of one size doesn't affect the
+next. Peak memory is measured with tracemalloc (Python 3), or the maximum resident set size on Python 2.
+
+A different copy of tccprofile.py can be measured with --tccprofile, to compare against an earlier revision.
+
+Usage:
+    ./benchmarks/payload_model.py [--python /path/to/python] [--sizes 1000 10000 100000] [--tccprofile path] [--json]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+TCCPROFILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tccprofile.py')
+
+DUPLICATE_EVERY = 10  # Every nth app is a repeat of the previous app, so de-duplication is exercised
+
+
+def measure_size(tccprofile_path, size, output_dir):
+    """Builds and writes a profile with size Accessibility entries and size / 10 AppleEvents entries. Runs in the child process."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(tccprofile_path)))
+    import tccprofile
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    paths = list()
+    for i in range(size):
+        paths.append(paths[-1] if i and i % DUPLICATE_EVERY == 0 else '/Applications/Bench {}.app'.format(i))
+
+    inspections = dict()
+    for path in set(paths):
+        inspection = tccprofile.AppInspection(path=path)
+        inspection.app_name = os.path.basename(os.path.splitext(path)[0])
+        inspection.mimetype = 'x-mach-binary'
+        inspection.signed = True
+        inspection.codesign_result = 'identifier "com.example.bench.{}" and anchor apple generic'.format(len(inspections))
+        inspection.identifier = 'com.example.bench.{}'.format(len(inspections))
+        inspection.identifier_type = 'bundleID'
+        inspections[(path, False)] = inspection
+
+    app_lists = {
+        'Accessibility': {'_apps': paths, 'apps': list()},
+        'AppleEvents': {'_apps': ['{},{}'.format(path, paths[0]) for path in paths[:max(1, size // 10)]], 'apps': list()},
+    }
+
+    if tracemalloc:
+        tracemalloc.start()
+
+    start = time.time()
+    profile = tccprofile.PrivacyProfiles(payload_description='Bench', payload_name='Bench', payload_identifier='com.example.bench',
+                                         payload_organization='Example', profile_removal_password=None, sign_cert=None,
+                                         filename=os.path.join(output_dir, 'bench.mobileconfig'), removal_date=None, timezone=None,
+                                         jobs=1, inspections=inspections)
+    profile.set_services_dict(app_lists)
+    profile.build_profile(allow=True)
+    build_seconds = time.time() - start
+
+    start = time.time()
+    profile.write()
+    write_seconds = time.time() - start
+
+    if tracemalloc:
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        peak_source = 'tracemalloc'
+    else:
+        import resource
+        peak_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        peak_source = 'maxrss'
+
+    return {
+        'entries': size,
+        'build_seconds': round(build_seconds, 4),
+        'write_seconds': round(write_seconds, 4),
+        'peak_bytes': peak_bytes,
+        'peak_source': peak_source,
+        'output_bytes': os.path.getsize(os.path.join(output_dir, 'bench.mobileconfig')),
+    }
+
+
+def measure(python, tccprofile_path, size):
+    """Runs measure_size() for size in a new interpreter, and returns its results."""
+    output_dir = tempfile.mkdtemp()
+    try:
+        process = subprocess.Popen([python, os.path.abspath(__file__), '--child', str(size), '--tccprofile', tccprofile_path, '--output-dir', output_dir],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        stdout, stderr = process.communicate()
+    finally:
+        shutil.rmtree(output_dir)
+
+    if process.returncode != 0:
+        raise RuntimeError('Building {} entries failed:\n{}'.format(size, stderr))
+
+    return json.loads(stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure profile build time and peak memory for large numbers of entries.')
+    parser.add_argument('--python', default=sys.executable, help='Python interpreter to measure.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of entries to build.')
+    parser.add_argument('--tccprofile', default=TCCPROFILE, help='Path to the tccprofile.py to measure.')
+    parser.add_argument('--json', action='store_true', help='Output the results as JSON.')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure_size(args.tccprofile, args.child, args.output_dir)))
+        return
+
+    results = [measure(args.python, args.tccprofile, size) for size in args.sizes]
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    print('{:>10}  {:>10}  {:>10}  {:>12}'.format('entries', 'build (s)', 'write (s)', 'peak (MiB)'))
+    for result in results:
+        print('{:>10}  {:>10.4f}  {:>10.4f}  {:>12.1f}'.format(result['entries'], result['build_seconds'], result['write_seconds'],
+                                                              result['peak_bytes'] / 1048576.0))
+
+
+if __name__ == '__main__':
+    main()
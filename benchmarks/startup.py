@@ -0,0 +1,105 @@
+#!/usr/bin/python
+"""Reports the start up time of tccprofile.py using `python -X importtime` (Python 3.7 or newer).
+
+Two runs are measured: `tccprofile.py --help`, and a minimal profile build for a single app.
+For each, the wall time, total import time, and the slowest imports by cumulative time are reported.
+The build uses a synthetic app and the stand-in `codesign` from benchmarks/fixtures.py, so it runs without a Mac.
+
+Usage:
+    ./benchmarks/startup.py [--python /path/to/python3] [--app /path/to/App.app] [--repeat 5] [--json]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixtures
+
+TCCPROFILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tccprofile.py')
+
+# Imports that should only happen when the GUI is launched or a removal date is used
+DEFERRED_IMPORTS = ['tkinter', 'Tkinter', 'AppKit', 'Foundation', 'objc', 'pytz']
+
+
+def parse_importtime(stderr):
+    """Returns a list of (module, self_us, cumulative_us) from `-X importtime` output."""
+    imports = list()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+
+    return imports
+
+
+def measure(python, arguments, repeat, env=None):
+    """Runs tccprofile.py with arguments repeat times. Returns the results of the fastest run."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        process = subprocess.Popen([python, '-X', 'importtime', TCCPROFILE] + arguments,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=env)
+        _, stderr = process.communicate()
+        wall = time.time() - start
+
+        if process.returncode != 0:
+            raise RuntimeError('tccprofile.py {} failed:\n{}'.format(' '.join(arguments), stderr))
+
+        if best is None or wall < best['wall_seconds']:
+            imports = parse_importtime(stderr)
+            best = {
+                'wall_seconds': round(wall, 4),
+                'import_seconds': round(sum(i[1] for i in imports) / 1000000.0, 4),
+                'module_count': len(imports),
+                'deferred_imports_loaded': sorted(set(i[0].split('.')[0] for i in imports) & set(DEFERRED_IMPORTS)),
+                'slowest_imports': [{'module': i[0], 'cumulative_us': i[2]} for i in sorted(imports, key=lambda i: i[2], reverse=True)[:10]],
+            }
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure tccprofile.py start up time.')
+    parser.add_argument('--python', default=sys.executable, help='Python interpreter to measure. Must support -X importtime.')
+    parser.add_argument('--app', help='App used for the minimal profile build. Defaults to a synthetic app.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs of each command. The fastest is reported.')
+    parser.add_argument('--json', action='store_true', help='Output the results as JSON.')
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        # The stand-in codesign is used the same way as the benchmark suite, so the build doesn't need /usr/bin/codesign
+        env = dict(os.environ)
+        env['TCCPROFILE_CODESIGN'] = fixtures.make_fake_tools(os.path.join(output_dir, 'bin'))['codesign']
+        app = args.app or fixtures.make_app(output_dir, 'Startup')
+        results = {
+            'help': measure(args.python, ['--help'], args.repeat),
+            'build': measure(args.python, ['--acc', app, '--pd', 'Startup', '--pi', 'com.example.startup', '--pn', 'Startup',
+                                           '--po', 'Example', '--no-cache', '-o', os.path.join(output_dir, 'startup.mobileconfig')],
+                             args.repeat, env=env),
+        }
+    finally:
+        shutil.rmtree(output_dir)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    for name, result in sorted(results.items()):
+        print('{}: {:.4f}s wall, {:.4f}s importing {} modules'.format(name, result['wall_seconds'], result['import_seconds'], result['module_count']))
+        if result['deferred_imports_loaded']:
+            print('  Deferred imports loaded: {}'.format(', '.join(result['deferred_imports_loaded'])))
+        for i in result['slowest_imports']:
+            print('  {:>10}us  {}'.format(i['cumulative_us'], i['module']))
+
+
+if __name__ == '__main__':
+    main()
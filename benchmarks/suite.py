@@ -0,0 +1,230 @@
+#!/usr/bin/python
+"""Benchmarks the main stages of tccprofile.py, and tccdbRead.py, against synthetic apps and stand-in tools.
+
+Synthetic app bundles, scripts and a TCC.db are created in a temporary directory, along with stand-in `codesign` and
+`security` tools that sleep for --latency seconds per call (see benchmarks/fixtures.py). Nothing on the machine is
+inspected, so the suite runs the same with or without Xcode's tools, and off a Mac.
+
+Each benchmark is run --repeat times, and the fastest and median times are reported as JSON, along with the number of
+stand-in tool calls made. Pass an earlier result with --compare to show the change from it; the exit code is 1 if any
+benchmark is slower than --threshold times its earlier result, so CI can compare commits.
+
+Benchmarks:
+    set_services_dict   Parse --entries unique app paths across every service
+    build_profile       Resolve every synthetic app for every service, without the requirements cache
+    build_profile_warm  The same, with a requirements cache that already has every app in it
+    write               Write the built profile to a file
+    write_signed        Write and sign the built profile
+    read_db             Print the --rows rows of a synthetic TCC.db with tccdbRead.ReadTCC.read_db
+
+Usage:
+    ./benchmarks/suite.py [--apps 100] [--scripts 20] [--entries 10000] [--rows 100000] [--latency 0.005]
+                          [--jobs 4] [--repeat 3] [--output results.json] [--compare baseline.json] [--threshold 1.25]
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fixtures  # noqa: E402
+import tccdbRead  # noqa: E402
+import tccprofile  # noqa: E402
+
+
+class Suite(object):
+    """Creates the fixtures once, and runs each benchmark against them."""
+    def __init__(self, args, directory):
+        self.args = args
+        self.directory = directory
+        self.tool_log = os.path.join(directory, 'tools.log')
+        self.tools = fixtures.make_fake_tools(os.path.join(directory, 'bin'), latency=args.latency)
+        self.apps = fixtures.make_apps(os.path.join(directory, 'Applications'), args.apps, scripts=args.scripts, unsigned_scripts=args.scripts)
+        self.tcc_db = fixtures.make_tcc_db(os.path.join(directory, 'TCC.db'), args.rows)
+        self.cache_dir = os.path.join(directory, 'cache')
+
+        os.environ[fixtures.LATENCY_VARIABLE] = str(args.latency)
+        os.environ[fixtures.LOG_VARIABLE] = self.tool_log
+        tccprofile.PrivacyProfiles.CODESIGN = self.tools['codesign']
+        tccprofile.PrivacyProfiles.SECURITY = self.tools['security']
+
+    def _profile(self, filename=None, sign_cert=None, cache=None):
+        return tccprofile.PrivacyProfiles(payload_description='Benchmark', payload_name='Benchmark', payload_identifier='com.example.bench',
+                                          payload_organization='Example', profile_removal_password=None, sign_cert=sign_cert,
+                                          filename=filename, removal_date=None, timezone=None, cache=cache, jobs=self.args.jobs)
+
+    def _app_lists(self, paths):
+        """Returns the app lists for set_services_dict(), with every path in every service. AppleEvents entries send from each path to the first app."""
+        app_lists = dict((payload, {'_apps': list(paths), 'apps': list()}) for payload in tccprofile.PrivacyProfiles.PAYLOADS)
+        app_lists['AppleEvents']['_apps'] = ['{},{}'.format(path, paths[0]) for path in paths]
+
+        return app_lists
+
+    def _tool_calls(self):
+        """Returns the number of stand-in tool calls logged since the last call, and clears the log."""
+        if not os.path.exists(self.tool_log):
+            return 0
+        with open(self.tool_log) as f:
+            calls = len(f.readlines())
+        os.remove(self.tool_log)
+
+        return calls
+
+    def set_services_dict(self):
+        paths = ['/Applications/Bench{}.app'.format(i) for i in range(self.args.entries // len(tccprofile.PrivacyProfiles.PAYLOADS) + 1)]
+        profile = self._profile()
+        start = time.time()
+        profile.set_services_dict(self._app_lists(paths))
+        return time.time() - start
+
+    def build_profile(self):
+        profile = self._profile()
+        profile.set_services_dict(self._app_lists(self.apps))
+        start = time.time()
+        profile.build_profile(allow=True)
+        return time.time() - start
+
+    def build_profile_warm(self):
+        cache = tccprofile.CodeSignCache(cache_dir=self.cache_dir)
+        try:
+            profile = self._profile(cache=cache)
+            profile.set_services_dict(self._app_lists(self.apps))
+            profile.build_profile(allow=True)  # Fill the cache
+
+            profile = self._profile(cache=cache)
+            profile.set_services_dict(self._app_lists(self.apps))
+            self._tool_calls()
+            start = time.time()
+            profile.build_profile(allow=True)
+            return time.time() - start
+        finally:
+            cache.close()
+
+    def _write(self, sign_cert=None):
+        filename = os.path.join(self.directory, 'bench.mobileconfig')
+        profile = self._profile(filename=filename, sign_cert=sign_cert)
+        profile.set_services_dict(self._app_lists(self.apps))
+        profile.build_profile(allow=True)
+        self._tool_calls()
+        start = time.time()
+        profile.write()
+        return time.time() - start
+
+    def write(self):
+        return self._write()
+
+    def write_signed(self):
+        return self._write(sign_cert='Developer ID Application: Benchmark (BENCH000000)')
+
+    def read_db(self):
+        stdout = sys.stdout
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                start = time.time()
+                tccdbRead.ReadTCC(tcc_db_path=self.tcc_db).read_db()
+                return time.time() - start
+            finally:
+                sys.stdout = stdout
+
+    def run(self, name):
+        """Runs a benchmark --repeat times. Returns its fastest and median times, and the tool calls made per run."""
+        times = list()
+        calls = 0
+        for _ in range(self.args.repeat):
+            self._tool_calls()
+            times.append(getattr(self, name)())
+            calls = self._tool_calls()
+        times.sort()
+
+        return {
+            'min_seconds': round(times[0], 6),
+            'median_seconds': round(times[len(times) // 2], 6),
+            'tool_calls': calls,
+        }
+
+
+BENCHMARKS = ['set_services_dict', 'build_profile', 'build_profile_warm', 'write', 'write_signed', 'read_db']
+
+
+def git_revision():
+    """Returns the current commit of the repository, or None if it isn't available."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of each benchmark from baseline to stderr. Returns the names of benchmarks slower than threshold times the baseline."""
+    regressions = list()
+    for name, result in sorted(results['benchmarks'].items()):
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous or not previous['min_seconds']:
+            print('{:<20} {:>10.4f}s  (new)'.format(name, result['min_seconds']), file=sys.stderr)
+            continue
+
+        ratio = result['min_seconds'] / previous['min_seconds']
+        slower = ratio > threshold
+        if slower:
+            regressions.append(name)
+        print('{:<20} {:>10.4f}s  {:>10.4f}s  {:>6.2f}x{}'.format(name, previous['min_seconds'], result['min_seconds'], ratio,
+                                                                  '  SLOWER' if slower else ''), file=sys.stderr)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tccprofile.py and tccdbRead.py with synthetic apps and stand-in tools.')
+    parser.add_argument('--apps', type=int, default=100, help='Number of synthetic app bundles.')
+    parser.add_argument('--scripts', type=int, default=20, help='Number of synthetic signed scripts, and of unsigned scripts.')
+    parser.add_argument('--entries', type=int, default=10000, help='Number of entries for the set_services_dict benchmark.')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of rows in the synthetic TCC.db.')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds each stand-in tool call takes.')
+    parser.add_argument('--jobs', type=int, default=tccprofile.PrivacyProfiles.DEFAULT_JOBS, help='Number of apps to resolve concurrently.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each benchmark.')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help='Benchmarks to run.')
+    parser.add_argument('--output', help='File to write the JSON results to. Defaults to stdout.')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Ratio to the earlier result above which a benchmark is reported as slower.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='tccprofile-bench-')
+    try:
+        suite = Suite(args, directory)
+        results = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': dict((key, getattr(args, key)) for key in ['apps', 'scripts', 'entries', 'rows', 'latency', 'jobs', 'repeat']),
+            'benchmarks': dict((name, suite.run(name)) for name in args.only),
+        }
+    finally:
+        shutil.rmtree(directory)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
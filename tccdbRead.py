@@ -2,21 +2,44 @@
 
 from __future__ import absolute_import, print_function
 
+import argparse
+import calendar
+import csv
+import hashlib
+import json
 import os
+import re
 import sqlite3
 import sys
+import threading
+import time
+
+try:
+    # Python 3
+    from urllib.parse import quote
+except ImportError:
+    # Python 2
+    from urllib import quote
+
+
+class TCCDatabaseException(Exception):
+    pass
 
 
 class Sqlite_db():
     '''
     Wrapper for sqlite3 that includes some budget error/exception handling.
     Usage:
-        Sqlite_db.connect(db)
-            Tries to connect, if connection doesn't already exist
-        Sqlite_db.query('SELECT something FROM table', fetch=False)
+        Sqlite_db.connect(db, read_only=False, immutable=False)
+            Tries to connect, if connection doesn't already exist.
+                read_only=True opens the database with a mode=ro URI, so it is never written to.
+                immutable=True also skips locking, for copies of a database that nothing is writing to.
+        Sqlite_db.query('SELECT something FROM table WHERE thing = ?', params=(thing,), fetch=False)
             Makes the query against the database.
                 fetch=True will return selected items.
                 Otherwise query is made as supplied
+        Sqlite_db.iterate('SELECT something FROM table', params=(), batch_size=1000)
+            Yields each row of the query, fetching batch_size rows at a time rather than every row at once.
         Sqlite_db.commit_change()
             Commits changes made to the database.
         Sqlite_db.disconnect(db)
@@ -24,13 +47,27 @@ class Sqlite_db():
     '''
     connection = ''
     c = ''
+    MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the database read through a memory map, rather than read() calls
 
-    def connect(self, db):
+    @staticmethod
+    def _uri(db, immutable=False):
+        return 'file:{}?{}'.format(quote(os.path.abspath(db)), 'immutable=1' if immutable else 'mode=ro')
+
+    def connect(self, db, read_only=False, immutable=False):
         try:
             self.connection.execute("")
         except Exception:
             try:
-                self.connection = sqlite3.connect(db)
+                if read_only or immutable:
+                    try:
+                        self.connection = sqlite3.connect(self._uri(db, immutable=immutable), uri=True)
+                    except TypeError:
+                        # Python 2 can't open URIs, so make the connection refuse writes instead
+                        self.connection = sqlite3.connect(db)
+                        self.connection.execute('PRAGMA query_only = ON')
+                else:
+                    self.connection = sqlite3.connect(db)
+                self.connection.execute('PRAGMA mmap_size = {}'.format(int(self.MMAP_SIZE)))
                 self.c = self.connection.cursor()
             except Exception:
                 raise
@@ -50,59 +87,546 @@ class Sqlite_db():
         except Exception:
             pass
 
-    def query(self, query_string, fetch=False):
+    def query(self, query_string, params=(), fetch=False):
         try:
-            self.c.execute(query_string)
-            if not fetch:
-                self.c.execute(query_string)
-            else:
-                self.c.execute(query_string)
+            self.c.execute(query_string, params)
+            if fetch:
                 return self.c.fetchall()
         except Exception:
             raise
 
+    def iterate(self, query_string, params=(), batch_size=1000):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query_string, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def commit_change(self):
+        self.connection.commit()
+
+
+def batches(rows, size=1000):
+    '''Yields lists of up to size rows at a time.'''
+    batch = list()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
+def write_rows(rows, columns, output_format='table', output=None, batch_size=1000):
+    '''Writes rows, tuples of the values of columns, to output (stdout by default) as a table, JSON, NDJSON or CSV.
+    Rows are written in batches of batch_size as they are read.'''
+    output = output or sys.stdout
+
+    if output_format == 'csv':
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(columns)
+        for batch in batches(rows, batch_size):
+            if sys.version_info[0] < 3:
+                # Python 2's csv module only writes byte strings
+                batch = [[value.encode('utf-8') if isinstance(value, type(u'')) else value for value in row] for row in batch]
+            writer.writerows(batch)
+    elif output_format in ['json', 'ndjson']:
+        separator = '\n' if output_format == 'ndjson' else ',\n  '
+        written = False
+        if output_format == 'json':
+            output.write('[')
+        for batch in batches(rows, batch_size):
+            lines = [json.dumps(dict(zip(columns, row)), sort_keys=True) for row in batch]
+            if output_format == 'ndjson':
+                output.write('\n'.join(lines) + '\n')
+            else:
+                output.write((separator if written else '\n  ') + separator.join(lines))
+            written = True
+        if output_format == 'json':
+            output.write('\n]\n' if written else ']\n')
+    else:
+        line = ' ' + ' | '.join(['{:<35}'] * (len(columns) - 1) + ['{}'])
+        for index, batch in enumerate(batches(rows, batch_size)):
+            lines = list()
+            if index == 0:
+                lines.append('-----------------------------------------------------------------------')
+                lines.append(line.format(*[column.replace('_', ' ').capitalize() for column in columns]))
+                lines.append('-----------------------------------------------------------------------')
+            lines.extend(line.format(*['' if value is None else value for value in row]) for row in batch)
+            output.write('\n'.join(lines) + '\n')
+
 
 class ReadTCC():
-    def __init__(self, tcc_db_path):
+    # Columns of the access table that can be read, in output order. Which of these exist depends on the macOS
+    # version: macOS 11 replaced allowed with auth_value and auth_reason.
+    ACCESS_COLUMNS = ['service', 'client', 'client_type', 'allowed', 'auth_value', 'auth_reason', 'prompt_count',
+                      'indirect_object_identifier', 'last_modified']
+    SERVICE_PREFIX = 'kTCCService'
+    FORMATS = ['table', 'json', 'ndjson', 'csv']
+    BATCH_SIZE = 1000  # Rows fetched, and written, at a time
+    KEY_COLUMNS = ['service', 'client', 'client_type', 'indirect_object_identifier']  # The primary key of the access table
+    WATCH_INTERVAL = 1.0  # Seconds between checks for changes by watch()
+
+    def __init__(self, tcc_db_path, immutable=False):
         self.tcc_db = tcc_db_path.rstrip('/')
         self.tcc_db = os.path.expandvars(self.tcc_db)
         self.tcc_db = os.path.expanduser(self.tcc_db)
+        self.immutable = immutable
         self.sqlite = Sqlite_db()
 
-    def read_db(self):
+    def _connect(self):
         if self.tcc_db.startswith('/Library') and os.getuid() != 0:
-            print('You must be root to read {}'.format(self.tcc_db))
-            sys.exit(1)
-        else:
-            self.sqlite.connect(self.tcc_db)
-            query = self.sqlite.query('SELECT service, client FROM access', fetch=True)
-            if query:
-                print('-----------------------------------------------------------------------')
-                print(' {:<35} | {}'.format('Service', 'Client'))
-                print('-----------------------------------------------------------------------')
-                for service, client in query:
-                    print(' {:<35} | {}'.format(service, client))
+            raise TCCDatabaseException('You must be root to read {}'.format(self.tcc_db))
+        self.sqlite.connect(self.tcc_db, read_only=True, immutable=self.immutable)
+
+    def table_columns(self):
+        '''Returns the name of every column of the access table of this database, including the csreq blobs.'''
+        self._connect()
+        return [row[1] for row in self.sqlite.query('PRAGMA table_info(access)', fetch=True)]
+
+    def columns(self):
+        '''Returns the ACCESS_COLUMNS in the access table of this database.'''
+        existing = set(self.table_columns())
+        return [column for column in self.ACCESS_COLUMNS if column in existing]
+
+    @classmethod
+    def service_name(cls, service):
+        '''Returns the kTCCService name of a service, so "Camera" and "kTCCServiceCamera" are the same.'''
+        return service if service.startswith(cls.SERVICE_PREFIX) else cls.SERVICE_PREFIX + service
+
+    def _conditions(self, services=None, clients=None, since=None):
+        '''Returns the WHERE clause, and its parameters, for the given services and clients, and rows modified since.'''
+        conditions = list()
+        params = list()
+        for column, values in [('service', [self.service_name(service) for service in services or []]), ('client', clients or [])]:
+            if values:
+                conditions.append('{} IN ({})'.format(column, ', '.join(['?'] * len(values))))
+                params.extend(values)
+        if since is not None:
+            conditions.append('last_modified >= ?')
+            params.append(since)
+
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def rows(self, services=None, clients=None, columns=None, since=None):
+        '''Yields a tuple of the columns of each row of the access table, optionally only for the given services and
+        clients, and only rows with a last_modified time of since or later. Rows are read BATCH_SIZE at a time, so
+        the table is never held in memory.'''
+        columns = columns or self.columns()
+        conditions, params = self._conditions(services=services, clients=clients, since=since)
+
+        self._connect()
+        for row in self.sqlite.iterate('SELECT {} FROM access'.format(', '.join(columns)) + conditions, params, batch_size=self.BATCH_SIZE):
+            yield row
+
+    def read_db(self, services=None, clients=None, output_format='table', output=None):
+        '''Writes the rows of the access table to output, stdout by default, as a table of service and client, or
+        every column as JSON, NDJSON or CSV. Rows are written in batches as they are read.'''
+        columns = ['service', 'client'] if output_format == 'table' else self.columns()
+        rows = self.rows(services=services, clients=clients, columns=columns)
+        write_rows(rows, columns, output_format=output_format, output=output, batch_size=self.BATCH_SIZE)
+        self.sqlite.disconnect(self.tcc_db)
+
+    def _data_version(self):
+        return self.sqlite.query('PRAGMA data_version', fetch=True)[0][0]
+
+    def count(self, services=None, clients=None):
+        '''Returns the number of rows of the access table, optionally only for the given services and clients.'''
+        conditions, params = self._conditions(services=services, clients=clients)
+        self._connect()
+        return self.sqlite.query('SELECT COUNT(*) FROM access' + conditions, params, fetch=True)[0][0]
+
+    def watch(self, services=None, clients=None, interval=WATCH_INTERVAL, output=None, stop=None):
+        '''Writes an NDJSON event to output, stdout by default, for each row of the access table that is added,
+        removed or modified, until stop (a threading.Event) is set. One read-only connection is kept open, and
+        PRAGMA data_version polled every interval seconds, so nothing is read until the database changes. The rows
+        are kept in memory keyed by service, client and AppleEvents receiver, and the rows changed since the last poll
+        are found by last_modified, so a change is found without reading every row. The whole table is only read
+        and compared if rows were removed, or the database has no last_modified column.'''
+        output = output or sys.stdout
+        stop = stop or threading.Event()
+        columns = self.columns()
+        key_indexes = [columns.index(column) for column in self.KEY_COLUMNS if column in columns]
+        modified_index = columns.index('last_modified') if 'last_modified' in columns else None
+
+        def _key(row):
+            return tuple(row[index] for index in key_indexes)
+
+        def _event(event, row, previous=None):
+            value = {'event': event, 'time': int(time.time()), 'row': dict(zip(columns, row))}
+            if previous is not None:
+                value['previous'] = dict(zip(columns, previous))
+            return json.dumps(value, sort_keys=True)
+
+        self._connect()
+        version = self._data_version()
+        snapshot = dict((_key(row), row) for row in self.rows(services=services, clients=clients, columns=columns))
+        watermark = max([row[modified_index] for row in snapshot.values()] or [0]) if modified_index is not None else None
+
+        try:
+            while not stop.wait(interval):
+                current_version = self._data_version()
+                if current_version == version:
+                    continue
+                version = current_version
+
+                events = list()
+                if watermark is not None:
+                    # Rows changed in the same second as the last change are read again, but only reported if they differ
+                    for row in self.rows(services=services, clients=clients, columns=columns, since=watermark):
+                        key = _key(row)
+                        previous = snapshot.get(key)
+                        if row != previous:
+                            events.append(_event('modified' if previous else 'added', row, previous))
+                            snapshot[key] = row
+                        watermark = max(watermark, row[modified_index])
+
+                # Removed rows leave no trace to find them by, so compare every row once fewer are left than expected
+                if watermark is None or self.count(services=services, clients=clients) != len(snapshot):
+                    rows = dict((_key(row), row) for row in self.rows(services=services, clients=clients, columns=columns))
+                    for key, row in rows.items():
+                        previous = snapshot.get(key)
+                        if row != previous:
+                            events.append(_event('modified' if previous else 'added', row, previous))
+                    events.extend(_event('removed', row) for key, row in snapshot.items() if key not in rows)
+                    snapshot = rows
+
+                if events:
+                    output.write('\n'.join(events) + '\n')
+                    output.flush()
+        finally:
             self.sqlite.disconnect(self.tcc_db)
 
 
-def main():
-    if len(sys.argv) is 2:
+class TCCStore():
+    '''
+    A single SQLite store of the access tables of many TCC.db snapshots, for querying a fleet of Macs together.
+    Each snapshot is tagged with the host and user it came from and the time it was taken, and identified by the
+    sha256 of the file, so ingesting a file that is already in the store for that host and user does nothing.
+    Usage:
+        TCCStore(store_path).ingest(directory, pattern=None, jobs=4)
+            Loads every .db file under directory, reading the files in parallel.
+        TCCStore(store_path).query(services=['SystemPolicyAllFiles'], clients=['com.example.app'], allowed=True)
+            Yields matching rows of the latest snapshot of each host and user, as tuples of QUERY_COLUMNS.
+    '''
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, path TEXT NOT NULL, sha256 TEXT NOT NULL, host TEXT NOT NULL, '
+        'user TEXT, snapshot_time INTEGER NOT NULL, ingested INTEGER NOT NULL, rows INTEGER NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS access (snapshot_id INTEGER NOT NULL REFERENCES snapshots (id), service TEXT NOT NULL, client TEXT NOT NULL, '
+        'client_type INTEGER, allowed INTEGER, auth_value INTEGER, auth_reason INTEGER, prompt_count INTEGER, indirect_object_identifier TEXT, '
+        'last_modified INTEGER)',
+        'CREATE INDEX IF NOT EXISTS access_service_client ON access (service, client)',
+        'CREATE INDEX IF NOT EXISTS access_snapshot ON access (snapshot_id)',
+        'CREATE INDEX IF NOT EXISTS snapshots_host_user ON snapshots (host, user, snapshot_time)',
+    ]
+    ACCESS_COLUMNS = ['service', 'client', 'client_type', 'allowed', 'auth_value', 'auth_reason', 'prompt_count',
+                      'indirect_object_identifier', 'last_modified']
+    QUERY_COLUMNS = ['host', 'user', 'snapshot_time'] + ACCESS_COLUMNS
+    ALLOWED_AUTH_VALUES = (2, 3)  # auth_value of allowed and limited access, from macOS 11
+    TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H%M%S', '%Y%m%dT%H%M%S', '%Y-%m-%d', '%Y%m%d']  # UTC snapshot times in file paths
+    DEFAULT_JOBS = 4
+    COMMIT_EVERY = 100  # Snapshots inserted per transaction
+    READ_AHEAD = 2  # Files read per worker thread before their rows are written, so a slow store doesn't hold every file in memory
+
+    def __init__(self, store_path):
+        self.store = os.path.expanduser(os.path.expandvars(store_path))
+        self.sqlite = Sqlite_db()
+
+    def _connect(self):
+        self.sqlite.connect(self.store)
+        for statement in self.SCHEMA:
+            self.sqlite.query(statement)
+        self.sqlite.commit_change()
+
+    @staticmethod
+    def _sha256(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @classmethod
+    def _snapshot_time(cls, value):
+        if value.isdigit():
+            return int(value)
+        for time_format in cls.TIME_FORMATS:
+            try:
+                return calendar.timegm(time.strptime(value, time_format))
+            except ValueError:
+                pass
+        raise ValueError('Unrecognised snapshot time {}'.format(value))
+
+    @classmethod
+    def tags(cls, directory, path, pattern=None):
+        '''Returns the host, user and snapshot time of a TCC.db under directory.
+        With pattern, a regular expression with host, and optionally user and snapshot, named groups, they are matched
+        against the path relative to directory. Otherwise host is the first directory of the relative path (or the
+        file name, for files directly in directory), and user is the directory after "Users", or the second directory
+        unless it is "Library". Without a user, the snapshot is of the system TCC.db. The snapshot time is the
+        modification time of the file, unless the pattern has a snapshot group.'''
+        relative = os.path.relpath(path, directory).replace(os.sep, '/')
+        snapshot_time = int(os.path.getmtime(path))
+
+        if pattern:
+            match = re.search(pattern, relative)
+            if not match or not match.groupdict().get('host'):
+                raise ValueError('{} does not match the pattern {}'.format(relative, pattern))
+            groups = match.groupdict()
+            if groups.get('snapshot'):
+                snapshot_time = cls._snapshot_time(groups['snapshot'])
+            return groups['host'], groups.get('user'), snapshot_time
+
+        parts = relative.split('/')
+        host = parts[0] if len(parts) > 1 else os.path.splitext(parts[0])[0]
+        directories = parts[1:-1]
+        if 'Users' in directories[:-1]:
+            user = directories[directories.index('Users') + 1]
+        elif directories and directories[0] != 'Library':
+            user = directories[0]
+        else:
+            user = None
+
+        return host, user, snapshot_time
+
+    def _read_snapshot(self, directory, path, pattern, known):
+        '''Returns (path, (host, user, snapshot_time), sha256, rows, error) for a TCC.db under directory, with rows of
+        ACCESS_COLUMNS. rows is None if the host, user and sha256 are already known. Run in the worker threads, so
+        each file has its own connection.'''
         try:
-            tcc_db = os.path.expandvars(sys.argv[1])
-            tcc_db = os.path.expanduser(tcc_db)
+            tags = self.tags(directory, path, pattern=pattern)
+            digest = self._sha256(path)
+            if (tags[0], tags[1], digest) in known:
+                return path, tags, digest, None, None
 
-            if os.path.exists(tcc_db) and 'TCC.db' in tcc_db:
-                tcc = ReadTCC(tcc_db_path=tcc_db)
-                tcc.read_db()
-            else:
-                print('Please specify the TCC path to read. Either "/Library/Application Support/com.apple.TCC/TCC.db" or "~/Library/Application Support/com.apple.TCC/TCC.db"')
-                sys.exit(1)
-        except Exception:
-            raise
+            # Snapshots are copies nothing is writing to, so locking can be skipped, unless there's a WAL to read
+            reader = ReadTCC(path, immutable=not os.path.exists(path + '-wal'))
+            try:
+                columns = reader.columns()
+                if 'service' not in columns or 'client' not in columns:
+                    raise ValueError('{} has no access table'.format(path))
+                rows = list()
+                for row in reader.rows(columns=columns):
+                    values = dict(zip(columns, row))
+                    if 'allowed' not in values and values.get('auth_value') is not None:
+                        values['allowed'] = int(values['auth_value'] in self.ALLOWED_AUTH_VALUES)
+                    rows.append(tuple(values.get(column) for column in self.ACCESS_COLUMNS))
+            finally:
+                reader.sqlite.disconnect(path)
+
+            return path, tags, digest, rows, None
+        except Exception as e:
+            return path, None, None, None, e
+
+    def ingest(self, directory, pattern=None, jobs=DEFAULT_JOBS):
+        '''Loads every .db file under directory into the store, skipping files already in it for the same host and user.
+        Files are hashed and read by jobs worker threads, at most READ_AHEAD per thread at a time, and written to the
+        store as they are read.
+        Returns a dict of the number of snapshots 'ingested', 'skipped' and 'failed', the 'rows' added, and the
+        'errors' of the files that failed as (path, error) pairs.'''
+        directory = os.path.expanduser(os.path.expandvars(directory))
+        paths = list()
+        for root, directories, files in os.walk(directory):
+            directories.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.db'))
+
+        self._connect()
+        known = set(tuple(row) for row in self.sqlite.query('SELECT host, user, sha256 FROM snapshots', fetch=True))
+        result = {'ingested': 0, 'skipped': 0, 'failed': 0, 'rows': 0, 'errors': list()}
+
+        def _read(path):
+            return self._read_snapshot(directory, path, pattern, known)
+
+        from multiprocessing.pool import ThreadPool  # Only imported when needed, as it's slow to import
+
+        workers = max(1, min(jobs, len(paths) or 1))
+        pool = ThreadPool(workers)
+        chunk_size = workers * self.READ_AHEAD
+        try:
+            for start in range(0, len(paths), chunk_size):
+                for path, tags, digest, rows, error in pool.imap_unordered(_read, paths[start:start + chunk_size]):
+                    if error is not None:
+                        result['failed'] += 1
+                        result['errors'].append((path, error))
+                        continue
+                    host, user, snapshot_time = tags
+                    if rows is None or (host, user, digest) in known:
+                        result['skipped'] += 1
+                        continue
+
+                    self.sqlite.query('INSERT INTO snapshots (path, sha256, host, user, snapshot_time, ingested, rows) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                      (os.path.abspath(path), digest, host, user, snapshot_time, int(time.time()), len(rows)))
+                    snapshot_id = self.sqlite.c.lastrowid
+                    self.sqlite.connection.executemany('INSERT INTO access (snapshot_id, {}) VALUES (?, {})'.format(
+                        ', '.join(self.ACCESS_COLUMNS), ', '.join(['?'] * len(self.ACCESS_COLUMNS))), [(snapshot_id,) + row for row in rows])
+                    known.add((host, user, digest))
+                    result['ingested'] += 1
+                    result['rows'] += len(rows)
+                    if result['ingested'] % self.COMMIT_EVERY == 0:
+                        self.sqlite.commit_change()
+        finally:
+            pool.close()
+            pool.join()
+            self.sqlite.commit_change()
+            self.sqlite.disconnect(self.store)
+
+        return result
+
+    def query(self, services=None, clients=None, hosts=None, users=None, allowed=None, all_snapshots=False):
+        '''Yields tuples of QUERY_COLUMNS for the rows matching every filter given, from the latest snapshot of each
+        host and user, or from every snapshot if all_snapshots is True. allowed is True or False to only return
+        allowed or denied rows.'''
+        query = 'SELECT {} FROM access JOIN snapshots ON snapshots.id = access.snapshot_id'.format(
+            ', '.join('snapshots.' + column if column in ['host', 'user', 'snapshot_time'] else 'access.' + column for column in self.QUERY_COLUMNS))
+        conditions = list()
+        params = list()
+        for column, values in [('access.service', [ReadTCC.service_name(service) for service in services or []]), ('access.client', clients or []),
+                               ('snapshots.host', hosts or []), ('snapshots.user', users or [])]:
+            if values:
+                conditions.append('{} IN ({})'.format(column, ', '.join(['?'] * len(values))))
+                params.extend(values)
+        if allowed is not None:
+            conditions.append('access.allowed = ?')
+            params.append(int(allowed))
+        if not all_snapshots:
+            conditions.append('snapshots.id IN (SELECT MAX(s.id) FROM snapshots AS s WHERE s.snapshot_time = '
+                              '(SELECT MAX(t.snapshot_time) FROM snapshots AS t WHERE t.host = s.host AND t.user IS s.user) GROUP BY s.host, s.user)')
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY snapshots.host, snapshots.user, snapshots.snapshot_time, access.service, access.client'
+
+        self._connect()
+        try:
+            for row in self.sqlite.iterate(query, params):
+                yield row
+        finally:
+            self.sqlite.disconnect(self.store)
+
+
+def ingest_main(argv):
+    parser = argparse.ArgumentParser(prog='tccdbRead.py ingest',
+                                     description='Load a directory of TCC.db snapshots into one SQLite store, tagged by host, user and snapshot time. '
+                                                 'Files already in the store are skipped.')
+    parser.add_argument('directory', metavar='<directory>',
+                        help='Directory of TCC.db files, for example <host>/TCC.db for system databases and <host>/<user>/TCC.db for user databases.')
+    parser.add_argument('--store', required=True, metavar='<store.db>', help='The store to load the snapshots into. Created if it does not exist.')
+    parser.add_argument('--pattern', metavar='<regex>',
+                        help='Regular expression matched against the path of each file relative to the directory, with host, and optionally user '
+                             'and snapshot, named groups. For example: (?P<host>[^/]+)/(?P<snapshot>[0-9T]+)/(?P<user>[^/]+)/TCC.db')
+    parser.add_argument('-j', '--jobs', type=int, default=TCCStore.DEFAULT_JOBS, metavar='N',
+                        help='Number of files to read concurrently. Defaults to {}.'.format(TCCStore.DEFAULT_JOBS))
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error('{} is not a directory'.format(args.directory))
+
+    result = TCCStore(args.store).ingest(args.directory, pattern=args.pattern, jobs=args.jobs)
+    for path, error in result['errors']:
+        print('FAILED: {}: {}'.format(path, error), file=sys.stderr)
+    print('Ingested {} snapshots ({} rows), skipped {} already in the store, {} failed'.format(
+        result['ingested'], result['rows'], result['skipped'], result['failed']), file=sys.stderr)
+
+    return 1 if result['failed'] else 0
+
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(prog='tccdbRead.py query',
+                                     description='Query a store created with ingest. Only the latest snapshot of each host and user is used, unless --all-snapshots is given.')
+    parser.add_argument('--store', required=True, metavar='<store.db>', help='The store to query.')
+    parser.add_argument('--service', nargs='+', dest='services', metavar='<service>', help='Only rows for these services, for example: SystemPolicyAllFiles')
+    parser.add_argument('--client', nargs='+', dest='clients', metavar='<client>', help='Only rows for these bundle identifiers or paths.')
+    parser.add_argument('--host', nargs='+', dest='hosts', metavar='<host>', help='Only rows from these hosts.')
+    parser.add_argument('--user', nargs='+', dest='users', metavar='<user>', help='Only rows from the TCC.db of these users.')
+    allowed = parser.add_mutually_exclusive_group()
+    allowed.add_argument('--allowed', action='store_const', const=True, dest='allowed', help='Only rows that allow access.')
+    allowed.add_argument('--denied', action='store_const', const=False, dest='allowed', help='Only rows that deny access.')
+    parser.add_argument('--all-snapshots', action='store_true', default=False, dest='all_snapshots', help='Use every snapshot, not only the latest.')
+    parser.add_argument('--format', dest='output_format', choices=ReadTCC.FORMATS, default='table',
+                        help='Output a table of host, user, service, client and allowed (the default), or every column as JSON, NDJSON or CSV.')
+    parser.add_argument('-o', '--output', metavar='<file>', help='File to write to. Defaults to stdout.')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.expanduser(args.store)):
+        parser.error('{} does not exist'.format(args.store))
+
+    rows = TCCStore(args.store).query(services=args.services, clients=args.clients, hosts=args.hosts, users=args.users,
+                                      allowed=args.allowed, all_snapshots=args.all_snapshots)
+    columns = TCCStore.QUERY_COLUMNS
+    if args.output_format == 'table':
+        table_columns = ['host', 'user', 'service', 'client', 'allowed']
+        indexes = [columns.index(column) for column in table_columns]
+        rows = (tuple(row[index] for index in indexes) for row in rows)
+        columns = table_columns
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            write_rows(rows, columns, output_format=args.output_format, output=output)
     else:
+        write_rows(rows, columns, output_format=args.output_format)
+
+    return 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'ingest':
+        sys.exit(ingest_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'query':
+        sys.exit(query_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description='Read the access table of a TCC.db. The database is opened read-only.')
+    parser.add_argument('tcc_db', metavar='<TCC.db>',
+                        help='The TCC database to read. Either "/Library/Application Support/com.apple.TCC/TCC.db" or "~/Library/Application Support/com.apple.TCC/TCC.db", or a copy of one.')
+    parser.add_argument('--service', nargs='+', dest='services', metavar='<service>',
+                        help='Only read rows for these services, for example: Camera kTCCServiceMicrophone')
+    parser.add_argument('--client', nargs='+', dest='clients', metavar='<client>', help='Only read rows for these bundle identifiers or paths.')
+    parser.add_argument('--format', dest='output_format', choices=ReadTCC.FORMATS, default='table',
+                        help='Output a table of service and client (the default), or every column as JSON, NDJSON or CSV.')
+    parser.add_argument('-o', '--output', metavar='<file>', help='File to write to. Defaults to stdout.')
+    parser.add_argument('--immutable', action='store_true', default=False,
+                        help='Open the database without locking. Only use this for a copy of TCC.db that nothing is writing to.')
+    parser.add_argument('--watch', action='store_true', default=False,
+                        help='Keep watching the database, and write each row that is added, removed or modified as a line of JSON, until interrupted.')
+    parser.add_argument('--interval', type=float, default=ReadTCC.WATCH_INTERVAL, metavar='<seconds>',
+                        help='Seconds between checks for changes with --watch. Defaults to {}.'.format(ReadTCC.WATCH_INTERVAL))
+    args = parser.parse_args()
+
+    if args.watch and args.immutable:
+        parser.error('--watch cannot be used with --immutable, as changes to an immutable database are not seen')
+    if args.watch and args.output_format != 'table':
+        parser.error('--watch always writes NDJSON, so --format cannot be used with it')
+
+    tcc_db = os.path.expanduser(os.path.expandvars(args.tcc_db))
+    if not os.path.exists(tcc_db):
         print('Please specify the TCC path to read. Either "/Library/Application Support/com.apple.TCC/TCC.db" or "~/Library/Application Support/com.apple.TCC/TCC.db"')
         sys.exit(1)
 
+    tcc = ReadTCC(tcc_db_path=tcc_db, immutable=args.immutable)
+    try:
+        if args.watch:
+            output = open(args.output, 'a') if args.output else None
+            try:
+                tcc.watch(services=args.services, clients=args.clients, interval=args.interval, output=output)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if output:
+                    output.close()
+        elif args.output:
+            with open(args.output, 'w') as output:
+                tcc.read_db(services=args.services, clients=args.clients, output_format=args.output_format, output=output)
+        else:
+            tcc.read_db(services=args.services, clients=args.clients, output_format=args.output_format)
+    except TCCDatabaseException as e:
+        print(e)
+        sys.exit(1)
+
 
 if __name__ == '__main__':
     main()
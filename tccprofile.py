@@ -6,38 +6,27 @@
 from __future__ import absolute_import, print_function
 
 import argparse
+import binascii
+import contextlib
 import datetime
 import errno
+import functools
+import json
+import math
+import numbers
 import os
 import plistlib
 import re
+import sqlite3
+import stat
+import struct
+import threading
+import time
 import uuid
 import subprocess
 import sys
-import pytz
-
-# Tkinter
-try:
-    # Python 3
-    import tkinter as tk
-    from tkinter import ttk
-    from tkinter import filedialog as tkFileDialog
-except ImportError:
-    # Python 2
-    import Tkinter as tk
-    import ttk
-    import tkFileDialog
-
-# Imports specifically for FoundationPlist
-# PyLint cannot properly find names inside Cocoa libraries, so issues bogus
-# No name 'Foo' in module 'Bar' warnings. Disable them.
-# pylint: disable=E0611
-import AppKit
-from Foundation import NSData  # NOQA
-from Foundation import NSPropertyListSerialization  # NOQA
-from Foundation import NSPropertyListMutableContainers  # NOQA
-from Foundation import NSPropertyListXMLFormat_v1_0  # NOQA
-# pylint: enable=E0611
+
+from collections import OrderedDict
 
 # Script details
 __author__ = ['Carl Windus', 'Bryson Tyrrell']
@@ -65,401 +54,240 @@ class TCCProfileException(Exception):
     pass
 
 
-class App(tk.Frame):
-    def __init__(self, master):
-        tk.Frame.__init__(self, master)
-        self.pack()
-        self.master.title("TCC Profile Generator")
-        self.master.resizable(False, False)
-        self.master.tk_setPalette(background='#ececec')
-
-        self.master.protocol('WM_DELETE_WINDOW', self.click_quit)
-        self.master.bind('<Return>', self.click_save)
-
-        x = (self.master.winfo_screenwidth() - self.master.winfo_reqwidth()) // 2
-        y = (self.master.winfo_screenheight() - self.master.winfo_reqheight()) // 4
-        self.master.geometry("+{}+{}".format(x, y))
-
-        self.master.config(menu=tk.Menu(self.master))
-
-        # Payload Details UI
-
-        payload_frame = tk.Frame(self)
-        payload_frame.pack(padx=15, pady=15, fill=tk.BOTH)
-
-        tk.Label(
-            payload_frame,
-            text='Payload Details',
-            font=('System', 18)
-        ).grid(row=0, column=0, columnspan=5, sticky='w')
-
-        tk.Label(payload_frame, text="Name").grid(
-            row=1, column=0, sticky='w'
-        )
-        self._payload_name = tk.Entry(payload_frame, bg='white', width=30)
-        self._payload_name.insert(0, 'TCC Whitelist')
-        self._payload_name.grid(row=2, column=0, columnspan=2, sticky='we')
-
-        # This is an empty spacer for the grid layout of the frame
-        tk.Label(
-            payload_frame,
-            text='',
-            width=6
-        ).grid(row=1, column=2)
-
-        tk.Label(payload_frame, text="Organization").grid(
-            row=1, column=3, sticky='w'
-        )
-        self._payload_org = tk.Entry(payload_frame, bg='white', width=30)
-        self._payload_org.insert(0, 'My Org Name')
-        self._payload_org.grid(row=2, column=3, columnspan=2, sticky='we')
-
-        tk.Label(payload_frame, text="Identifier").grid(
-            row=3, column=0, sticky='w'
-        )
-        self._payload_id = tk.Entry(payload_frame, bg='white')
-        self._payload_id.insert(0, 'com.my.tccprofile')
-        self._payload_id.grid(row=4, column=0, columnspan=2, sticky='we')
-
-        tk.Label(payload_frame, text="Description").grid(
-            row=5, column=0, sticky='w'
-        )
-        self._payload_desc = tk.Entry(payload_frame, bg='white')
-        self._payload_desc.insert(0, 'TCC Whitelist for various applications')
-        self._payload_desc.grid(row=6, column=0, columnspan=5, sticky='we')
-
-        self._payload_sign = tk.StringVar()
-        self._payload_sign.set('No')
-
-        tk.Label(payload_frame, text="Sign Profile?").grid(
-            row=7, column=0, sticky='e'
-        )
-        tk.OptionMenu(
-            payload_frame,
-            self._payload_sign,
-            *self._list_signing_certs()
-        ).grid(row=7, column=1, columnspan=4, sticky='we')
-
-        # UI Feedback Section
-
-        feedback_frame = tk.Frame(self)
-        feedback_frame.pack(padx=15, fill=tk.BOTH)
-
-        self._feedback_label = tk.Label(
-            feedback_frame,
-            font=("System", 12, "italic"),
-            fg='red'
-        )
-        self._feedback_label.grid(row=0, column=0, sticky='we')
-
-        # Services UI
-
-        services_frame = tk.Frame(self)
-        services_frame.pack(padx=15, pady=15, fill=tk.BOTH)
-
-        self._services_target_var = tk.StringVar()
-        self._services_target_var_display = tk.StringVar()
-
-        tk.Label(
-            services_frame,
-            text='Setup Service Permissions',
-            font=('System', 18)
-        ).grid(row=0, column=0, columnspan=5, sticky='w')
-
-        tk.Label(services_frame, text="Target App...").grid(
-            row=1, column=0, sticky='w'
-        )
-        self.app_env_source_btn = tk.Button(
-            services_frame,
-            text='Choose...',
-            command=lambda: self._app_picker('_services_target_var')
-        )
-        self.app_env_source_btn.grid(row=2, column=0, sticky='w')
-
-        tk.Label(
-            services_frame,
-            textvariable=self._services_target_var_display,
-            width=20
-        ).grid(row=2, column=1, sticky='w')
-
-        self._available_services = {
-            'AddressBook': True,
-            'Calendar': True,
-            'Reminders': True,
-            'Photos': True,
-            'Camera': False,
-            'Microphone': False,
-            'Accessibility': True,
-            'PostEvent': True,
-            'SystemPolicyAllFiles': True,
-            'SystemPolicySysAdminFiles': True
-        }
+class Tracer(object):
+    """Records how long each phase of a build, and each subprocess, takes. Does nothing until enabled.
+    The spans can be written in Chrome trace event format (for chrome://tracing or Perfetto), or summarised per operation."""
+    def __init__(self):
+        self.enabled = False
+        self._events = list()
+        self._thread_ids = dict()
+        self._lock = threading.Lock()
+        self._start = time.time()
 
-        self._selected_service = tk.StringVar()
-        self._selected_service.set('AddressBook')
-
-        tk.Label(services_frame, text="Service...").grid(
-            row=1, column=2, sticky='w'
-        )
-        tk.OptionMenu(
-            services_frame,
-            self._selected_service,
-            *sorted([i for i in self._available_services.keys()])
-        ).grid(row=2, column=2, sticky='w')
-
-        # This is an empty spacer for the grid layout of the frame
-        tk.Label(
-            services_frame,
-            text='',
-            width=14
-        ).grid(row=2, column=3)
-
-        tk.Button(
-            services_frame,
-            text='Add +',
-            command=self._add_service
-        ).grid(row=2, column=4, sticky='e')
-
-        self.services_table = ttk.Treeview(
-            services_frame,
-            columns=('target', 'service', 'allow_deny'),
-            height=5
-        )
-        self.services_table['show'] = 'headings'
-
-        self.services_table.heading('target', text='Target')
-
-        self.services_table.heading('service', text='Service')
-        self.services_table.column('service', anchor='center')
-
-        self.services_table.heading('allow_deny', text='Allow/Deny')
-        self.services_table.column('allow_deny', anchor='center')
-
-        self.services_table.grid(row=3, column=0, columnspan=5, sticky='we')
-
-        tk.Button(
-            services_frame,
-            text='Remove -',
-            command=lambda: self._remove_table_item('services_table')
-        ).grid(row=4, column=4, sticky='e')
-
-        # Apple Events UI
-
-        apple_events_frame = tk.Frame(self)
-        apple_events_frame.pack(padx=15, pady=15, fill=tk.BOTH)
-
-        self._app_env_source_var = tk.StringVar()
-        self._app_env_target_var = tk.StringVar()
-        self._app_env_source_var_display = tk.StringVar()
-        self._app_env_target_var_display = tk.StringVar()
-
-        tk.Label(
-            apple_events_frame,
-            text='Setup Apple Events',
-            font=('System', 18)
-        ).grid(row=0, column=0, columnspan=5, sticky='w')
-
-        tk.Label(apple_events_frame, text="Source App...").grid(
-            row=1, column=0, sticky='w'
-        )
-
-        self.app_env_source_btn = tk.Button(
-            apple_events_frame,
-            text='Choose...',
-            command=lambda: self._app_picker('_app_env_source_var')
-        )
-        self.app_env_source_btn.grid(row=2, column=0, sticky='w')
-
-        tk.Label(
-            apple_events_frame,
-            textvariable=self._app_env_source_var_display,
-            width=20
-        ).grid(row=2, column=1, sticky='w')
-
-        tk.Label(apple_events_frame, text="Target App...").grid(
-            row=1, column=2, sticky='w'
-        )
-
-        self.app_env_target_btn = tk.Button(
-            apple_events_frame,
-            text='Choose...',
-            command=lambda: self._app_picker('_app_env_target_var')
-        )
-        self.app_env_target_btn.grid(row=2, column=2, sticky='w')
-
-        tk.Label(
-            apple_events_frame,
-            textvariable=self._app_env_target_var_display,
-            width=20
-        ).grid(row=2, column=3, sticky='w')
-
-        tk.Button(
-            apple_events_frame,
-            text='Add +',
-            command=self._add_apple_event
-        ).grid(row=2, column=4, sticky='e')
-
-        self.app_env_table = ttk.Treeview(
-            apple_events_frame, columns=('source', 'target'), height=5
-        )
-        self.app_env_table['show'] = 'headings'
-        self.app_env_table.heading('source', text='Source')
-        self.app_env_table.heading('target', text='Target')
-        self.app_env_table.grid(row=3, column=0, columnspan=5, sticky='we')
-
-        tk.Button(
-            apple_events_frame,
-            text='Remove -',
-            command=lambda: self._remove_table_item('app_env_table')
-        ).grid(row=4, column=4, sticky='e')
-
-        # Bottom frame for "Save' and 'Quit' buttons
-        button_frame = tk.Frame(self)
-        button_frame.pack(padx=15, pady=(0, 15), anchor='e')
-
-        tk.Button(button_frame, text='Save', command=self.click_save).pack(
-            side='right'
-        )
-        tk.Button(button_frame, text='Quit', command=self.click_quit).pack(
-            side='right'
-        )
-
-    def click_save(self, event=None):
-        print("The user clicked 'Save'")
-
-        payload = dict()
-        payload['Description'] = self._payload_desc.get()
-        payload['Name'] = self._payload_name.get()
-        payload['Identifier'] = self._payload_id.get()
-        payload['Organization'] = self._payload_org.get()
-
-        for k, v in payload.items():
-            if not v:
-                self._feedback_label['text'] = \
-                    "Missing input for '{}'".format(k)
-                return
+    def enable(self):
+        self.enabled = True
+        self._start = time.time()
 
-        app_lists = dict()
+    def add(self, name, category, start, duration, args=None):
+        """Records a span that started at start (from time.time()) and took duration seconds."""
+        if not self.enabled:
+            return
 
-        for child in self.services_table.get_children():
-            values = self.services_table.item(child)["values"]
-            if not app_lists.get(values[1]):
-                app_lists[values[1]] = {'_apps': list(), 'apps': list()}
+        with self._lock:
+            # Chrome shows each thread id as a row, so number the threads from 1 rather than using their identities
+            thread_id = self._thread_ids.setdefault(threading.current_thread().ident, len(self._thread_ids) + 1)
+            self._events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int((start - self._start) * 1000000),
+                'dur': int(duration * 1000000),
+                'pid': os.getpid(),
+                'tid': thread_id,
+                'args': args or dict(),
+            })
+
+    @contextlib.contextmanager
+    def span(self, name, category='phase', args=None):
+        """Records the time taken by the body of a with statement."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.time() - start, args)
 
-            # app_lists[values[1]].append(values[0])
-            app_lists[values[1]]['_apps'].append(values[0])
+    def write_trace(self, filepath):
+        """Writes the spans to filepath in Chrome trace event format."""
+        with self._lock:
+            events = list(self._events)
+            events.extend({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id,
+                           'args': {'name': 'main' if thread_id == 1 else 'worker {}'.format(thread_id - 1)}}
+                          for thread_id in self._thread_ids.values())
 
-        for child in self.app_env_table.get_children():
-            if not app_lists.get('AppleEvents'):
-                app_lists['AppleEvents'] = {'_apps': list(), 'apps': list()}
+        with open(filepath, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
 
-            app_lists['AppleEvents']['_apps'].append(
-                ','.join(self.app_env_table.item(child)["values"])
-            )
+    def timings(self):
+        """Returns a table of the number of spans, and their total, p50 and p95 times, for each operation."""
+        durations = OrderedDict()
+        with self._lock:
+            for event in sorted(self._events, key=lambda event: event['ts']):
+                durations.setdefault(event['name'], list()).append(event['dur'] / 1000.0)
 
-        if not any(app_lists.keys()):
-            self._feedback_label['text'] = 'You must provide at least one ' \
-                                           'payload type to create a profile!'
-            return
+        lines = ['{:<40} {:>7} {:>12} {:>10} {:>10}'.format('Operation', 'Count', 'Total (ms)', 'p50 (ms)', 'p95 (ms)')]
+        for name, values in durations.items():
+            values.sort()
+            lines.append('{:<40} {:>7} {:>12.1f} {:>10.1f} {:>10.1f}'.format(name, len(values), sum(values), percentile(values, 50), percentile(values, 95)))
 
-        sign = self._payload_sign.get()
-
-        desktop_path = os.path.expanduser('~/Desktop')
-        filename = tkFileDialog.asksaveasfilename(
-            parent=self,
-            defaultextension='.mobileconfig',
-            initialdir=desktop_path,
-            initialfile='tccprofile.mobileconfig',
-            title='Save TCC Profile...'
-        )
-
-        tcc_profile = PrivacyProfiles(
-            payload_description=payload['Description'],
-            payload_name=payload['Name'],
-            payload_identifier=payload['Identifier'],
-            payload_organization=payload['Organization'],
-            profile_removal_password=None,
-            sign_cert=None if sign == 'No' else sign,
-            filename=filename,
-            removal_date=None,
-            timezone=None,
-        )
-
-        tcc_profile.set_services_dict(app_lists)
-        tcc_profile.build_profile(allow=True)
-        tcc_profile.write()
-
-        self._feedback_label['text'] = ''
-
-    def click_quit(self, event=None):
-        print("The user clicked 'Quit'")
-        self.master.destroy()
+        return '\n'.join(lines)
 
-    @staticmethod
-    def _list_signing_certs():
-        output = str(subprocess.check_output(
-            ['/usr/bin/security', 'find-identity', '-p', 'codesigning', '-v']
-        )).split('\n')
-
-        cert_list = ['No']
-        for i in output:
-            r = re.findall(r'"(.*?)"', i)
-            if r:
-                cert_list.extend(r)
-
-        return cert_list
-
-    def _app_picker(self, var_name):
-        app_name = tkFileDialog.askopenfilename(
-            parent=self,
-            # filetypes=[('App', '.app')],
-            initialdir='/Applications',
-            title='Select App'
-        )
-        getattr(self, var_name).set(app_name)
-        getattr(self, var_name + '_display').set(os.path.basename(app_name))
-
-    def _add_apple_event(self):
-        source_app = self._app_env_source_var.get()
-        target_app = self._app_env_target_var.get()
-
-        if not all([source_app, target_app]):
-            print('Source and Target not both provided')
-            return
 
-        self.app_env_table.insert('', 'end', values=(source_app, target_app))
-        self._app_env_target_var.set('')
-        self._app_env_source_var.set('')
-        self._app_env_source_var_display.set('')
-        self._app_env_target_var_display.set('')
+TRACER = Tracer()  # Enabled by --trace and --timings
 
-    def _add_service(self):
-        target_app = self._services_target_var.get()
-        selected_service = self._selected_service.get()
-        allow_deny = 'Allow' if \
-            self._available_services.get(selected_service) else 'Deny'
 
-        if not target_app:
-            print('Target app not provided')
-            return
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of a sorted list of values."""
+    return values[max(0, int(math.ceil(len(values) * percent / 100.0)) - 1)]
 
-        self.services_table.insert(
-            '', 'end',
-            values=(target_app, selected_service, allow_deny)
-        )
-        self._services_target_var.set('')
-        self._services_target_var_display.set('')
 
-    def _remove_table_item(self, table):
-        treeview_obj = getattr(self, table)
-        selected_items = treeview_obj.selection()
+def traced(name=None, category='phase'):
+    """Decorator that records a span for each call of a function while TRACER is enabled. Defaults to the function name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return function(*args, **kwargs)
+            with TRACER.span(name or function.__name__, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
 
-        for item in selected_items:
-            treeview_obj.delete(item)
 
+def run_command(cmd, capture=True, universal_newlines=False):
+    """Runs cmd and returns (returncode, stdout, stderr), recording a subprocess span with its argv and exit code.
+    If capture is False, the output of the command is not captured, and stdout and stderr are None."""
+    start = time.time()
+    pipe = subprocess.PIPE if capture else None
+    process = subprocess.Popen(cmd, stdout=pipe, stderr=pipe, universal_newlines=universal_newlines)
+    stdout, stderr = process.communicate()
+    TRACER.add('subprocess: {}'.format(os.path.basename(cmd[0])), 'subprocess', start, time.time() - start,
+               {'argv': cmd, 'exit_code': process.returncode})
+
+    return process.returncode, stdout, stderr
+
+
+class BuildCancelledException(TCCProfileException):
+    """Raised when a profile build is cancelled"""
+    pass
+
+
+class CodesignDeferredException(Exception):
+    """Raised while inspecting apps when a path needs codesign, so it can be resolved in a batch with other paths"""
+    def __init__(self, path):
+        super(CodesignDeferredException, self).__init__('{} needs codesign'.format(path))
+        self.path = path
+
+
+class BinaryPlistReader(object):
+    """Reads a binary plist (bplist00) from a file object, seeking directly to the objects needed.
+    read_keys() only decodes the requested top level keys, rather than the whole object graph."""
+    HEADER = b'bplist00'
+    TRAILER_LENGTH = 32
+    EPOCH = datetime.datetime(2001, 1, 1)  # Binary plist dates are seconds since this date
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._file.seek(0)
+        if self._file.read(len(self.HEADER)) != self.HEADER:
+            raise NSPropertyListSerializationException('Not a binary plist')
+
+        self._file.seek(-self.TRAILER_LENGTH, os.SEEK_END)
+        (self._offset_size, self._ref_size, self._num_objects,
+         self._top_object, self._offset_table) = struct.unpack('>6xBBQQQ', self._file.read(self.TRAILER_LENGTH))
+
+    def _read(self, length):
+        data = self._file.read(length)
+        if len(data) != length:
+            raise NSPropertyListSerializationException('Truncated binary plist')
+        return data
+
+    def _read_uint(self, size):
+        value = 0
+        for byte in bytearray(self._read(size)):
+            value = (value << 8) | byte
+        return value
+
+    def _seek_object(self, ref):
+        """Seeks to the object ref, and returns (type, info) from its marker byte."""
+        if ref >= self._num_objects:
+            raise NSPropertyListSerializationException('Invalid object reference {} in binary plist'.format(ref))
+        self._file.seek(self._offset_table + ref * self._offset_size)
+        self._file.seek(self._read_uint(self._offset_size))
+        marker = bytearray(self._read(1))[0]
+        return marker >> 4, marker & 0xf
+
+    def _read_length(self, info):
+        """Returns the object length, which follows the marker as an int object when it doesn't fit in the marker."""
+        if info != 0xf:
+            return info
+        marker = bytearray(self._read(1))[0]
+        if marker >> 4 != 0x1:
+            raise NSPropertyListSerializationException('Invalid object length in binary plist')
+        return self._read_uint(1 << (marker & 0xf))
+
+    def _read_refs(self, count):
+        return [self._read_uint(self._ref_size) for _ in range(count)]
+
+    def _read_string(self, ref):
+        """Returns the string object ref, or None if ref is not a string."""
+        object_type, info = self._seek_object(ref)
+        if object_type == 0x5:
+            return self._read(self._read_length(info)).decode('ascii')
+        elif object_type == 0x6:
+            return self._read(self._read_length(info) * 2).decode('utf-16be')
+
+    def read_object(self, ref=None):
+        """Returns the fully decoded object ref, or the top object if ref is None."""
+        ref = self._top_object if ref is None else ref
+        object_type, info = self._seek_object(ref)
+
+        if object_type == 0x0:
+            return {0x0: None, 0x8: False, 0x9: True}.get(info)
+        elif object_type == 0x1:
+            size = 1 << info
+            value = self._read_uint(size)
+            if size == 8 and value >= 1 << 63:  # 8 byte integers are signed
+                value -= 1 << 64
+            return value
+        elif object_type == 0x2:
+            return struct.unpack('>f' if info == 2 else '>d', self._read(1 << info))[0]
+        elif object_type == 0x3:
+            return self.EPOCH + datetime.timedelta(seconds=struct.unpack('>d', self._read(8))[0])
+        elif object_type == 0x4:
+            data = self._read(self._read_length(info))
+            return plistlib.Data(data) if hasattr(plistlib, 'Data') else data
+        elif object_type in (0x5, 0x6):
+            return self._read_string(ref)
+        elif object_type == 0x8:
+            return self._read_uint(info + 1)
+        elif object_type in (0xa, 0xc):
+            return [self.read_object(item) for item in self._read_refs(self._read_length(info))]
+        elif object_type == 0xd:
+            count = self._read_length(info)
+            refs = self._read_refs(count * 2)
+            return dict((self._read_string(key), self.read_object(value)) for key, value in zip(refs[:count], refs[count:]))
+        else:
+            raise NSPropertyListSerializationException('Unknown object type 0x{:x} in binary plist'.format(object_type))
+
+    def read_keys(self, keys):
+        """Returns a dict of the requested keys that are found in the top level dictionary."""
+        object_type, info = self._seek_object(self._top_object)
+        if object_type != 0xd:
+            raise NSPropertyListSerializationException('Top level object of binary plist is not a dictionary')
+
+        count = self._read_length(info)
+        refs = self._read_refs(count * 2)
+        result = dict()
+        for key_ref, value_ref in zip(refs[:count], refs[count:]):
+            key = self._read_string(key_ref)
+            if key in keys:
+                result[key] = self.read_object(value_ref)
+                if len(result) == len(keys):
+                    break
+
+        return result
+
+
+def _read_plist_foundation(filepath):
+    """Read a .plist file from filepath using Foundation, for formats such as old style ASCII plists that are not read natively."""
+    # PyLint cannot properly find names inside Cocoa libraries, so issues bogus
+    # No name 'Foo' in module 'Bar' warnings. Disable them.
+    # pylint: disable=E0611
+    from Foundation import NSData  # NOQA
+    from Foundation import NSPropertyListSerialization  # NOQA
+    from Foundation import NSPropertyListMutableContainers  # NOQA
+    # pylint: enable=E0611
 
-def read_plist(filepath):
-    """Read a .plist file from filepath. Return the unpacked root object (which is usually a dictionary)."""
     plistData = NSData.dataWithContentsOfFile_(filepath)
     dataObject, dummy_plistFormat, error = (
         NSPropertyListSerialization.
@@ -475,13 +303,643 @@ def read_plist(filepath):
         return dataObject
 
 
+@traced()
+def read_plist(filepath):
+    """Read a .plist file from filepath. Return the unpacked root object (which is usually a dictionary).
+    XML and binary plists are read natively, and Foundation is only used for any other format."""
+    with open(filepath, 'rb') as f:
+        header = f.read(64)
+
+        if header.startswith(BinaryPlistReader.HEADER):
+            return BinaryPlistReader(f).read_object()
+        elif header.lstrip(b'\xef\xbb\xbf \t\r\n').startswith((b'<?xml', b'<!DOCTYPE', b'<plist')):
+            f.seek(0)
+            return plistlib.load(f) if hasattr(plistlib, 'load') else plistlib.readPlist(f)
+
+    return _read_plist_foundation(filepath)
+
+
+@traced()
+def read_plist_keys(filepath, keys):
+    """Returns a dict of the requested top level keys from the .plist file at filepath.
+    For binary plists, only the requested keys are decoded."""
+    with open(filepath, 'rb') as f:
+        if f.read(len(BinaryPlistReader.HEADER)) == BinaryPlistReader.HEADER:
+            return BinaryPlistReader(f).read_keys(keys)
+
+    return dict((key, value) for key, value in read_plist(filepath).items() if key in keys)
+
+
+class PlistStreamWriter(object):
+    """Writes an XML plist to a file object as it is serialised, rather than building the whole document in memory.
+    The output is identical to plistlib.writePlist. Any iterable that isn't a list, tuple, dict or string (such as a
+    generator) is written as an array, with each item written as soon as it is produced."""
+    HEADER = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+              b'<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n')
+    INDENT = b'\t'
+    CONTROL_CHARACTERS = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+    # Python 3's plistlib writes empty arrays and dicts as <array/> and <dict/>, Python 2's doesn't
+    SELF_CLOSING_EMPTY = not hasattr(plistlib, 'writePlistToString')
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._indent_level = 0
+
+    def write(self, value):
+        """Writes value as a complete plist document."""
+        self._file.write(self.HEADER)
+        self._writeln('<plist version="1.0">')
+        self._write_value(value)
+        self._writeln('</plist>')
+
+    def _writeln(self, line):
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        self._file.write(self.INDENT * self._indent_level + line + b'\n')
+
+    def _begin_element(self, element):
+        self._writeln('<{}>'.format(element))
+        self._indent_level += 1
+
+    def _end_element(self, element):
+        self._indent_level -= 1
+        self._writeln('</{}>'.format(element))
+
+    def _simple_element(self, element, value):
+        if self.CONTROL_CHARACTERS.search(value if not isinstance(value, bytes) else value.decode('utf-8')):
+            raise ValueError('strings can\'t contains control characters; use plistlib.Data instead')
+        value = value.replace('\r\n', '\n').replace('\r', '\n').replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+        self._writeln(b'<' + element.encode('utf-8') + b'>' + value + b'</' + element.encode('utf-8') + b'>')
+
+    def _write_data(self, data):
+        self._begin_element('data')
+        self._indent_level -= 1
+        # Same line lengths as plistlib, which wraps the base64 to fit within 76 columns of the current indent
+        max_line_length = max(16, 76 - len(b' ' * 8 * self._indent_level))
+        max_bin_size = (max_line_length // 4) * 3
+        for start in range(0, len(data), max_bin_size):
+            for line in binascii.b2a_base64(data[start:start + max_bin_size]).splitlines():
+                if line:
+                    self._writeln(line)
+        self._indent_level += 1
+        self._end_element('data')
+
+    def _write_value(self, value):
+        if isinstance(value, (str, type(u''))):
+            self._simple_element('string', value)
+        elif isinstance(value, bool):
+            self._writeln('<true/>' if value else '<false/>')
+        elif isinstance(value, numbers.Integral):
+            self._simple_element('integer', '%d' % value)
+        elif isinstance(value, float):
+            self._simple_element('real', repr(value))
+        elif isinstance(value, dict):
+            if not value and self.SELF_CLOSING_EMPTY:
+                self._writeln('<dict/>')
+                return
+            self._begin_element('dict')
+            for key in sorted(value):
+                if not isinstance(key, (str, type(u''))):
+                    raise TypeError('keys must be strings')
+                self._simple_element('key', key)
+                self._write_value(value[key])
+            self._end_element('dict')
+        elif isinstance(value, datetime.datetime):
+            self._simple_element('date', '%04d-%02d-%02dT%02d:%02d:%02dZ' % (value.year, value.month, value.day, value.hour, value.minute, value.second))
+        elif isinstance(value, bytes):
+            self._write_data(value)
+        elif hasattr(plistlib, 'Data') and isinstance(value, plistlib.Data):
+            self._write_data(value.data)
+        elif hasattr(value, '__iter__'):
+            items = iter(value)
+            try:
+                item = next(items)
+            except StopIteration:
+                self._writeln('<array/>' if self.SELF_CLOSING_EMPTY else '<array>\n' + self.INDENT * self._indent_level + '</array>')
+                return
+            self._begin_element('array')
+            self._write_value(item)
+            for item in items:
+                self._write_value(item)
+            self._end_element('array')
+        else:
+            raise TypeError('unsupported type: {}'.format(type(value)))
+
+
+class CodeSignatureException(Exception):
+    """Read/parse error for Mach-O code signatures"""
+    pass
+
+
+class RequirementDecoder(object):
+    """Decodes a compiled code requirement blob into the same text that `codesign -dr -` prints.
+    Based on the requirement language dumper in Apple's Security framework (reqdumper.cpp)."""
+    REQUIREMENT_MAGIC = 0xfade0c00
+    EXPRESSION_KIND = 1
+
+    # Expression opcodes
+    OP_FALSE, OP_TRUE, OP_IDENT, OP_APPLE_ANCHOR, OP_ANCHOR_HASH, OP_INFO_KEY_VALUE, OP_AND, OP_OR, OP_CD_HASH, OP_NOT, \
+        OP_INFO_KEY_FIELD, OP_CERT_FIELD, OP_TRUSTED_CERT, OP_TRUSTED_CERTS, OP_CERT_GENERIC, OP_APPLE_GENERIC_ANCHOR, \
+        OP_ENTITLEMENT_FIELD, OP_CERT_POLICY, OP_NAMED_ANCHOR, OP_NAMED_CODE, OP_PLATFORM, OP_NOTARIZED, OP_CERT_FIELD_DATE, \
+        OP_LEGACY_DEV_ID = range(24)
+    OP_FLAG_MASK = 0xff000000
+
+    # Match operations, mapped to the text printed before and after the value. None means there is no value.
+    MATCHES = {
+        0: (' /* exists */', None),
+        1: (' = ', ''),
+        2: (' ~ ', ''),
+        3: (' = ', '*'),
+        4: (' = *', ''),
+        5: (' < ', ''),
+        6: (' > ', ''),
+        7: (' <= ', ''),
+        8: (' >= ', ''),
+        14: (' absent ', None),
+    }
+
+    # Syntax levels used to decide when 'and'/'or' expressions need parentheses
+    LEVEL_PRIMARY, LEVEL_AND, LEVEL_OR, LEVEL_TOP = range(4)
+
+    # Words of the requirement language, which are quoted rather than printed as bare words (RequirementKeywords.h)
+    KEYWORDS = frozenset(['', 'absent', 'always', 'and', 'anchor', 'apple', 'cdhash', 'cert', 'certificate', 'designated',
+                          'entitlement', 'exists', 'false', 'generic', 'guest', 'host', 'identifier', 'info', 'leaf',
+                          'legacy', 'library', 'never', 'notarized', 'or', 'platform', 'plugin', 'root', 'trusted', 'true'])
+
+    def __init__(self, blob):
+        self._blob = blob
+        self._position = 0
+
+    def decode(self):
+        """Returns the requirement text for the blob."""
+        magic, length, kind = struct.unpack_from('>III', self._blob, 0)
+
+        if magic != self.REQUIREMENT_MAGIC or kind != self.EXPRESSION_KIND:
+            raise CodeSignatureException('Unsupported requirement blob (magic 0x{:08x}, kind {})'.format(magic, kind))
+
+        self._blob = self._blob[:length]
+        self._position = 12
+        return ''.join(self._expression(self.LEVEL_TOP))
+
+    def _int(self):
+        try:
+            value, = struct.unpack_from('>i', self._blob, self._position)
+        except struct.error:
+            raise CodeSignatureException('Truncated requirement blob')
+        self._position += 4
+        return value
+
+    def _data(self):
+        length = self._int()
+        if length < 0 or self._position + length > len(self._blob):
+            raise CodeSignatureException('Truncated requirement blob')
+        data = bytearray(self._blob[self._position:self._position + length])
+        self._position += (length + 3) & ~3  # Data is padded to a 4 byte boundary
+        return data
+
+    def _string(self, quote=False, dot_ok=False):
+        """Returns data as a bare word if it's alphanumeric, otherwise as a quoted string, or hex if it isn't printable.
+        Words that start with a digit, such as most Team IDs, and keywords are quoted, the same as codesign."""
+        data = self._data()
+        mode = 'quoted' if quote else 'simple'
+
+        for c in data:
+            if c < 128 and (chr(c).isalnum() or (dot_ok and c == ord('.'))):
+                continue
+            elif c >= 32 and c != 127:
+                mode = 'quoted'
+            else:
+                mode = 'hex'
+                break
+
+        if mode == 'hex':
+            return '0x' + ''.join('{:02x}'.format(c) for c in data)
+
+        text = bytes(data).decode('utf-8', 'replace')
+        if mode == 'simple' and not (text in self.KEYWORDS or text[0].isdigit()):
+            return text
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    def _hash(self):
+        return 'H"{}"'.format(''.join('{:02x}'.format(c) for c in self._data()))
+
+    def _oid(self):
+        """Returns a DER encoded OID as dotted decimal text."""
+        data = self._data()
+        if not data:
+            raise CodeSignatureException('Empty OID in requirement blob')
+
+        components = [str(data[0] // 40), str(data[0] % 40)]
+        value = 0
+        for c in data[1:]:
+            value = (value << 7) | (c & 0x7f)
+            if not c & 0x80:
+                components.append(str(value))
+                value = 0
+        return '.'.join(components)
+
+    def _cert_slot(self):
+        slot = self._int()
+        if slot == -1:
+            return ' root'
+        elif slot == 0:
+            return ' leaf'
+        else:
+            return ' {}'.format(slot)
+
+    def _match(self):
+        operation = self._int()
+        if operation not in self.MATCHES:
+            raise CodeSignatureException('Unsupported match operation {} in requirement blob'.format(operation))
+
+        prefix, suffix = self.MATCHES[operation]
+        if suffix is None:
+            return [prefix]
+        return [prefix, self._string(), suffix]
+
+    def _expression(self, level):
+        op = self._int() & ~self.OP_FLAG_MASK
+
+        if op in (self.OP_AND, self.OP_OR):
+            op_level, keyword = (self.LEVEL_AND, ' and ') if op == self.OP_AND else (self.LEVEL_OR, ' or ')
+            result = self._expression(op_level) + [keyword] + self._expression(op_level)
+            return ['('] + result + [')'] if level < op_level else result
+        elif op == self.OP_FALSE:
+            return ['never']
+        elif op == self.OP_TRUE:
+            return ['always']
+        elif op == self.OP_IDENT:
+            return ['identifier ', self._string(quote=True)]
+        elif op == self.OP_APPLE_ANCHOR:
+            return ['anchor apple']
+        elif op == self.OP_APPLE_GENERIC_ANCHOR:
+            return ['anchor apple generic']
+        elif op == self.OP_TRUSTED_CERTS:
+            return ['anchor trusted']
+        elif op == self.OP_ANCHOR_HASH:
+            return ['certificate', self._cert_slot(), ' = ', self._hash()]
+        elif op == self.OP_TRUSTED_CERT:
+            return ['certificate', self._cert_slot(), ' trusted']
+        elif op == self.OP_CERT_FIELD:
+            return ['certificate', self._cert_slot(), '[', self._string(dot_ok=True), ']'] + self._match()
+        elif op == self.OP_CERT_GENERIC:
+            return ['certificate', self._cert_slot(), '[field.', self._oid(), ']'] + self._match()
+        elif op == self.OP_CERT_POLICY:
+            return ['certificate', self._cert_slot(), '[policy.', self._oid(), ']'] + self._match()
+        elif op == self.OP_INFO_KEY_VALUE:
+            return ['info[', self._string(dot_ok=True), '] = ', self._string()]
+        elif op == self.OP_INFO_KEY_FIELD:
+            return ['info[', self._string(dot_ok=True), ']'] + self._match()
+        elif op == self.OP_ENTITLEMENT_FIELD:
+            return ['entitlement[', self._string(quote=True), ']'] + self._match()
+        elif op == self.OP_CD_HASH:
+            return ['cdhash ', self._hash()]
+        elif op == self.OP_NOT:
+            return ['! '] + self._expression(self.LEVEL_PRIMARY)
+        elif op == self.OP_NAMED_ANCHOR:
+            return ['anchor apple ', self._string()]
+        elif op == self.OP_NAMED_CODE:
+            return ['(', self._string(), ')']
+        elif op == self.OP_PLATFORM:
+            return ['platform = {}'.format(self._int())]
+        elif op == self.OP_NOTARIZED:
+            return ['notarized']
+        elif op == self.OP_LEGACY_DEV_ID:
+            return ['legacy']
+        else:
+            raise CodeSignatureException('Unsupported opcode {} in requirement blob'.format(op))
+
+
+class MachOCodeSignature(object):
+    """Reads the code signature embedded in a thin or fat Mach-O binary, without using `codesign`."""
+    FAT_MAGIC = 0xcafebabe
+    FAT_MAGIC_64 = 0xcafebabf
+    MACHO_MAGIC = {
+        0xfeedface: ('>', 28),  # 32-bit, big endian
+        0xfeedfacf: ('>', 32),  # 64-bit, big endian
+        0xcefaedfe: ('<', 28),  # 32-bit, little endian
+        0xcffaedfe: ('<', 32),  # 64-bit, little endian
+    }
+    MH_EXECUTE = 0x2  # Mach-O filetype of a main executable, rather than a library or bundle
+    LC_CODE_SIGNATURE = 0x1d
+    EMBEDDED_SIGNATURE_MAGIC = 0xfade0cc0
+    REQUIREMENTS_MAGIC = 0xfade0c01
+    REQUIREMENTS_SLOT = 2
+    DESIGNATED_REQUIREMENT = 3
+
+    def __init__(self, path):
+        self.path = self._executable_path(path.rstrip('/'))
+        self.filetype = None  # Mach-O filetype of the first architecture, once the signature has been read
+
+    @staticmethod
+    def _executable_path(path):
+        """Returns the main executable of an app bundle, or path if it is not a bundle."""
+        if os.path.isdir(path):
+            try:
+                executable = read_plist_keys(os.path.join(path, 'Contents/Info.plist'), ['CFBundleExecutable'])['CFBundleExecutable']
+            except Exception:
+                raise CodeSignatureException('Cannot find the main executable of {}'.format(path))
+            return os.path.join(path, 'Contents/MacOS', executable)
+        return path
+
+    def _signature_blob(self):
+        """Returns the embedded signature SuperBlob from the first architecture in the binary."""
+        with open(self.path, 'rb') as macho:
+            offset = 0
+            magic, = struct.unpack('>I', macho.read(4).rjust(4, b'\0'))
+
+            if magic in (self.FAT_MAGIC, self.FAT_MAGIC_64):
+                nfat_arch, = struct.unpack('>I', macho.read(4))
+                # Java class files share the fat magic, but never have this few architectures
+                if not 0 < nfat_arch < 32:
+                    raise CodeSignatureException('{} is not a Mach-O binary'.format(self.path))
+                if magic == self.FAT_MAGIC:
+                    offset = struct.unpack('>5I', macho.read(20))[2]
+                else:
+                    offset = struct.unpack('>2I2Q2I', macho.read(32))[2]
+                macho.seek(offset)
+                magic, = struct.unpack('>I', macho.read(4).rjust(4, b'\0'))
+
+            if magic not in self.MACHO_MAGIC:
+                raise CodeSignatureException('{} is not a Mach-O binary'.format(self.path))
+
+            endian, header_size = self.MACHO_MAGIC[magic]
+            macho.seek(offset)
+            header = struct.unpack(endian + '7I', macho.read(28))
+            self.filetype, ncmds = header[3], header[4]
+            position = offset + header_size
+
+            for _ in range(ncmds):
+                macho.seek(position)
+                cmd, cmdsize = struct.unpack(endian + '2I', macho.read(8))
+                if cmd == self.LC_CODE_SIGNATURE:
+                    dataoff, datasize = struct.unpack(endian + '2I', macho.read(8))
+                    macho.seek(offset + dataoff)
+                    return macho.read(datasize)
+                position += cmdsize
+
+        raise CodeSignatureException('{} is not signed'.format(self.path))
+
+    @staticmethod
+    def _blob_index(blob, magic, offset=0):
+        """Returns a dict of {type: offset} for the index of a SuperBlob or requirements set."""
+        blob_magic, length, count = struct.unpack_from('>3I', blob, offset)
+        if blob_magic != magic:
+            raise CodeSignatureException('Unexpected blob magic 0x{:08x}'.format(blob_magic))
+        return dict(struct.unpack_from('>2I', blob, offset + 12 + index * 8) for index in range(count))
+
+    def is_signed_executable(self):
+        """Returns True if the binary is a main executable with an embedded code signature."""
+        try:
+            self._signature_blob()
+        except (CodeSignatureException, IOError, OSError, struct.error):
+            return False
+        return self.filetype == self.MH_EXECUTE
+
+    @traced('MachOCodeSignature.designated_requirement')
+    def designated_requirement(self):
+        """Returns the designated requirement text, the same as `codesign -dr -` prints after 'designated => '."""
+        try:
+            blob = self._signature_blob()
+            slots = self._blob_index(blob, self.EMBEDDED_SIGNATURE_MAGIC)
+            if self.REQUIREMENTS_SLOT not in slots:
+                raise CodeSignatureException('{} has no requirements'.format(self.path))
+
+            requirements_offset = slots[self.REQUIREMENTS_SLOT]
+            requirements = self._blob_index(blob, self.REQUIREMENTS_MAGIC, requirements_offset)
+            # Without an explicit designated requirement, codesign synthesises one from the certificates.
+            if self.DESIGNATED_REQUIREMENT not in requirements:
+                raise CodeSignatureException('{} has no explicit designated requirement'.format(self.path))
+
+            return RequirementDecoder(blob[requirements_offset + requirements[self.DESIGNATED_REQUIREMENT]:]).decode()
+        except (IOError, OSError, struct.error) as e:
+            raise CodeSignatureException('Cannot read code signature of {}: {}'.format(self.path, e))
+
+
 class PrivacyProfilesException(Exception):
     """Basic error handling for PrivacyProfiles()"""
     pass
 
 
+class CodeSignCache(object):
+    """Persistent cache of code sign requirements and identifiers, stored in a SQLite database.
+    Entries are only valid while the app's fingerprint, from PrivacyProfiles._app_fingerprint(), is unchanged."""
+    DEFAULT_CACHE_DIR = '~/Library/Caches/tccprofile'
+    CACHE_FILENAME = 'codesign_cache.db'
+    SCHEMA_VERSION = 2  # Entries written with an earlier version are dropped, as their fingerprints missed re-signing
+    MAX_AGE = 60 * 60 * 24 * 30  # Entries not used in 30 days are evicted
+    MAX_ENTRIES = 5000  # Least recently used entries past this count are evicted
+
+    def __init__(self, cache_dir=None, max_age=MAX_AGE, max_entries=MAX_ENTRIES):
+        self.cache_dir = os.path.expandvars(os.path.expanduser(cache_dir or self.DEFAULT_CACHE_DIR))
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # The connection is shared between threads, so all access goes through the lock.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(self.cache_dir, self.CACHE_FILENAME), check_same_thread=False)
+        if self._connection.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+            self._connection.execute('DROP TABLE IF EXISTS codesign')
+            self._connection.execute('PRAGMA user_version = {}'.format(int(self.SCHEMA_VERSION)))
+        self._connection.execute('CREATE TABLE IF NOT EXISTS codesign ('
+                                 'path TEXT NOT NULL, kind TEXT NOT NULL, fingerprint TEXT NOT NULL, '
+                                 'value TEXT NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (path, kind))')
+        self._connection.commit()
+
+    @staticmethod
+    def _fingerprint(path):
+        """Returns the fingerprint used to determine if a cached entry is stale, or None if path can't be read. A script's
+        interpreter isn't included, as an unsigned script's requirement is cached under the interpreter itself."""
+        return PrivacyProfiles._app_fingerprint(path)
+
+    def get(self, path, kind):
+        """Returns the cached value for path, or None if there is no entry or the entry is stale."""
+        fingerprint = self._fingerprint(path)
+        if fingerprint is None:
+            return None
+
+        with self._lock:
+            row = self._connection.execute('SELECT fingerprint, value FROM codesign WHERE path = ? AND kind = ?', (path, kind)).fetchone()
+            if row and json.loads(row[0]) == fingerprint:
+                self._connection.execute('UPDATE codesign SET accessed = ? WHERE path = ? AND kind = ?', (time.time(), path, kind))
+                return json.loads(row[1])
+
+    def set(self, path, kind, value):
+        """Stores value for path along with the current fingerprint of the app."""
+        fingerprint = self._fingerprint(path)
+        if fingerprint is None:
+            return
+
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO codesign (path, kind, fingerprint, value, accessed) VALUES (?, ?, ?, ?, ?)',
+                                     (path, kind, json.dumps(fingerprint), json.dumps(value), time.time()))
+
+    def commit(self):
+        """Writes the entries added or used since the last commit to disk."""
+        with self._lock:
+            self._connection.commit()
+
+    def evict(self):
+        """Removes entries that are older than max_age, then the least recently used entries past max_entries."""
+        with self._lock:
+            self._connection.execute('DELETE FROM codesign WHERE accessed < ?', (time.time() - self.max_age,))
+            self._connection.execute('DELETE FROM codesign WHERE rowid NOT IN '
+                                     '(SELECT rowid FROM codesign ORDER BY accessed DESC LIMIT ?)', (self.max_entries,))
+
+    def close(self):
+        """Evicts stale entries and writes the cache to disk."""
+        self.evict()
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+
+class AppInspection(object):
+    """The details of an app gathered once per run, and shared by every payload and AppleEvents sender/receiver that uses it."""
+    def __init__(self, path, override_path=False):
+        self.path = path
+        self.path_override = override_path
+        self.app_name = None  # Name used in the Comment key
+        self.stat = None  # os.stat() result for path
+        self.mimetype = None  # As returned by PrivacyProfiles._get_file_mime_type()
+        self.signed = None  # False if an unsigned script is using the requirements of its shebang, None if not known
+        self.codesign_result = None  # Value for the CodeRequirement key
+        self.identifier = None  # Value for the Identifier key
+        self.identifier_type = None  # Value for the IdentifierType key
+        self.reused = False  # True if codesign_result was taken from the profile being updated, rather than resolved
+        self.fingerprint = None  # As returned by PrivacyProfiles._app_fingerprint(), to tell if the app changes later
+
+
+def service_entry_key(service, entry):
+    """Returns the key identifying an entry dict in the Services of a profile. Only AppleEvents entries have a receiver."""
+    return (service, entry.get('Identifier'), entry.get('AEReceiverIdentifier'))
+
+
+class AppEntry(object):
+    """An app requested for a service, and the app receiving AppleEvents from it for the AppleEvents service.
+    Entries that are equal hash the same, so each service can de-duplicate its apps with a set."""
+    __slots__ = ('sending_app_path', 'sending_app_path_override', 'receiving_app_path', 'receiving_app_path_override')
+
+    def __init__(self, sending_app_path, sending_app_path_override=False, receiving_app_path=False, receiving_app_path_override=False):
+        self.sending_app_path = sending_app_path
+        self.sending_app_path_override = sending_app_path_override
+        self.receiving_app_path = receiving_app_path
+        self.receiving_app_path_override = receiving_app_path_override
+
+    def key(self):
+        return (self.sending_app_path, self.sending_app_path_override, self.receiving_app_path, self.receiving_app_path_override)
+
+    def __eq__(self, other):
+        return isinstance(other, AppEntry) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+    @property
+    def sending_app(self):
+        """The (path, override_path) of the sending app, as used to key AppInspections."""
+        return (self.sending_app_path, self.sending_app_path_override)
+
+    @property
+    def receiving_app(self):
+        """The (path, override_path) of the receiving app, as used to key AppInspections."""
+        return (self.receiving_app_path, self.receiving_app_path_override)
+
+
+class PayloadEntry(object):
+    """A single entry in a service of the profile. The dict written to the profile is only created by as_dict().
+    Entries that are equal hash the same, so each service can de-duplicate its entries with a set."""
+    __slots__ = ('allowed', 'code_requirement', 'comment', 'identifier', 'identifier_type',
+                 'receiver_identifier', 'receiver_identifier_type', 'receiver_code_requirement')
+
+    def __init__(self, allowed, code_requirement, comment, identifier, identifier_type,
+                 receiver_identifier=None, receiver_identifier_type=None, receiver_code_requirement=None):
+        self.allowed = allowed
+        self.code_requirement = code_requirement
+        self.comment = comment
+        self.identifier = identifier
+        self.identifier_type = identifier_type
+        self.receiver_identifier = receiver_identifier  # The receiver values are only set for AppleEvents entries
+        self.receiver_identifier_type = receiver_identifier_type
+        self.receiver_code_requirement = receiver_code_requirement
+
+    def key(self):
+        return (self.allowed, self.code_requirement, self.comment, self.identifier, self.identifier_type,
+                self.receiver_identifier, self.receiver_identifier_type, self.receiver_code_requirement)
+
+    def __eq__(self, other):
+        return isinstance(other, PayloadEntry) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def as_dict(self):
+        """Returns the dict for this entry as it is written to the profile."""
+        result = {
+            'Allowed': self.allowed,
+            'CodeRequirement': self.code_requirement,
+            'Comment': self.comment,
+            'Identifier': self.identifier,
+            'IdentifierType': self.identifier_type,
+        }
+
+        if self.receiver_identifier_type is not None:
+            result['AEReceiverIdentifier'] = self.receiver_identifier
+            result['AEReceiverIdentifierType'] = self.receiver_identifier_type
+            result['AEReceiverCodeRequirement'] = self.receiver_code_requirement
+
+        return result
+
+
 class PrivacyProfiles(object):
     """Class for Privacy Profiles Creation"""
+    DEFAULT_JOBS = 4  # Number of worker threads used to resolve apps
+
+    # Tools used to check code signatures and sign profiles. Can be overridden with environment variables, for example
+    # to use stand-in tools when benchmarking on a machine without them.
+    CODESIGN = os.environ.get('TCCPROFILE_CODESIGN', '/usr/bin/codesign')
+    SECURITY = os.environ.get('TCCPROFILE_SECURITY', '/usr/bin/security')
+
+    # Scripts are identified by path, and use the requirements of the interpreter in the shebang if they aren't signed
+    SCRIPT_MIME_TYPES = [
+        'x-shellscript',
+        'x-python',
+        'x-perl'
+    ]
+
+    # Interpreter names in a shebang, and the mimetype `file` reports for scripts using them
+    SHEBANG_MIME_TYPES = [
+        ('sh', 'x-shellscript'),
+        ('bash', 'x-shellscript'),
+        ('zsh', 'x-shellscript'),
+        ('ksh', 'x-shellscript'),
+        ('csh', 'x-shellscript'),
+        ('tcsh', 'x-shellscript'),
+        ('dash', 'x-shellscript'),
+        ('python', 'x-python'),
+        ('perl', 'x-perl'),
+        ('ruby', 'x-ruby')
+    ]
+
+    MIME_SNIFF_LENGTH = 512  # Number of bytes read from the start of a file to determine the mimetype
+    FINGERPRINTS_SUFFIX = '.fingerprints.json'  # Written next to a profile, with the fingerprint of each app for --update
+
+    CODESIGN_BATCH_SIZE = 50  # Maximum number of paths passed to each `codesign` call when resolving apps in batches
+
     # List of Payload types to iterate on because lazy code is good code
     PAYLOADS = [
         'AddressBook',
@@ -507,6 +965,35 @@ class PrivacyProfiles(object):
         'AppleEvents'
     ]
 
+    # The argparse destination of the app list for each payload
+    SERVICE_ARGUMENTS = OrderedDict([
+        ('Accessibility', 'accessibility_apps_list'),
+        ('AddressBook', 'address_book_apps_list'),
+        ('AppleEvents', 'events_apps_list'),
+        ('Calendar', 'calendar_apps_list'),
+        ('Camera', 'camera_apps_list'),
+        ('FileProviderPresence', 'file_providers_apps_list'),
+        ('ListenEvent', 'listen_event_apps_list'),
+        ('MediaLibrary', 'media_library_apps_list'),
+        ('Microphone', 'microphone_apps_list'),
+        ('Photos', 'photos_apps_list'),
+        ('PostEvent', 'post_event_apps_list'),
+        ('Reminders', 'reminders_apps_list'),
+        ('ScreenCapture', 'screen_capture_apps_list'),
+        ('SpeechRecognition', 'speech_recognition_apps_list'),
+        ('SystemPolicyAllFiles', 'allfiles_apps_list'),
+        ('SystemPolicyDesktopFolder', 'desktop_apps_list'),
+        ('SystemPolicyDocumentsFolder', 'documents_apps_list'),
+        ('SystemPolicyDownloadsFolder', 'downloads_apps_list'),
+        ('SystemPolicyRemovableVolumes', 'removable_volumes_apps_list'),
+        ('SystemPolicyNetworkVolumes', 'network_volumes_apps_list'),
+        ('SystemPolicySysAdminFiles', 'sysadmin_apps_list'),
+    ])
+
+    # Directories inside an app bundle's Contents searched for helpers by include_helpers()
+    HELPER_LOCATIONS = ['Library/LoginItems', 'XPCServices', 'Helpers', 'MacOS', 'Frameworks']
+    HELPER_BUNDLE_EXTENSIONS = ['.app', '.xpc']
+
     DENY_PAYLOADS = [
         'Camera',
         'ListenEvent',
@@ -516,8 +1003,9 @@ class PrivacyProfiles(object):
 
     def __init__(self, payload_description, payload_name, payload_identifier,
                  payload_organization, profile_removal_password,
-                 sign_cert, filename, removal_date, timezone):
-        """Creates a Privacy Preferences Policy Control Profile for macOS Mojave."""
+                 sign_cert, filename, removal_date, timezone, cache=None, jobs=DEFAULT_JOBS, inspections=None, save_fingerprints=False):
+        """Creates a Privacy Preferences Policy Control Profile for macOS Mojave. If save_fingerprints is True, the
+        fingerprints of the apps are written next to the profile for a later --update."""
         # Init the things to put in the template, and elsewhere
         self.payload_description = payload_description
         self.payload_name = payload_name
@@ -538,7 +1026,7 @@ class PrivacyProfiles(object):
             self.profile_removable = False
 
         # Basic requirements for this profile to work
-        self.template = {
+        self._template = {
             'PayloadContent': [
                 {
                     'PayloadDescription': self.payload_description,
@@ -548,7 +1036,7 @@ class PrivacyProfiles(object):
                     'PayloadType': self.payload_type,
                     'PayloadUUID': self.payload_uuid,
                     'PayloadVersion': self.payload_version,
-                    'Services': dict()  # This will be an empty list to house the dicts.
+                    'Services': dict()  # Created by _profile() as the profile is serialized.
                 }
             ],
             'PayloadDescription': self.payload_description,
@@ -566,26 +1054,40 @@ class PrivacyProfiles(object):
         self.profile_removal_password = self._set_profile_removal_password(profile_removal_password)
 
         if self.profile_removable:
-            self.template['PayloadContent'][0]['RemovalPassword'] = self.profile_removal_password
+            self._template['PayloadContent'][0]['RemovalPassword'] = self.profile_removal_password
 
         # If a removal date is specified
         self.removal_date = self._set_profile_removal_date(removal_date)
         self.timezone = self._set_timezone(timezone)
 
         if self.removal_date and self.timezone:
-            self.template['RemovalDate'] = self._utc_formatted_time(local_time=self.removal_date, timezone=self.timezone)
+            self._template['RemovalDate'] = self._utc_formatted_time(local_time=self.removal_date, timezone=self.timezone)
         elif self.removal_date and not self.timezone:
-            print('A time zone for the target Mac must be provided when specifying a removal date. For example: --timezone="Australia/Brisbane"')
-            print('The time zone of the target is used as the time zone on the profile build machine may differ.')
-            sys.exit(1)
-
-        self._app_lists = dict()
+            raise PrivacyProfilesException('A time zone for the target Mac must be provided when specifying a removal date. For example: --timezone="Australia/Brisbane"\n'
+                                           'The time zone of the target is used as the time zone on the profile build machine may differ.')
+
+        self._app_lists = dict()  # List of AppEntry for each service
+        self._allow = None  # The allow argument of build_profile(), or None until the profile is built
+        self._previous_filename = None  # The profile being updated, if any
+        self._save_fingerprints = save_fingerprints  # Write the app fingerprints next to the profile, for --update
+        self._previous_entries = dict()  # Services entry dicts of the profile being updated, by service_entry_key()
+        # (CodeRequirement, app fingerprint) by (Identifier, path), from the profiles being updated
+        self._previous_requirements = dict()
+        self._cache = cache  # CodeSignCache instance, or None to always resolve apps
+        self._codesign_results = dict()  # Designated requirement (or None if not signed) of paths resolved by batched codesign calls
+        self._codesign_batched = set()  # Paths that have been in a batched codesign call, whether or not it resolved them
+        self._defer_codesign = False  # True while _inspect_apps() is setting aside the apps that need codesign
+        self._jobs = max(1, int(jobs))  # Number of apps to resolve concurrently
+        # AppInspection for each (path, override_path), shared by every payload using the app. Can be shared between profiles.
+        self._inspections = dict() if inspections is None else inspections
         self._sign_cert = self._set_sign_profile(sign_cert)
         self._filename = self._set_filename(filename)
 
     @staticmethod
     def _utc_formatted_time(local_time, timezone):
         """Returns a UTC date for use where a date is required in UTC format"""
+        import pytz  # Only needed when a removal date is specified, so don't import it at startup
+
         valid_time_format = '%Y-%m-%d %H:%M'
 
         try:
@@ -618,6 +1120,7 @@ class PrivacyProfiles(object):
         else:
             raise PrivacyProfilesException(errno.EACCES, 'Permission denied accessing {}'.format(path))
 
+    @traced()
     def set_services_dict(self, args):
         if not isinstance(args, dict):
             arguments = vars(args)
@@ -626,172 +1129,539 @@ class PrivacyProfiles(object):
 
             # Make sure AppleEvents apps are splitabble
             if arguments.get('events_apps_list', False) is not None and not all([len(app.split(',')) == 2 for app in arguments.get('events_apps_list', False)]):
-                print('AppleEvents applications must be in the format of /Application/Path/EventSending.app,/Application/Path/EventReceiving.app')
-                print('or')
-                print('/Volumes/ExtDisk/Path/EventSending.app:/Application/OverridePath/EventSending.app,/Volumes/ExtDisk/Path/EventReceiving.app:/Application/OverridePath/EventReceiving.app')
-                sys.exit(1)
+                raise PrivacyProfilesException('AppleEvents applications must be in the format of /Application/Path/EventSending.app,/Application/Path/EventReceiving.app\n'
+                                               'or\n'
+                                               '/Volumes/ExtDisk/Path/EventSending.app:/Application/OverridePath/EventSending.app,/Volumes/ExtDisk/Path/EventReceiving.app:/Application/OverridePath/EventReceiving.app')
 
             # Build up args to pass to the class init
-            app_lists['Accessibility'] = {'_apps': arguments.get('accessibility_apps_list', False), 'apps': list()}
-            app_lists['AddressBook'] = {'_apps': arguments.get('address_book_apps_list', False), 'apps': list()}
-            app_lists['AppleEvents'] = {'_apps': arguments.get('events_apps_list', False), 'apps': list()}
-            app_lists['Calendar'] = {'_apps': arguments.get('calendar_apps_list', False), 'apps': list()}
-            app_lists['Camera'] = {'_apps': arguments.get('camera_apps_list', False), 'apps': list()}
-            app_lists['FileProviderPresence'] = {'_apps': arguments.get('file_providers_apps_list', False), 'apps': list()}
-            app_lists['ListenEvent'] = {'_apps': arguments.get('listen_event_apps_list', False), 'apps': list()}
-            app_lists['MediaLibrary'] = {'_apps': arguments.get('media_library_apps_list', False), 'apps': list()}
-            app_lists['Microphone'] = {'_apps': arguments.get('microphone_apps_list', False), 'apps': list()}
-            app_lists['Photos'] = {'_apps': arguments.get('photos_apps_list', False), 'apps': list()}
-            app_lists['PostEvent'] = {'_apps': arguments.get('post_event_apps_list', False), 'apps': list()}
-            app_lists['Reminders'] = {'_apps': arguments.get('reminders_apps_list', False), 'apps': list()}
-            app_lists['ScreenCapture'] = {'_apps': arguments.get('screen_capture_apps_list', False), 'apps': list()}
-            app_lists['SpeechRecognition'] = {'_apps': arguments.get('speech_recognition_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicyAllFiles'] = {'_apps': arguments.get('allfiles_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicyDesktopFolder'] = {'_apps': arguments.get('desktop_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicyDocumentsFolder'] = {'_apps': arguments.get('documents_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicyDownloadsFolder'] = {'_apps': arguments.get('downloads_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicyRemovableVolumes'] = {'_apps': arguments.get('removable_volumes_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicyNetworkVolumes'] = {'_apps': arguments.get('network_volumes_apps_list', False), 'apps': list()}
-            app_lists['SystemPolicySysAdminFiles'] = {'_apps': arguments.get('sysadmin_apps_list', False), 'apps': list()}
+            for payload, dest in self.SERVICE_ARGUMENTS.items():
+                app_lists[payload] = {'_apps': arguments.get(dest, False), 'apps': list()}
         else:
             app_lists = args
 
         for key in app_lists.keys():
             if app_lists[key]['_apps'] is not None:
+                seen = set()
                 for app in app_lists[key]['_apps']:
-                    value = dict()
                     sending_app = app.split(',')[0]
                     receiving_app = app.split(',')[1] if ',' in app else False
 
-                    value['sending_app_path'] = sending_app.split(':')[0] if ':' in sending_app else sending_app
-                    value['sending_app_path_override'] = app.split(':')[1] if ':' in app else False
+                    sending_app_path = sending_app.split(':')[0] if ':' in sending_app else sending_app
+                    sending_app_path_override = app.split(':')[1] if ':' in app else False
+                    receiving_app_path = False
+                    receiving_app_path_override = False
 
                     if key == 'AppleEvents' and app.count(',') == 1:
                         receiving_app = app.split(',')[1]
                         if sending_app.count(':') > 1 or receiving_app.count(':') > 1:
-                            print('Too many \':\' characters in AppleEvents app string. One \':\' per sender and recever app is excpected.')
-                            sys.exit(1)
+                            raise PrivacyProfilesException('Too many \':\' characters in AppleEvents app string. One \':\' per sender and recever app is excpected.')
                         else:
-                            value['sending_app_path'] = sending_app.split(':')[0] if ':' in sending_app else value['sending_app_path']
-                            value['sending_app_path_override'] = sending_app.split(':')[1] if ':' in sending_app else False
+                            sending_app_path_override = sending_app.split(':')[1] if ':' in sending_app else False
                             if receiving_app:
-                                value['receiving_app_path'] = receiving_app.split(':')[0]
-                                value['receiving_app_path_override'] = receiving_app.split(':')[1] if ':' in receiving_app else False
-                    if value not in app_lists[key]['apps']:
+                                receiving_app_path = receiving_app.split(':')[0]
+                                receiving_app_path_override = receiving_app.split(':')[1] if ':' in receiving_app else False
+
+                    value = AppEntry(sending_app_path=sending_app_path, sending_app_path_override=sending_app_path_override,
+                                     receiving_app_path=receiving_app_path, receiving_app_path_override=receiving_app_path_override)
+                    if value not in seen:
+                        seen.add(value)
                         app_lists[key]['apps'].append(value)
 
         # Remove all None values in dict
-        for key in app_lists.keys():
+        for key in list(app_lists.keys()):
             if app_lists[key]['_apps'] is None:
                 del app_lists[key]
             else:
                 # Get rid of the _apps as it's no longer required
                 app_lists[key] = app_lists[key]['apps']
 
+        self.set_app_entries(app_lists)
+
+    def set_app_entries(self, app_lists):
+        """Sets the app lists from a dict of {payload: [AppEntry, ...]}."""
         # Handle if no payload arguments are supplied,
         # Can't create an empty profile.
         if not any(app_lists.keys()):
-            print('You must provide at least one payload type to create a profile.')
-            raise TCCProfileException
+            raise TCCProfileException('You must provide at least one payload type to create a profile.')
 
         self._app_lists = app_lists
 
-        # Create payload lists in the services_dict
-        for payload in self.PAYLOADS:
-            if app_lists.get(payload):
-                self.template['PayloadContent'][0]['Services'][payload] = []
+    @staticmethod
+    def _is_signed_executable(path):
+        """Returns True if path is a signed Mach-O executable, or a bundle with one as its main executable."""
+        try:
+            return MachOCodeSignature(path).is_signed_executable()
+        except CodeSignatureException:
+            return False
+
+    @classmethod
+    def find_helpers(cls, app_path):
+        """Returns the paths of the signed code nested in an app bundle: login items, XPC services, helpers, other
+        executables in Contents/MacOS, and helper apps in Contents/Frameworks or the Helpers of its frameworks.
+        Bundles found are searched in turn, and each helper is only returned once, however many symlinks lead to it."""
+        app_path = app_path.rstrip('/')
+        seen = set([os.path.realpath(app_path)])
+        helpers = list()
+        bundles = [app_path]
+
+        while bundles:
+            bundle = bundles.pop(0)
+            try:
+                seen.add(os.path.realpath(MachOCodeSignature._executable_path(bundle)))
+            except CodeSignatureException:
+                pass
+
+            directories = [os.path.join(bundle, 'Contents', location) for location in cls.HELPER_LOCATIONS]
+            frameworks = os.path.join(bundle, 'Contents/Frameworks')
+            if os.path.isdir(frameworks):
+                directories.extend(os.path.join(frameworks, name, 'Helpers') for name in sorted(os.listdir(frameworks)) if name.endswith('.framework'))
+
+            for directory in directories:
+                if not os.path.isdir(directory):
+                    continue
+                for name in sorted(os.listdir(directory)):
+                    path = os.path.join(directory, name)
+                    realpath = os.path.realpath(path)
+                    if realpath in seen:
+                        continue
+
+                    if os.path.isdir(path):
+                        if os.path.splitext(name)[1] not in cls.HELPER_BUNDLE_EXTENSIONS or not cls._is_signed_executable(path):
+                            continue
+                        bundles.append(path)
+                    elif directory == frameworks or not cls._is_signed_executable(path):
+                        continue
+
+                    seen.add(realpath)
+                    helpers.append(path)
+
+        return helpers
+
+    @traced()
+    def include_helpers(self):
+        """Adds the helpers nested in each app bundle in the app lists, after the app they belong to. AppleEvents
+        helpers send to the same app as their bundle. A helper reached through more than one path, or a helper bundle
+        shipped inside more than one app (such as an Electron helper), is only added and resolved once for each
+        payload. Helpers that aren't bundles are given the same path inside an app's override path."""
+        def _key(helper):
+            if os.path.isdir(helper):
+                try:
+                    return read_plist_keys(os.path.join(helper, 'Contents/Info.plist'), ['CFBundleIdentifier'])['CFBundleIdentifier']
+                except Exception:
+                    pass
+            return os.path.realpath(helper)
+
+        helpers = dict()  # Each bundle is only searched once, even if it is in more than one payload
+        for payload, apps in self._app_lists.items():
+            entries = list()
+            seen = set((os.path.realpath(app.sending_app_path), app.receiving_app) for app in apps)
+            for app in apps:
+                entries.append(app)
+                path = app.sending_app_path.rstrip('/')
+                if os.path.splitext(path)[1] != '.app':
+                    continue
+
+                if path not in helpers:
+                    helpers[path] = self.find_helpers(path)
+
+                for helper in helpers[path]:
+                    key = (_key(helper), app.receiving_app)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+
+                    override_path = False
+                    if app.sending_app_path_override and not os.path.isdir(helper):
+                        override_path = app.sending_app_path_override.rstrip('/') + helper[len(path):]
+                    entries.append(AppEntry(sending_app_path=helper, sending_app_path_override=override_path,
+                                            receiving_app_path=app.receiving_app_path, receiving_app_path_override=app.receiving_app_path_override))
+
+            self._app_lists[payload] = entries
 
     @staticmethod
     def _app_name(app_obj):
         return os.path.basename(os.path.splitext(app_obj)[0])
 
-    def build_profile(self, allow):
-        """Builds the profile out into the full dict required to write as a plist or to stdout."""
+    def _inspect_app(self, path, override_path=False):
+        """Returns an AppInspection with the file details, code sign requirements and identifier details for an app."""
+        inspection = AppInspection(path=path, override_path=override_path)
+        inspection.app_name = self._app_name(app_obj=path)
+
+        if not os.path.exists(path.rstrip('/')):
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+        inspection.stat = os.stat(path.rstrip('/'))
+        inspection.mimetype = self._get_file_mime_type(path=path)
+
+        app_identifier_type = self._get_identifier_and_type(app_path=path, override_path=override_path, mimetype=inspection.mimetype)
+        inspection.identifier = app_identifier_type['identifier']
+        inspection.identifier_type = app_identifier_type['identifier_type']
+
+        # Reuse the requirement in the profile being updated if the app hasn't changed since that profile was written
+        inspection.fingerprint = self._app_fingerprint(path=path, mimetype=inspection.mimetype)
+        previous = self._previous_requirement(path=path, identifier=inspection.identifier, fingerprint=inspection.fingerprint)
+        if previous:
+            inspection.codesign_result = previous
+            inspection.reused = True
+            return inspection
+
+        code_sign_details = self._get_code_sign_details(path=path, mimetype=inspection.mimetype)
+        inspection.signed = code_sign_details['signed']
+        inspection.codesign_result = code_sign_details['requirement']
+
+        return inspection
+
+    def _previous_requirement(self, path, identifier, fingerprint):
+        """Returns the CodeRequirement for identifier at path in the profile being updated, or None if there isn't one
+        or the app's fingerprint has changed since it was recorded."""
+        previous = self._previous_requirements.get((identifier, path))
+        if previous and fingerprint is not None and previous[1] == fingerprint:
+            return previous[0]
+
+        return None
+
+    @classmethod
+    def _app_fingerprint(cls, path, mimetype=None):
+        """Returns the inode, size, modification and change times of path, and of the Info.plist, code signature and
+        main executable of an app bundle, or the interpreter in a script's shebang, to tell if the app has changed.
+        Installing or updating an app sets the change time, even if the installer keeps the original modification
+        times. A list of lists, so it is the same after a round trip through JSON. None if path can't be read."""
+        path = path.rstrip('/')
+        paths = [path]
+        if os.path.isdir(path):
+            paths.extend([os.path.join(path, 'Contents/Info.plist'), os.path.join(path, 'Contents/_CodeSignature/CodeResources')])
+            try:
+                paths.append(MachOCodeSignature._executable_path(path))
+            except CodeSignatureException:
+                pass
+        elif mimetype in cls.SCRIPT_MIME_TYPES:
+            try:
+                interpreter = cls._read_shebang(app_path=path)
+            except Exception:
+                interpreter = None
+            if interpreter:
+                paths.append(interpreter)
+
+        fingerprint = list()
+        for _path in paths:
+            try:
+                _stat = os.stat(_path)
+            except OSError:
+                if _path == path:
+                    return None
+                fingerprint.append(None)
+                continue
+            fingerprint.append([_stat.st_ino, _stat.st_size, _stat.st_mtime, _stat.st_ctime])
+
+        return fingerprint
+
+    @staticmethod
+    def _fingerprints_filename(filepath):
+        """Returns the file the app fingerprints of a profile are kept in, next to the profile."""
+        return '{}{}'.format(os.path.splitext(filepath)[0], PrivacyProfiles.FINGERPRINTS_SUFFIX)
+
+    def use_previous_profile(self, filepath):
+        """Updates a profile generated earlier. Its PayloadUUIDs are kept, and the CodeRequirement of each app in it is
+        reused if the app's fingerprint, recorded next to the profile when it was written, is unchanged, so only new and
+        changed apps are resolved. Without the fingerprints every app is resolved again."""
+        filepath = os.path.expandvars(os.path.expanduser(filepath))
+
+        try:
+            previous = read_plist(filepath)
+        except Exception as e:
+            raise PrivacyProfilesException('Unable to read the profile to update {}: {}'.format(filepath, e))
+
+        try:
+            payload_content = previous['PayloadContent'][0]
+            profile_uuid = previous['PayloadUUID']
+            payload_uuid = payload_content['PayloadUUID']
+            services = payload_content['Services']
+        except (KeyError, IndexError, TypeError):
+            raise PrivacyProfilesException('{} is not a Privacy Preferences Policy Control profile.'.format(filepath))
+
+        self.profile_uuid = profile_uuid
+        self.payload_uuid = payload_uuid
+        self._template['PayloadUUID'] = self.profile_uuid
+        self._template['PayloadContent'][0]['PayloadUUID'] = self.payload_uuid
+        self._template['PayloadContent'][0]['PayloadIdentifier'] = '{}.{}'.format(self.payload_identifier, self.payload_uuid)
+
+        self._previous_filename = filepath
+        self._save_fingerprints = True  # Keep the fingerprints up to date for the next update
+        requirements = dict()
+        for service, entries in services.items():
+            for entry in entries:
+                self._previous_entries[service_entry_key(service, entry)] = entry
+                requirements.setdefault(entry.get('Identifier'), set()).add(entry.get('CodeRequirement'))
+                if 'AEReceiverIdentifier' in entry:
+                    requirements.setdefault(entry['AEReceiverIdentifier'], set()).add(entry.get('AEReceiverCodeRequirement'))
+
+        fingerprints_filename = self._fingerprints_filename(filepath)
+        if not os.path.exists(fingerprints_filename):
+            return
+        try:
+            with open(fingerprints_filename, 'r') as f:
+                apps = json.load(f)['apps']
+            # Only requirements that are still in the profile are reused, so an edited requirement is resolved again
+            for app in apps:
+                if app['requirement'] in requirements.get(app['identifier'], ()):
+                    self._add_previous_requirement(app['identifier'], app['path'], app['requirement'], app['fingerprint'])
+        except (ValueError, KeyError, TypeError) as e:
+            print('Unable to read {}, resolving every app again: {}'.format(fingerprints_filename, e), file=sys.stderr)
+            self._previous_requirements.clear()
+
+    def _add_previous_requirement(self, identifier, path, requirement, fingerprint):
+        """Records the CodeRequirement of an app from a profile being updated, with the app's fingerprint when it was resolved."""
+        if identifier and path and requirement and fingerprint:
+            self._previous_requirements.setdefault((identifier, path), (requirement, fingerprint))
+
+    def _write_fingerprints(self):
+        """Writes the fingerprint and CodeRequirement of every app in the profile next to it, for --update."""
+        apps = list()
+        for app in OrderedDict.fromkeys(self._apps_to_inspect()):
+            inspection = self._inspections.get(app)
+            if isinstance(inspection, AppInspection) and inspection.fingerprint is not None:
+                apps.append(OrderedDict([('identifier', inspection.identifier), ('path', inspection.path),
+                                         ('requirement', inspection.codesign_result), ('fingerprint', inspection.fingerprint)]))
+
+        # One app per line, so the changes are easy to see when the file is kept in version control with the profile
+        with open(self._fingerprints_filename(self._filename), 'w') as f:
+            f.write('{"apps": [\n')
+            f.write(',\n'.join('  {}'.format(json.dumps(app)) for app in apps))
+            f.write('\n]}\n' if apps else ']}\n')
+
+    def update_summary(self):
+        """Returns a summary of the apps that were re-resolved or reused, and the Services entries that changed, when updating a profile."""
+        apps = [app for app in OrderedDict.fromkeys(self._apps_to_inspect()) if isinstance(self._inspections.get(app), AppInspection)]
+        reused = [app for app in apps if self._inspections[app].reused]
+        resolved = [app for app in apps if not self._inspections[app].reused]
+
+        keys = set()
+        counts = {'unchanged': 0, 'changed': 0, 'added': 0}
+        for service in self._service_payloads():
+            for entry in self._payload_entries(service):
+                entry = entry.as_dict()
+                key = service_entry_key(service, entry)
+                keys.add(key)
+                if key not in self._previous_entries:
+                    counts['added'] += 1
+                elif self._previous_entries[key] == entry:
+                    counts['unchanged'] += 1
+                else:
+                    counts['changed'] += 1
+
+        lines = ['Updated {}: re-resolved {} app(s), reused {} app(s)'.format(self._previous_filename, len(resolved), len(reused)),
+                 'Services entries: {} unchanged, {} changed, {} added, {} removed'.format(
+                     counts['unchanged'], counts['changed'], counts['added'], len(set(self._previous_entries) - keys))]
+        lines.extend('  Re-resolved: {}'.format(app[0]) for app in resolved)
+
+        return '\n'.join(lines)
+
+    def _apps_to_inspect(self):
+        """Returns the (path, override_path) of every app in the app lists, in the order they are used."""
+        apps = list()
         for payload in self.PAYLOADS:
-            if self._app_lists.get(payload):
-                for app in self._app_lists[payload]:
-                    # Common payload values
-                    sending_app = dict()
-                    sending_app['path'] = app['sending_app_path']
-                    sending_app['path_override'] = app.get('sending_app_path_override', False)
-                    sending_app['codesign_result'] = self._get_code_sign_requirements(path=sending_app['path'])
-                    sending_app['app_name'] = self._app_name(app_obj=sending_app['path'])
-
-                    app_identifier_type = self._get_identifier_and_type(app_path=sending_app['path'], override_path=sending_app['path_override'])
-                    sending_app['identifier'] = app_identifier_type['identifier']
-                    sending_app['identifier_type'] = app_identifier_type['identifier_type']
-
-                    # For any payload that can only be set to 'Deny', change settings to enforce.
-                    if payload in self.DENY_PAYLOADS or not allow:
-                        _allow = False
-                        allow_statement = 'Deny'
-                    else:
-                        _allow = allow
-                        allow_statement = 'Allow'
-
-                    # Add details about the receiving app if the payload is an AppleEvents type
-                    if payload == 'AppleEvents':
-                        receiving_app = dict()
-                        receiving_app['path'] = app.get('receiving_app_path', False)
-                        receiving_app['path_override'] = app.get('receiving_app_path_override', False)
-                        receiving_app['codesign_result'] = self._get_code_sign_requirements(path=receiving_app['path'])
-                        receiving_app['app_name'] = self._app_name(app_obj=receiving_app['path'])
-                        app_identifier_type = self._get_identifier_and_type(app_path=receiving_app['path'], override_path=receiving_app['path_override'])
-                        receiving_app['identifier'] = app_identifier_type['identifier']
-                        receiving_app['identifier_type'] = app_identifier_type['identifier_type']
-                        comment = '{} {} to send {} control to {}'.format(allow_statement, sending_app['app_name'], payload, receiving_app['app_name'])
-                    else:
-                        receiving_app = False
-                        comment = '{} {} control for {}'.format(allow_statement, payload, sending_app['app_name'])
-
-                    # Pass the payload over to the _build_payload function
-                    payload_dict = self._build_payload(
-                        sending_app=sending_app,
-                        receiving_app=receiving_app,
-                        allowed=_allow,
-                        apple_event=True if payload == 'AppleEvents' else False,
-                        comment=comment,
-                    )
-
-                    # Add the assembled payload_dict to the template
-                    if payload_dict not in self.template['PayloadContent'][0]['Services'][payload]:
-                        self.template['PayloadContent'][0]['Services'][payload].append(payload_dict)
+            for app in self._app_lists.get(payload) or []:
+                apps.append(app.sending_app)
+                if payload == 'AppleEvents':
+                    apps.append(app.receiving_app)
+
+        return apps
+
+    @traced()
+    def _inspect_apps(self, apps=None, progress=None, cancel=None):
+        """Inspects every unique app that hasn't already been inspected, using a pool of worker threads.
+        The AppInspection for each app is stored in self._inspections, keyed by (path, override_path). If an app
+        can't be inspected, the exception is stored instead, so each app is only inspected once.
+        Apps that need codesign (scripts, and binaries whose designated requirement can't be read from the Mach-O binary)
+        are set aside by the workers, then resolved with a few batched codesign calls and inspected again, rather than
+        starting a codesign process for each app. The interpreters of unsigned scripts are batched the same way.
+        progress is called with (apps done, total apps) as each app is inspected. If the cancel threading.Event is set,
+        the remaining apps are skipped and BuildCancelledException is raised. Apps already inspected are kept."""
+        # Keep the order the apps are first seen in, so any error is raised for the same app as a sequential build
+        apps = [app for app in OrderedDict.fromkeys(self._apps_to_inspect() if apps is None else apps) if app not in self._inspections]
+        total = len(apps)
+        done = [0]
+
+        def _inspect(app):
+            if cancel is not None and cancel.is_set():
+                return None
+            try:
+                return self._inspect_app(path=app[0], override_path=app[1])
+            except Exception as e:
+                return e
+
+        def _inspect_all(apps):
+            results = list()
+            if self._jobs > 1 and len(apps) > 1:
+                from multiprocessing.pool import ThreadPool  # Only imported when needed, as it's slow to import
+
+                pool = ThreadPool(min(self._jobs, len(apps)))
+                try:
+                    # imap keeps the order of the apps, while still reporting progress as the results come in
+                    for result in pool.imap(_inspect, apps):
+                        results.append(result)
+                        if progress and not isinstance(result, CodesignDeferredException):
+                            done[0] += 1
+                            progress(done[0], total)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                for app in apps:
+                    results.append(_inspect(app))
+                    if progress and not isinstance(results[-1], CodesignDeferredException):
+                        done[0] += 1
+                        progress(done[0], total)
+            return results
+
+        self._defer_codesign = len(apps) > 1
+        try:
+            while apps:
+                deferred = OrderedDict()
+                for app, result in zip(apps, _inspect_all(apps)):
+                    if isinstance(result, CodesignDeferredException):
+                        deferred[app] = result.path
+                    elif result is not None:
+                        self._inspections[app] = result
+
+                if not deferred or (cancel is not None and cancel.is_set()):
+                    break
+
+                # Each path is only batched once. Any a batch couldn't resolve are left to their own codesign call.
+                paths = list(OrderedDict.fromkeys(deferred.values()))
+                self._codesign_batched.update(paths)
+                try:
+                    self._codesign_results.update(self._codesign_batch(paths))
+                except Exception:
+                    pass
+                apps = list(deferred)
+        finally:
+            self._defer_codesign = False
+
+        if cancel is not None and cancel.is_set():
+            raise BuildCancelledException('The profile build was cancelled.')
+
+    @traced()
+    def build_profile(self, allow, progress=None, cancel=None):
+        """Resolves every app in the profile, raising the error of the first app that couldn't be resolved. The entries
+        for each service, and the profile dict, are created as the profile is written.
+        progress and cancel are passed to _inspect_apps(), to report each app as it is resolved and to stop the build."""
+        self._inspect_apps(progress=progress, cancel=cancel)
+
+        for app in self._apps_to_inspect():
+            if isinstance(self._inspections[app], Exception):
+                raise self._inspections[app]
+
+        self._allow = allow
+
+    def _service_payloads(self):
+        """Returns the payloads with apps, in the order of PAYLOADS."""
+        return [payload for payload in self.PAYLOADS if self._app_lists.get(payload)]
+
+    def _payload_entries(self, payload):
+        """Yields the PayloadEntry for each app of a payload, in order, leaving out repeats of an identical entry.
+        Each entry is built as it is iterated, so a profile is written without holding every entry. Nothing is yielded
+        until build_profile() has been called."""
+        if self._allow is None:
+            return
+
+        allow = self._allow
+        seen = set()  # Entries already yielded, to de-duplicate in constant time
+        for app in self._app_lists[payload]:
+            # Common payload values
+            sending_app = self._inspections[app.sending_app]
+
+            # For any payload that can only be set to 'Deny', change settings to enforce.
+            if payload in self.DENY_PAYLOADS or not allow:
+                _allow = False
+                allow_statement = 'Deny'
+            else:
+                _allow = allow
+                allow_statement = 'Allow'
+
+            # Add details about the receiving app if the payload is an AppleEvents type
+            if payload == 'AppleEvents':
+                receiving_app = self._inspections[app.receiving_app]
+                comment = '{} {} to send {} control to {}'.format(allow_statement, sending_app.app_name, payload, receiving_app.app_name)
+            else:
+                receiving_app = False
+                comment = '{} {} control for {}'.format(allow_statement, payload, sending_app.app_name)
+
+            # Pass the payload over to the _build_payload function
+            payload_entry = self._build_payload(
+                sending_app=sending_app,
+                receiving_app=receiving_app,
+                allowed=_allow,
+                apple_event=True if payload == 'AppleEvents' else False,
+                comment=comment,
+            )
+
+            if payload_entry not in seen:
+                seen.add(payload_entry)
+                yield payload_entry
 
     def _build_payload(self, sending_app, receiving_app, allowed, apple_event, comment):
-        """Builds an Accessibility payload for the profile."""
-        if isinstance(sending_app, dict) and isinstance(apple_event, bool) and isinstance(comment, str):
-            # Only return a basic dict, even though the Services needs a dict
-            # supplied, and the 'Accessibility' "payload" is a list of dicts.
-            result = {
-                'Allowed': allowed,
-                'CodeRequirement': sending_app['codesign_result'],
-                'Comment': comment,
-                'Identifier': sending_app['identifier'],
-                'IdentifierType': sending_app['identifier_type'],
-            }
+        """Builds a PayloadEntry for a service in the profile."""
+        if isinstance(sending_app, AppInspection) and isinstance(apple_event, bool) and isinstance(comment, str):
+            result = PayloadEntry(
+                allowed=allowed,
+                code_requirement=sending_app.codesign_result,
+                comment=comment,
+                identifier=sending_app.identifier,
+                identifier_type=sending_app.identifier_type,
+            )
 
             # If the payload is an AppleEvent type, there are additional
             # requirements relating to the receiving app.
-            if apple_event and isinstance(receiving_app, dict):
-                result['AEReceiverIdentifier'] = receiving_app['identifier']
-                result['AEReceiverIdentifierType'] = receiving_app['identifier_type']
-                result['AEReceiverCodeRequirement'] = receiving_app['codesign_result']
+            if apple_event and isinstance(receiving_app, AppInspection):
+                result.receiver_identifier = receiving_app.identifier
+                result.receiver_identifier_type = receiving_app.identifier_type
+                result.receiver_code_requirement = receiving_app.codesign_result
 
             return result
 
+    def _profile(self, lazy=False):
+        """Returns the profile dict, with the entries for each service converted to dicts.
+        If lazy is True, each service is a generator, so each entry and its dict are only created as it is written."""
+        profile = dict(self._template)
+        profile['PayloadContent'] = [dict(self._template['PayloadContent'][0])]
+        if lazy:
+            profile['PayloadContent'][0]['Services'] = dict((payload, (entry.as_dict() for entry in self._payload_entries(payload)))
+                                                            for payload in self._service_payloads())
+        else:
+            profile['PayloadContent'][0]['Services'] = dict((payload, [entry.as_dict() for entry in self._payload_entries(payload)])
+                                                            for payload in self._service_payloads())
+
+        return profile
+
+    @property
+    def template(self):
+        """The full dict of the profile, as it is written as a plist."""
+        return self._profile()
+
+    @traced()
     def write(self):
         """Handles writing the profile out to file, and will also create the configuration template if the relevant argument is provided."""
         # Write out the file if a filename is provided, otherwise dump to stdout
         if self._filename:
             # Write the plist out to file
-            plistlib.writePlist(self.template, self._filename)
+            with open(self._filename, 'wb') as f:
+                self.write_to(f)
+            if self._save_fingerprints:
+                self._write_fingerprints()
 
             # Sign it if required
             if self._sign_cert:
                 self._sign_profile(certificate_name=self._sign_cert, input_file=self._filename)
         else:
-            # Print as formatted plist out to stdout
-            print(plistlib.writePlistToString(self.template).rstrip('\n'))
+            # Print as formatted plist out to stdout, after anything already printed to it
+            sys.stdout.flush()
+            self.write_to(getattr(sys.stdout, 'buffer', sys.stdout))
+            sys.stdout.flush()
+
+    def write_to(self, fileobj):
+        """Writes the unsigned profile as an XML plist to a binary file object."""
+        PlistStreamWriter(fileobj).write(self._profile(lazy=True))
 
     @staticmethod
     def _set_timezone(timezone):
@@ -832,18 +1702,45 @@ class PrivacyProfiles(object):
         else:
             return None
 
-    @staticmethod
-    def _get_file_mime_type(path):
-        """Returns the mimetype of a given file."""
-        if os.path.exists(path.rstrip('/')):
-            cmd = ['/usr/bin/file', '--mime-type', path]
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            result, error = process.communicate()
-
-            if process.returncode is 0:
-                # Only need the mime type, so return the last bit
-                result = result.replace(' ', '').replace('\n', '').split(':')[1].split('/')[1]
-                return result
+    @classmethod
+    @traced()
+    def _get_file_mime_type(cls, path):
+        """Returns the mimetype of a given file, in the same form as the subtype from `file --mime-type`.
+        Only the first few hundred bytes of the file are read to determine this."""
+        path = path.rstrip('/')
+
+        if os.path.exists(path):
+            if os.path.isdir(path):
+                return 'directory'
+
+            with open(path, 'rb') as f:
+                header = f.read(cls.MIME_SNIFF_LENGTH)
+
+            if not header:
+                return 'x-empty'
+
+            magic, = struct.unpack('>I', header[:4].rjust(4, b'\0'))
+            if magic in MachOCodeSignature.MACHO_MAGIC:
+                return 'x-mach-binary'
+            elif magic in (MachOCodeSignature.FAT_MAGIC, MachOCodeSignature.FAT_MAGIC_64) and len(header) >= 8:
+                # Java class files share the fat magic, but never have this few architectures
+                if 0 < struct.unpack('>I', header[4:8])[0] < 32:
+                    return 'x-mach-binary'
+
+            if header.startswith(b'#!'):
+                interpreter = (header[2:].splitlines() or [b''])[0].decode('utf-8', 'replace').split()
+                # '#!/usr/bin/env python' style shebangs name the interpreter in the next argument
+                if interpreter and os.path.basename(interpreter[0]) == 'env':
+                    interpreter = [arg for arg in interpreter[1:] if not arg.startswith('-') and '=' not in arg]
+
+                if interpreter:
+                    name = os.path.basename(interpreter[0])
+                    for interpreter_name, mimetype in cls.SHEBANG_MIME_TYPES:
+                        # The interpreter, or a version of it such as python3 or python3.11, but not shellcheck or pythonista
+                        if name == interpreter_name or re.match(r'{}[0-9][0-9.]*$'.format(interpreter_name), name):
+                            return mimetype
+
+            return 'octet-stream' if b'\0' in header else 'plain'
 
     @staticmethod
     def _read_shebang(app_path):
@@ -855,66 +1752,191 @@ class PrivacyProfiles(object):
             elif line.startswith('#!') and 'env ' in line:
                 raise Exception('Cannot check codesign for shebangs that refer to \'env\'.')
 
-    def _get_code_sign_requirements(self, path):
+    @traced()
+    def _get_code_sign_requirements(self, path, mimetype=None):
         """Returns the values for the CodeRequirement key."""
-        def _is_code_signed(path):
-            """Returns True/False if specified path is code signed or not."""
-            cmd = ['/usr/bin/codesign', '-dr', '-', path]
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            result, error = process.communicate()
+        return self._get_code_sign_details(path=path, mimetype=mimetype)['requirement']
+
+    @traced()
+    def _get_code_sign_details(self, path, mimetype=None):
+        """Returns a dict of the CodeRequirement value and whether path itself is signed, using the cache if one is available.
+        An unsigned script is cached as the interpreter in its shebang, whose requirement has its own cache entry, so
+        changing the shebang or updating the interpreter doesn't reuse an out of date requirement."""
+        if not self._cache:
+            return self._read_code_sign_details(path=path, mimetype=mimetype)
+
+        result = self._cache.get(path, 'codesign')
+        if result is not None and not result['signed']:
+            try:
+                interpreter = self._read_shebang(app_path=path)
+            except Exception:
+                interpreter = None
+            if interpreter and interpreter == result.get('interpreter'):
+                return {'requirement': self._get_code_sign_details(path=interpreter)['requirement'], 'signed': False, 'interpreter': interpreter}
+            result = None
+
+        if result is None:
+            result = self._read_code_sign_details(path=path, mimetype=mimetype)
+            if result['signed']:
+                self._cache.set(path, 'codesign', result)
+            else:
+                self._cache.set(path, 'codesign', {'signed': False, 'interpreter': result['interpreter']})
+                self._cache.set(result['interpreter'], 'codesign', {'requirement': result['requirement'], 'signed': True})
+
+        return result
+
+    @classmethod
+    def _codesign(cls, path):
+        """Returns the designated requirement from `codesign -dr -`, or None if the specified path is not code signed."""
+        cmd = [cls.CODESIGN, '-dr', '-', path]
+        returncode, result, error = run_command(cmd, universal_newlines=True)
+
+        if returncode == 0:
+            # For some reason, part of the output gets dumped to stderr, but the bit we need goes to stdout
+            # Also, there can be multiple lines in the result, so handle this properly
+            # There are circumstances where the codesign 'designated => ' is not the start of the line, so handle these.
+            result = result.rstrip('\n').splitlines()
+            result = [line for line in result if 'designated => ' in line][0]
+            result = result.partition('designated => ')
+            result = result[result.index('designated => ') + 1:][0]
+            return result
+        elif returncode == 1 and 'not signed' in error:
+            return None
+        else:
+            raise PrivacyProfilesException('Unable to check code signature of {}: {}'.format(path, error.strip()))
+
+    def _codesign_requirement(self, path):
+        """Returns the designated requirement from a batched codesign call if path was in one, otherwise runs codesign for it."""
+        if path in self._codesign_results:
+            return self._codesign_results[path]
+        if self._defer_codesign and path not in self._codesign_batched:
+            raise CodesignDeferredException(path)
+
+        return self._codesign(path=path)
+
+    @classmethod
+    def _codesign_chunk(cls, paths):
+        """Runs `codesign -dr -` once for every path in paths. Returns a dict of the designated requirement of each path,
+        or None if the path is not signed. codesign reports each path in turn, with 'Executable=' or an error on stderr,
+        and the requirements of the signed paths on stdout, so the two are matched up in order. If the output can't be
+        matched to the paths, or codesign can't be run, an empty dict is returned. Paths with any error other than not
+        being signed are left out, so a single codesign call can report the error."""
+        try:
+            _, stdout, stderr = run_command([cls.CODESIGN, '-dr', '-'] + list(paths), universal_newlines=True)
+        except OSError:
+            return dict()
+
+        requirements = [line.partition('designated => ')[2] for line in stdout.splitlines() if 'designated => ' in line]
+        remaining = list(paths)
+        signed = list()
+        results = dict()
+
+        for line in stderr.splitlines():
+            if not line.strip():
+                continue
+            elif remaining and line.startswith('Executable='):
+                signed.append(remaining.pop(0))
+            elif remaining and line.startswith('{}:'.format(remaining[0])):
+                path = remaining.pop(0)
+                if 'not signed' in line:
+                    results[path] = None
+            else:
+                return dict()  # A line that doesn't belong to the next path, so the output is ambiguous
+
+        if remaining or len(signed) != len(requirements):
+            return dict()
+
+        results.update(zip(signed, requirements))
+
+        return results
+
+    def _codesign_batch(self, paths):
+        """Resolves paths with `codesign` in chunks of CODESIGN_BATCH_SIZE, running up to self._jobs chunks at once.
+        Returns a dict of the designated requirement (or None if not signed) of each path that was resolved."""
+        chunks = [paths[index:index + self.CODESIGN_BATCH_SIZE] for index in range(0, len(paths), self.CODESIGN_BATCH_SIZE)]
+        results = dict()
 
-            if process.returncode is 0:
-                return True
-            elif process.returncode is 1 and 'not signed' in error:
-                return False
+        if self._jobs > 1 and len(chunks) > 1:
+            from multiprocessing.pool import ThreadPool  # Only imported when needed, as it's slow to import
 
+            pool = ThreadPool(min(self._jobs, len(chunks)))
+            try:
+                for result in pool.map(self._codesign_chunk, chunks):
+                    results.update(result)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for chunk in chunks:
+                results.update(self._codesign_chunk(chunk))
+
+        return results
+
+    def _read_code_sign_details(self, path, mimetype=None):
+        """Returns a dict of the CodeRequirement value and whether path itself is signed.
+        Unsigned scripts use the requirements of the shell or interpreter in their shebang, which is added as 'interpreter'."""
         # Make sure the path exists and is readable.
         if os.path.exists(path.rstrip('/')) and self._is_accessible(path.rstrip('/')):
             # Handle situations where path is a script, and shebang is
             # ['/bin/sh', '/bin/bash', '/usr/bin/python']
-            mimetype = self._get_file_mime_type(path=path)
-
-            if mimetype in ['x-python', 'x-shellscript']:
-                if not _is_code_signed(path):  # Only use shebang path if a script is not code signed
-                    path = self._read_shebang(app_path=path)
-
-            cmd = ['/usr/bin/codesign', '-dr', '-', path]
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            result, error = process.communicate()
-
-            if process.returncode is 0:
-                # For some reason, part of the output gets dumped to stderr, but the bit we need goes to stdout
-                # Also, there can be multiple lines in the result, so handle this properly
-                # There are circumstances where the codesign 'designated => ' is not the start of the line, so handle these.
-                result = result.rstrip('\n').splitlines()
-                result = [line for line in result if 'designated => ' in line][0]
-                result = result.partition('designated => ')
-                result = result[result.index('designated => ') + 1:][0]
-                # result = [x.rstrip('\n') for x in result.splitlines() if x.startswith('designated => ')][0]
-                return result
-            elif process.returncode is 1 and 'not signed' in error:
-                print('App at {} is not signed. Exiting.'.format(path))
-                sys.exit(1)
+            mimetype = mimetype or self._get_file_mime_type(path=path)
+
+            if mimetype in self.SCRIPT_MIME_TYPES:
+                # Scripts are signed using extended attributes, so only codesign can check them.
+                result = self._codesign_requirement(path=path)
+                if result is not None:
+                    return {'requirement': result, 'signed': True}
+                path = self._read_shebang(app_path=path)  # Only use shebang path if a script is not code signed
+                signed = False
+            else:
+                signed = True
+
+            # Read the designated requirement straight from the binary, only falling back to codesign if that isn't possible
+            try:
+                result = MachOCodeSignature(path).designated_requirement()
+            except CodeSignatureException:
+                result = self._codesign_requirement(path=path)
+                if result is None:
+                    raise PrivacyProfilesException('App at {} is not signed.'.format(path))
+
+            if signed:
+                return {'requirement': result, 'signed': True}
+            return {'requirement': result, 'signed': False, 'interpreter': path}
         else:
             raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
 
-    def _get_identifier_and_type(self, app_path, override_path=False):
-        """Checks file type, and returns appropriate values for `Identifier`and `IdentifierType` keys in the final profile payload."""
+    @traced()
+    def _get_identifier_and_type(self, app_path, override_path=False, mimetype=None):
+        """Returns the values for the `Identifier` and `IdentifierType` keys, using the cache if one is available."""
+        if self._cache:
+            kind = 'identifier:{}'.format(override_path or '')
+            result = self._cache.get(app_path, kind)
+            if result is None:
+                result = self._read_identifier_and_type(app_path=app_path, override_path=override_path, mimetype=mimetype)
+                self._cache.set(app_path, kind, result)
+            return result
+        else:
+            return self._read_identifier_and_type(app_path=app_path, override_path=override_path, mimetype=mimetype)
+
+    def _read_identifier_and_type(self, app_path, override_path=False, mimetype=None):
+        """Checks file type, and returns appropriate values for `Identifier`and `IdentifierType` keys in the final profile payload.
+        mimetype is the already known mimetype of app_path, if any."""
         # Only change the app_path to the override path if '.app' is not the file extension, because app's should have CFBundleIdentifier payload
         # in the App/Contents/Info.plist file
         if override_path and os.path.splitext(override_path)[1] != '.app' and os.path.splitext(app_path)[1] != '.app':
             app_path = override_path.rstrip('/') if override_path else app_path.rstrip('/')
+            mimetype = None
 
         # Determine mimetype
-        mimetype = self._get_file_mime_type(path=app_path)
+        mimetype = mimetype or self._get_file_mime_type(path=app_path)
 
         # Check for mimetype of file
-        if mimetype in ['x-shellscript', 'x-python']:
+        if mimetype in self.SCRIPT_MIME_TYPES:
             identifier = app_path
             identifier_type = 'path'
         else:
             try:
-                identifier = read_plist(os.path.join(app_path.rstrip('/'), 'Contents/Info.plist'))['CFBundleIdentifier']
+                identifier = read_plist_keys(os.path.join(app_path.rstrip('/'), 'Contents/Info.plist'), ['CFBundleIdentifier'])['CFBundleIdentifier']
                 identifier_type = 'bundleID'
             except Exception:
                 identifier = app_path
@@ -922,11 +1944,12 @@ class PrivacyProfiles(object):
 
         return {'identifier': identifier, 'identifier_type': identifier_type}
 
+    @traced()
     def _sign_profile(self, certificate_name, input_file):
         """Signs the profile."""
         if self._sign_cert and os.path.exists(input_file) and input_file.endswith('.mobileconfig'):
-            cmd = ['/usr/bin/security', 'cms', '-S', '-N', certificate_name, '-i', input_file, '-o', '{}'.format(input_file.replace('.mobileconfig', '_Signed.mobileconfig'))]
-            subprocess.call(cmd)
+            cmd = [self.SECURITY, 'cms', '-S', '-N', certificate_name, '-i', input_file, '-o', '{}'.format(input_file.replace('.mobileconfig', '_Signed.mobileconfig'))]
+            run_command(cmd, capture=False)
 
 
 class SaneUsageFormat(argparse.HelpFormatter):
@@ -959,8 +1982,18 @@ class SaneUsageFormat(argparse.HelpFormatter):
         return action.dest.upper()
 
 
-def parse_args():
-    parser = argparse.ArgumentParser(formatter_class=SaneUsageFormat)
+def parse_args(argv=None, raise_errors=False, allow_abbrev=True):
+    """Parses the command line arguments. If raise_errors is True, invalid arguments raise TCCProfileException
+    instead of printing the usage and exiting. If allow_abbrev is False, only whole option names are accepted."""
+    try:
+        parser = argparse.ArgumentParser(formatter_class=SaneUsageFormat, allow_abbrev=allow_abbrev)
+    except TypeError:  # Python 2's argparse always accepts abbreviations
+        parser = argparse.ArgumentParser(formatter_class=SaneUsageFormat)
+
+    if raise_errors:
+        def _raise_error(message):
+            raise TCCProfileException(message)
+        parser.error = _raise_error
 
     parser.add_argument(
         '--ab', '--address-book',
@@ -1215,7 +2248,7 @@ def parse_args():
         dest='payload_description',
         metavar='payload_description',
         help='A short and sweet description of the payload.',
-        required=True,
+        required=False,
     )
 
     parser.add_argument(
@@ -1224,7 +2257,7 @@ def parse_args():
         dest='payload_identifier',
         metavar='payload_identifier',
         help='An identifier to use for the profile. Example: org.foo.bar',
-        required=True,
+        required=False,
     )
 
     parser.add_argument(
@@ -1233,7 +2266,7 @@ def parse_args():
         dest='payload_name',
         metavar='payload_name',
         help='A short and sweet name for the payload.',
-        required=True,
+        required=False,
     )
 
     parser.add_argument(
@@ -1242,7 +2275,7 @@ def parse_args():
         dest='payload_org',
         metavar='payload_org',
         help='Organization to use for the profile.',
-        required=True,
+        required=False,
     )
 
     parser.add_argument(
@@ -1291,6 +2324,138 @@ def parse_args():
         required=False,
     )
 
+    parser.add_argument(
+        '--update',
+        type=str,
+        dest='update',
+        metavar='<existing.mobileconfig>',
+        help='Update a profile generated earlier. Its PayloadUUIDs are kept, and apps that have not changed since it was '
+             'written reuse its code requirements instead of being resolved again. The updated profile is written back '
+             'to it unless -o is given.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--save-fingerprints',
+        action='store_true',
+        dest='save_fingerprints',
+        default=False,
+        help='Save the fingerprint of each app next to the profile, as <profile>.fingerprints.json, so a later --update '
+             'only resolves the apps that have changed. Always done with --update.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        dest='manifest',
+        metavar='<file.json|file.yaml>',
+        help='Build every profile listed in a JSON or YAML manifest. Each entry uses the '
+             'long argument names of this command as keys, for example: '
+             '{"payload-name": "Zoom", "accessibility": ["/Applications/zoom.us.app"], "allow": true, "output": "zoom.mobileconfig"}',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--from-tccdb',
+        type=str,
+        dest='from_tccdb',
+        metavar='<TCC.db>',
+        help='Build the profile from the rows of a TCC database, using the code requirements stored in it instead of '
+             'running codesign. With --allow, the rows that allow access are used, otherwise the rows that deny it.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--include-helpers',
+        action='store_true',
+        dest='include_helpers',
+        default=False,
+        help='Also add the signed login items, XPC services, helper apps and tools nested in each app bundle, '
+             'each with its own identifier and code requirement.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--scan',
+        type=str,
+        nargs='+',
+        dest='scan',
+        metavar='<root>',
+        help='Find every app bundle, executable script and signed executable under these directories, and add them to '
+             'the payloads given with --services. App bundles are not searched inside.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--services',
+        type=str,
+        nargs='+',
+        dest='scan_services',
+        metavar='<payload>',
+        choices=list(PrivacyProfiles.SERVICE_ARGUMENTS),
+        help='Payloads to add the apps found by --scan to, for example: SystemPolicyAllFiles Accessibility. '
+             'With --from-tccdb, only the rows for these payloads are used.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--inventory',
+        type=str,
+        dest='inventory',
+        metavar='<out.json>',
+        help='Write the path, identifier and code requirement of everything found by --scan to a JSON file.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        dest='jobs',
+        metavar='N',
+        default=PrivacyProfiles.DEFAULT_JOBS,
+        help='Number of apps to resolve concurrently. Defaults to {}.'.format(PrivacyProfiles.DEFAULT_JOBS),
+        required=False,
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        dest='no_cache',
+        default=False,
+        help='Do not read or write the code sign requirements cache.',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        dest='cache_dir',
+        metavar='<path>',
+        help='Directory to store the code sign requirements cache in. '
+             'Defaults to {}'.format(CodeSignCache.DEFAULT_CACHE_DIR),
+        required=False,
+    )
+
+    parser.add_argument(
+        '--trace',
+        type=str,
+        dest='trace',
+        metavar='<out.json>',
+        help='Write the time taken by each phase of the build, and each subprocess, to a file in Chrome trace event '
+             'format. Open it in chrome://tracing or https://ui.perfetto.dev',
+        required=False,
+    )
+
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        dest='timings',
+        default=False,
+        help='Print the total, count, p50 and p95 times of each operation to stderr.',
+        required=False,
+    )
+
     parser.add_argument(
         '-v', '--version',
         action='version',
@@ -1307,29 +2472,47 @@ def parse_args():
     #     required=False
     # )
 
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if args.scan:
+        if args.manifest:
+            parser.error('--scan cannot be used with --manifest')
+        if not args.scan_services and not args.inventory:
+            parser.error('--scan needs --services to build a profile, --inventory, or both')
+        if 'AppleEvents' in (args.scan_services or []):
+            parser.error('--scan cannot add apps to AppleEvents, as each needs a receiving app')
+    elif args.from_tccdb:
+        if args.manifest:
+            parser.error('--from-tccdb cannot be used with --manifest')
+        if args.inventory:
+            parser.error('--inventory can only be used with --scan')
+        if any(getattr(args, dest) is not None for dest in PrivacyProfiles.SERVICE_ARGUMENTS.values()):
+            parser.error('--from-tccdb cannot be used with payload arguments, use --services to choose payloads')
+    elif args.scan_services or args.inventory:
+        parser.error('--services can only be used with --scan or --from-tccdb, and --inventory with --scan')
+
+    # The payload details are required for each profile, which a manifest provides instead. Scanning only for an
+    # inventory doesn't build a profile.
+    if not args.manifest and not (args.scan and not args.scan_services):
+        missing = [option for option, dest in [('--pd/--payload-description', 'payload_description'),
+                                               ('--pi/--payload-identifier', 'payload_identifier'),
+                                               ('--pn/--payload-name', 'payload_name'),
+                                               ('--po/--payload-org', 'payload_org')] if not getattr(args, dest)]
+        if missing:
+            parser.error('the following arguments are required: {}'.format(', '.join(missing)))
+
+    return args
 
 
 def launch_gui(args=None):
-    info = AppKit.NSBundle.mainBundle().infoDictionary()
-    info['LSUIElement'] = True
-
-    root = tk.Tk()
-    app = App(root)
-    AppKit.NSApplication.sharedApplication().activateIgnoringOtherApps_(True)
-    app.mainloop()
-
-
-def main():
-    if len(sys.argv) == 1:
-        launch_gui()
-        sys.exit(0)
-    else:
-        args = parse_args()
+    # Imported here so Tkinter and AppKit are only loaded when the GUI is used, not on the command line path
+    import tccprofile_gui
+    tccprofile_gui.launch_gui(args)
 
-        # if args.launch_gui:
-        #     launch_gui(args)
 
+def profile_from_args(args, cache=None, inspections=None, set_services=True):
+    """Returns a PrivacyProfiles instance with the services dict set from the parsed arguments.
+    If set_services is False, set_services_dict() is left for the caller."""
     tcc_profile = PrivacyProfiles(
         payload_description=args.payload_description,
         payload_name=args.payload_name,
@@ -1337,19 +2520,907 @@ def main():
         payload_organization=args.payload_org,
         profile_removal_password=args.profile_removal_password,
         sign_cert=args.sign_profile,
-        filename=args.payload_filename,
+        filename=args.payload_filename or args.update,
         removal_date=args.profile_removal_date,
         timezone=args.timezone,
+        cache=cache,
+        jobs=args.jobs,
+        inspections=inspections,
+        save_fingerprints=args.save_fingerprints,
     )
 
+    # Keep the UUIDs and code requirements of the profile being updated
+    if args.update:
+        tcc_profile.use_previous_profile(args.update)
+
     # Insert the service dict into the template
-    tcc_profile.set_services_dict(args)
+    if set_services:
+        tcc_profile.set_services_dict(args)
+        if args.include_helpers:
+            tcc_profile.include_helpers()
+
+    return tcc_profile
+
+
+def read_manifest(manifest_path):
+    """Returns the list of profile entries in a JSON or YAML manifest.
+    The manifest is either a list of entries, or a dict with the entries in a 'profiles' list."""
+    with open(os.path.expandvars(os.path.expanduser(manifest_path)), 'r') as f:
+        if os.path.splitext(manifest_path)[1].lower() in ['.yaml', '.yml']:
+            try:
+                import yaml
+            except ImportError:
+                raise TCCProfileException('PyYAML is required to read YAML manifests. Install it, or use a JSON manifest.')
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    if isinstance(manifest, dict):
+        manifest = manifest.get('profiles')
+
+    if not isinstance(manifest, list) or not all(isinstance(entry, dict) for entry in manifest):
+        raise TCCProfileException('The manifest {} must be a list of profiles, or a dict with a "profiles" list.'.format(manifest_path))
+
+    return manifest
+
+
+# The keys of a manifest entry that describe the profile itself
+PROFILE_FIELDS = frozenset(['address-book', 'calendar', 'reminders', 'photos', 'camera', 'listenevents', 'screencapture',
+                            'microphone', 'accessibility', 'post-event', 'allfiles', 'fileprovider', 'medialibrary',
+                            'speechrecognition', 'desktopfolder', 'documentsfolder', 'downloadsfolder', 'removablevolumes',
+                            'networkvolumes', 'apple-event', 'sysadminfiles', 'allow', 'payload-description',
+                            'payload-identifier', 'payload-name', 'payload-org', 'removable', 'removal-date', 'timezone', 'sign'])
+# The keys of a --manifest entry, which also names the files the profile is written to and updated from. Options for
+# the whole run, such as --jobs, --no-cache or another --manifest, can't be set per profile.
+MANIFEST_FIELDS = PROFILE_FIELDS | frozenset(['output', 'update', 'save-fingerprints', 'include-helpers'])
+
+
+def manifest_entry_arguments(entry, fields=MANIFEST_FIELDS):
+    """Converts a manifest entry into the equivalent command line arguments. Raises TCCProfileException if the entry
+    has a key that isn't in fields, or a value that would be parsed as another option."""
+    unsupported = sorted(key for key in entry if key not in fields)
+    if unsupported:
+        raise TCCProfileException('Unsupported fields: {}'.format(', '.join(unsupported)))
+
+    # A value that starts with '-' would be parsed as another option, so can't be used to reach one
+    for key, value in entry.items():
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, (dict, list)) or (hasattr(item, 'startswith') and item.startswith('-')):
+                raise TCCProfileException('Invalid value for {}: {}'.format(key, json.dumps(item)))
+
+    def argument(value):
+        # Command line arguments are bytes in Python 2, so unicode from JSON is encoded the same way
+        value = u'{}'.format(value)
+        return value if isinstance(value, str) else value.encode('utf-8')
+
+    argv = list()
+    for key, value in entry.items():
+        option = '--{}'.format(key)
+        if value is True:
+            argv.append(option)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, list):
+            argv.append(option)
+            argv.extend(argument(item) for item in value)
+        else:
+            argv.extend([option, argument(value)])
+
+    return argv
+
+
+def build_manifest(manifest_path, cache=None, jobs=PrivacyProfiles.DEFAULT_JOBS):
+    """Builds every profile in a manifest in one process, inspecting each unique app once across all profiles.
+    Prints the result of each profile, and returns True if every profile was built."""
+    inspections = dict()
+    profiles = list()
+
+    for index, entry in enumerate(read_manifest(manifest_path)):
+        name = entry.get('output') or entry.get('payload-name') or 'profile {}'.format(index + 1)
+        try:
+            args = parse_args(manifest_entry_arguments(entry) + ['--jobs', str(jobs)], raise_errors=True, allow_abbrev=False)
+            profiles.append((name, profile_from_args(args, cache=cache, inspections=inspections), None, args.allow_app))
+        except Exception as e:  # A bad entry only fails its own profile
+            profiles.append((name, None, e, None))
+
+    # Inspect the apps of every profile together, so they are spread across the worker threads. The inspections are
+    # shared with every profile, so each profile's build only inspects what this couldn't.
+    apps = list()
+    for _, tcc_profile, _, _ in profiles:
+        if tcc_profile:
+            apps.extend(tcc_profile._apps_to_inspect())
+    if apps:
+        inspector = PrivacyProfiles(payload_description=None, payload_name=None, payload_identifier=None, payload_organization=None,
+                                    profile_removal_password=None, sign_cert=None, filename=None, removal_date=None, timezone=None,
+                                    cache=cache, jobs=jobs, inspections=inspections)
+        # The requirements of every profile being updated can be reused by the apps of any profile
+        for _, tcc_profile, _, _ in profiles:
+            if tcc_profile:
+                for (identifier, path), (requirement, fingerprint) in tcc_profile._previous_requirements.items():
+                    inspector._add_previous_requirement(identifier, path, requirement, fingerprint)
+        try:
+            inspector._inspect_apps(apps)
+        except Exception as e:
+            print('Unable to inspect the apps of every profile together, inspecting each profile on its own: {}'.format(e), file=sys.stderr)
+
+    succeeded = True
+    for name, tcc_profile, error, allow in profiles:
+        if tcc_profile:
+            try:
+                tcc_profile.build_profile(allow=allow)
+                tcc_profile.write()
+            except Exception as e:  # Including any error stored for an app, so later profiles are still built
+                error = e
+
+        if error:
+            succeeded = False
+            print('FAILED: {}: {}'.format(name, error), file=sys.stderr)
+        else:
+            print('OK: {}'.format(name), file=sys.stderr)
+            if tcc_profile._previous_filename:
+                print(tcc_profile.update_summary(), file=sys.stderr)
+
+    return succeeded
+
+
+SCAN_CHUNK_SIZE = 500  # Number of found apps resolved together by --scan, bounding the paths held while scanning
 
-    # Iterate over the payloads dict to build payloads
+
+def _scan_directory(path):
+    """Returns the (path, is_directory, mode) of each directory and file in a directory, sorted by name, without
+    following symlinks. mode is None for directories."""
+    entries = list()
+    if hasattr(os, 'scandir'):
+        # scandir gets the type of each entry from the directory listing, so only files need a stat
+        for entry in os.scandir(path):
+            if entry.is_dir(follow_symlinks=False):
+                entries.append((entry.name, entry.path, True, None))
+            elif entry.is_file(follow_symlinks=False):
+                entries.append((entry.name, entry.path, False, entry.stat(follow_symlinks=False).st_mode))
+    else:
+        for name in os.listdir(path):
+            child = os.path.join(path, name)
+            mode = os.lstat(child).st_mode
+            if stat.S_ISDIR(mode):
+                entries.append((name, child, True, None))
+            elif stat.S_ISREG(mode):
+                entries.append((name, child, False, mode))
+    entries.sort()
+
+    return [entry[1:] for entry in entries]
+
+
+def _scan_file_kind(path, mode):
+    """Returns 'script' for an executable script, 'binary' for a signed Mach-O executable, or None for any other file."""
+    if not mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+        return None
+
+    try:
+        mimetype = PrivacyProfiles._get_file_mime_type(path=path)
+    except (IOError, OSError):
+        return None
+
+    if mimetype in PrivacyProfiles.SCRIPT_MIME_TYPES:
+        return 'script'
+    elif mimetype == 'x-mach-binary' and PrivacyProfiles._is_signed_executable(path):
+        return 'binary'
+
+    return None
+
+
+def scan_tree(roots, counts=None):
+    """Yields the (path, kind) of every app bundle ('app'), executable script ('script') and signed Mach-O executable
+    ('binary') under roots, in sorted order. App bundles are not searched inside, and symlinks are not followed.
+    The tree is walked with a stack rather than recursion, so only the directories waiting to be listed are held in
+    memory, not the whole listing. counts, if given, is a dict updated with the number of 'directories', 'files' and
+    'unreadable' directories."""
+    counts = counts if counts is not None else dict()
+    for key in ['directories', 'files', 'unreadable']:
+        counts.setdefault(key, 0)
+
+    stack = list()
+    for root in reversed(roots):
+        root = os.path.abspath(os.path.expanduser(root)).rstrip('/') or '/'
+        try:
+            mode = os.lstat(root).st_mode
+        except OSError as e:
+            raise TCCProfileException('Cannot scan {}: {}'.format(root, e.strerror))
+        stack.append((root, stat.S_ISDIR(mode), mode))
+
+    while stack:
+        path, is_directory, mode = stack.pop()
+        if not is_directory:
+            counts['files'] += 1
+            kind = _scan_file_kind(path, mode)
+            if kind:
+                yield path, kind
+        elif path.endswith('.app'):
+            yield path, 'app'
+        else:
+            counts['directories'] += 1
+            try:
+                entries = _scan_directory(path)
+            except (IOError, OSError):
+                counts['unreadable'] += 1
+                continue
+            stack.extend(reversed(entries))
+
+
+def scan_apps(roots, inspector, keep=True, counts=None, chunk_size=SCAN_CHUNK_SIZE):
+    """Yields the (path, kind, result) of everything scan_tree() finds under roots, where result is the AppInspection
+    of the path or the exception raised resolving it. Paths are resolved chunk_size at a time with the worker threads
+    of inspector, a PrivacyProfiles instance. If keep is False, the results are not kept in inspector._inspections."""
+    def _resolve(chunk):
+        apps = [(path, False) for path, _ in chunk]
+        inspector._inspect_apps(apps)
+        for (path, kind), app in zip(chunk, apps):
+            yield path, kind, inspector._inspections[app] if keep else inspector._inspections.pop(app)
+
+    chunk = list()
+    for found in scan_tree(roots, counts=counts):
+        chunk.append(found)
+        if len(chunk) >= chunk_size:
+            for result in _resolve(chunk):
+                yield result
+            chunk = list()
+
+    for result in _resolve(chunk):
+        yield result
+
+
+def inventory_entry(path, kind, result):
+    """Returns the inventory record of a path found by scan_apps()."""
+    entry = OrderedDict([('path', path), ('kind', kind)])
+    if isinstance(result, AppInspection):
+        entry['identifier'] = result.identifier
+        entry['identifier_type'] = result.identifier_type
+        entry['code_requirement'] = result.codesign_result
+        entry['signed'] = result.signed
+    else:
+        entry['error'] = str(result)
+
+    return entry
+
+
+def build_scan(args, cache=None):
+    """Scans the --scan roots, writes the --inventory if given, and builds a profile with everything that could be
+    resolved in each of the --services payloads. Returns True if the inventory and profile were written."""
+    tcc_profile = profile_from_args(args, cache=cache, set_services=False)
+    counts = dict()
+    found = list()
+    failed = 0
+
+    inventory = open(args.inventory, 'w') if args.inventory else None
+    try:
+        if inventory:
+            inventory.write('[')
+
+        # The inventory is written as each path is resolved, so only the paths for the profile are held
+        separator = '\n  '
+        for path, kind, result in scan_apps(args.scan, tcc_profile, keep=bool(args.scan_services), counts=counts):
+            if isinstance(result, AppInspection):
+                found.append(path)
+            else:
+                failed += 1
+                print('Skipping {}: {}'.format(path, result), file=sys.stderr)
+
+            if inventory:
+                inventory.write(separator + json.dumps(inventory_entry(path, kind, result)))
+                separator = ',\n  '
+
+        if inventory:
+            inventory.write('\n]\n' if separator != '\n  ' else ']\n')
+    finally:
+        if inventory:
+            inventory.close()
+
+    print('Scanned {} files in {} directories: {} resolved, {} could not be resolved, {} directories could not be read'.format(
+        counts['files'], counts['directories'], len(found), failed, counts['unreadable']), file=sys.stderr)
+
+    if not args.scan_services:
+        return True
+
+    # Add everything found to each payload, after any apps given with the payload arguments
+    if found:
+        for payload in args.scan_services:
+            dest = PrivacyProfiles.SERVICE_ARGUMENTS[payload]
+            setattr(args, dest, (getattr(args, dest) or list()) + found)
+
+    tcc_profile.set_services_dict(args)
+    if args.include_helpers:
+        tcc_profile.include_helpers()
     tcc_profile.build_profile(allow=args.allow_app)
+    tcc_profile.write()
+    if tcc_profile._previous_filename:
+        print(tcc_profile.update_summary(), file=sys.stderr)
+
+    return True
+
+
+TCC_SERVICE_PREFIX = 'kTCCService'  # TCC.db names each service kTCCService followed by its payload name
+TCC_ALLOWED_AUTH_VALUES = (2, 3)  # auth_value of allowed and limited access, from macOS 11
+
+
+def _tcc_inspection(identifier, identifier_type, csreq):
+    """Returns an AppInspection for a client or AppleEvents receiver of TCC.db, with the requirement decoded from its csreq blob.
+    identifier_type is 0 for a bundle identifier, or 1 for a path."""
+    if csreq is None:
+        raise CodeSignatureException('{} has no code requirement'.format(identifier))
+
+    inspection = AppInspection(path=identifier)
+    inspection.identifier = identifier
+    inspection.identifier_type = 'path' if identifier_type == 1 else 'bundleID'
+    inspection.app_name = os.path.basename(identifier) if identifier_type == 1 else identifier
+    inspection.signed = True
+    inspection.codesign_result = RequirementDecoder(bytes(csreq)).decode()
+
+    return inspection
+
+
+@traced()
+def read_tcc_db(tcc_db_path, allowed=True, services=None):
+    """Reads the access table of a TCC.db with tccdbRead, and returns ({payload: [AppEntry, ...]}, inspections, skipped).
+    Only rows that allow access are used, or only rows that deny it if allowed is False, optionally only for the
+    given payloads. The code requirement of each client, and of each AppleEvents receiver, is decoded from the csreq
+    blobs in the database, so nothing is run. inspections has an AppInspection for each, keyed the same as an app in
+    the app lists, for PrivacyProfiles(inspections=...). skipped is a dict of the number of rows not used, by reason."""
+    import tccdbRead  # Only imported when a TCC.db is read
+
+    reader = tccdbRead.ReadTCC(tcc_db_path=tcc_db_path)
+    available = set(reader.table_columns())
+    wanted = ['service', 'client', 'client_type', 'allowed', 'auth_value', 'csreq', 'indirect_object_identifier_type',
+              'indirect_object_identifier', 'indirect_object_code_identity']
+    columns = [column for column in wanted if column in available]
+
+    app_lists = OrderedDict()
+    inspections = dict()
+    skipped = dict()
+
+    def _skip(reason):
+        skipped[reason] = skipped.get(reason, 0) + 1
+
+    def _app(identifier, identifier_type, csreq):
+        if (identifier, False) not in inspections:
+            inspections[(identifier, False)] = _tcc_inspection(identifier, identifier_type, csreq)
+        return identifier
+
+    try:
+        for row in reader.rows(columns=columns):
+            row = dict(zip(columns, row))
+            payload = row['service'][len(TCC_SERVICE_PREFIX):] if row['service'].startswith(TCC_SERVICE_PREFIX) else row['service']
+            if payload not in PrivacyProfiles.PAYLOADS:
+                _skip('service not supported by profiles')
+                continue
+            if services and payload not in services:
+                continue
+
+            row_allowed = bool(row['allowed']) if 'allowed' in row else row.get('auth_value') in TCC_ALLOWED_AUTH_VALUES
+            if row_allowed != allowed:
+                continue
+            if allowed and payload in PrivacyProfiles.DENY_PAYLOADS:
+                _skip('service can only be denied by profiles')
+                continue
 
+            try:
+                sending_app = _app(row['client'], row['client_type'], row.get('csreq'))
+                receiving_app = False
+                if payload == 'AppleEvents':
+                    receiving_app = _app(row.get('indirect_object_identifier'), row.get('indirect_object_identifier_type'),
+                                         row.get('indirect_object_code_identity'))
+            except (CodeSignatureException, struct.error):
+                _skip('no readable code requirement')
+                continue
+
+            app_lists.setdefault(payload, OrderedDict())[AppEntry(sending_app_path=sending_app, receiving_app_path=receiving_app)] = True
+    finally:
+        reader.sqlite.disconnect(reader.tcc_db)
+
+    return OrderedDict((payload, list(entries)) for payload, entries in app_lists.items()), inspections, skipped
+
+
+def build_tcc_db(args, cache=None):
+    """Builds a profile from the rows of the --from-tccdb TCC.db that match --allow, without running codesign.
+    Returns True if the profile was written."""
+    import tccdbRead  # Only imported when a TCC.db is read
+
+    try:
+        app_lists, inspections, skipped = read_tcc_db(args.from_tccdb, allowed=args.allow_app, services=args.scan_services)
+    except (sqlite3.DatabaseError, tccdbRead.TCCDatabaseException) as e:
+        raise TCCProfileException('Unable to read {}: {}'.format(args.from_tccdb, e))
+    for reason, count in sorted(skipped.items()):
+        print('Skipped {} rows: {}'.format(count, reason), file=sys.stderr)
+    if not app_lists:
+        raise TCCProfileException('No {} rows in {} can be added to a profile.'.format('allowed' if args.allow_app else 'denied', args.from_tccdb))
+
+    tcc_profile = profile_from_args(args, cache=cache, inspections=inspections, set_services=False)
+    tcc_profile.set_app_entries(app_lists)
+    tcc_profile.build_profile(allow=args.allow_app)
     tcc_profile.write()
 
+    return True
+
+
+def read_profile(filepath):
+    """Returns the dict of a profile. Signed profiles are decoded with `security cms -D`.
+    Raises PrivacyProfilesException if the file can't be read, or doesn't have the structure of a profile."""
+    try:
+        return check_profile(read_plist(filepath), filepath)
+    except PrivacyProfilesException:
+        raise
+    except Exception as e:
+        error = e
+
+    # Signed profiles are DER encoded CMS messages, which start with a SEQUENCE tag
+    with open(filepath, 'rb') as f:
+        signed = f.read(1) == b'\x30'
+
+    if signed:
+        returncode, result, _ = run_command([PrivacyProfiles.SECURITY, 'cms', '-D', '-i', filepath])
+        if returncode == 0:
+            try:
+                profile = plistlib.loads(result) if hasattr(plistlib, 'loads') else plistlib.readPlistFromString(result)
+            except Exception as e:
+                error = e
+            else:
+                return check_profile(profile, filepath)
+
+    raise PrivacyProfilesException('Unable to read the profile {}: {}'.format(filepath, error))
+
+
+def check_profile(profile, filepath):
+    """Returns profile if it is a dict, with a PayloadContent list of dicts, each with a Services dict of lists of
+    entry dicts, if it has any. Otherwise raises PrivacyProfilesException."""
+    def _invalid(reason):
+        return PrivacyProfilesException('Unable to read the profile {}: {}'.format(filepath, reason))
+
+    if not isinstance(profile, dict):
+        raise _invalid('the profile is not a dict')
+
+    payloads = profile.get('PayloadContent') or []
+    if not isinstance(payloads, list):
+        raise _invalid('PayloadContent is not an array')
+
+    for index, payload in enumerate(payloads):
+        if not isinstance(payload, dict):
+            raise _invalid('PayloadContent[{}] is not a dict'.format(index))
+
+        services = payload.get('Services') or {}
+        if not isinstance(services, dict):
+            raise _invalid('the Services of PayloadContent[{}] is not a dict'.format(index))
+        for service, entries in services.items():
+            if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+                raise _invalid('the {} service of PayloadContent[{}] is not an array of dicts'.format(service, index))
+
+    return profile
+
+
+def profile_index(profile):
+    """Returns the fields and Services entries of a profile, for comparing against another profile.
+    Fields are the keys of the profile and its payload other than the UUIDs, keyed by path. The PayloadIdentifier of the
+    payload has the PayloadUUID removed. Entries are keyed by service_entry_key(), with a count added to any repeated keys."""
+    fields = OrderedDict()
+    entries = OrderedDict()
+
+    for key, value in profile.items():
+        if key not in ['PayloadContent', 'PayloadUUID']:
+            fields[key] = value
+
+    for index, payload in enumerate(profile.get('PayloadContent') or []):
+        payload_uuid = payload.get('PayloadUUID')
+        for key, value in payload.items():
+            if key in ['Services', 'PayloadUUID']:
+                continue
+            if key == 'PayloadIdentifier' and payload_uuid and isinstance(value, type(payload_uuid)) and value.endswith('.' + payload_uuid):
+                value = value[:-len(payload_uuid) - 1]
+            fields['PayloadContent[{}].{}'.format(index, key)] = value
+
+        for service, service_entries in (payload.get('Services') or {}).items():
+            for entry in service_entries:
+                key = service_entry_key(service, entry)
+                count = 1
+                while key + (count,) in entries:
+                    count += 1
+                entries[key + (count,)] = entry
+
+    return fields, entries
+
+
+def _changed_fields(a, b):
+    """Returns (field, a value, b value) for every field that differs between two dicts, in sorted field order."""
+    return [(field, a.get(field), b.get(field)) for field in sorted(set(a) | set(b)) if a.get(field) != b.get(field)]
+
+
+def diff_profiles(a, b):
+    """Returns the differences between two profile dicts, ignoring UUIDs. Each profile is indexed once, so this is linear
+    in the number of Services entries. Returns a dict of:
+        fields: (field, a value, b value) for each changed profile or payload key
+        added, removed: (key, entry) for each Services entry only in b or a
+        changed: (key, [(field, a value, b value)]) for each Services entry that differs"""
+    a_fields, a_entries = profile_index(a)
+    b_fields, b_entries = profile_index(b)
+
+    return {
+        'fields': _changed_fields(a_fields, b_fields),
+        'added': [(key, entry) for key, entry in b_entries.items() if key not in a_entries],
+        'removed': [(key, entry) for key, entry in a_entries.items() if key not in b_entries],
+        'changed': [(key, _changed_fields(entry, b_entries[key])) for key, entry in a_entries.items()
+                    if key in b_entries and entry != b_entries[key]],
+    }
+
+
+def find_profiles(root):
+    """Returns a dict of the path of every .mobileconfig under root, keyed by its path relative to root."""
+    profiles = dict()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith('.mobileconfig'):
+                path = os.path.join(dirpath, filename)
+                profiles[os.path.relpath(path, root)] = path
+    return profiles
+
+
+def profile_pairs(a_path, b_path):
+    """Returns (name, a file, b file) for the profiles to diff. If both paths are directories, every .mobileconfig under
+    them is paired by its relative path, and a file only in one directory is paired with None."""
+    if not (os.path.isdir(a_path) and os.path.isdir(b_path)):
+        return [(b_path, a_path, b_path)]
+
+    a_profiles = find_profiles(a_path)
+    b_profiles = find_profiles(b_path)
+
+    return [(name, a_profiles.get(name), b_profiles.get(name)) for name in sorted(set(a_profiles) | set(b_profiles))]
+
+
+def _entry_name(key):
+    """Returns a readable name for a Services entry key."""
+    service, identifier, receiver, count = key
+    name = '{} {}'.format(service, identifier)
+    if receiver is not None:
+        name = '{} -> {}'.format(name, receiver)
+    if count > 1:
+        name = '{} (#{})'.format(name, count)
+
+    return name
+
+
+def _value_string(value):
+    """Returns a value as it is shown in the text diff."""
+    if isinstance(value, (str, type(u''))):
+        return json.dumps(value)
+
+    return str(value)
+
+
+def format_diff(name, differences):
+    """Returns the lines of the text diff for a profile."""
+    lines = ['--- {}'.format(name)]
+    for field, a_value, b_value in differences['fields']:
+        lines.append('  {}: {} -> {}'.format(field, _value_string(a_value), _value_string(b_value)))
+    for key, entry in differences['removed']:
+        lines.append('- {}'.format(_entry_name(key)))
+    for key, entry in differences['added']:
+        lines.append('+ {}'.format(_entry_name(key)))
+    for key, fields in differences['changed']:
+        lines.append('~ {}'.format(_entry_name(key)))
+        for field, a_value, b_value in fields:
+            lines.append('    {}: {} -> {}'.format(field, _value_string(a_value), _value_string(b_value)))
+
+    return lines
+
+
+def diff_main(argv):
+    """Compares two profiles, or two directories of profiles, and prints the differences.
+    Returns 0 if there are no differences, 1 if there are, and 2 if a profile can't be read."""
+    parser = argparse.ArgumentParser(prog='tccprofile.py diff',
+                                     description='Show the differences between two profiles, or two directories of profiles, '
+                                                 'ignoring PayloadUUIDs. Services entries are matched by service, Identifier and AEReceiverIdentifier.')
+    parser.add_argument('a', metavar='<a.mobileconfig|dir>', help='The original profile, or directory of profiles.')
+    parser.add_argument('b', metavar='<b.mobileconfig|dir>', help='The new profile, or directory of profiles.')
+    parser.add_argument('--json', action='store_true', dest='json', default=False, help='Output the differences as JSON.')
+    args = parser.parse_args(argv)
+
+    results = list()
+    status = 0
+    for name, a_file, b_file in profile_pairs(args.a, args.b):
+        if a_file is None or b_file is None:
+            results.append({'profile': name, 'only_in': args.b if a_file is None else args.a})
+            status = max(status, 1)
+            continue
+
+        try:
+            differences = diff_profiles(read_profile(a_file), read_profile(b_file))
+        except (PrivacyProfilesException, EnvironmentError) as e:
+            results.append({'profile': name, 'error': str(e)})
+            status = 2
+            continue
+
+        if any(differences.values()):
+            results.append({'profile': name, 'differences': differences})
+            status = max(status, 1)
+
+    if args.json:
+        output = list()
+        for result in results:
+            if 'differences' in result:
+                differences = result.pop('differences')
+                result['fields'] = [{'field': field, 'a': a_value, 'b': b_value} for field, a_value, b_value in differences['fields']]
+                for kind in ['added', 'removed']:
+                    result[kind] = [dict(entry, Service=key[0]) for key, entry in differences[kind]]
+                result['changed'] = [{'service': key[0], 'identifier': key[1], 'receiver': key[2],
+                                      'fields': [{'field': field, 'a': a_value, 'b': b_value} for field, a_value, b_value in fields]}
+                                     for key, fields in differences['changed']]
+            output.append(result)
+        print(json.dumps(output, indent=2, sort_keys=True, default=str))
+    else:
+        for result in results:
+            if 'only_in' in result:
+                print('Only in {}: {}'.format(result['only_in'], result['profile']))
+            elif 'error' in result:
+                print('Error: {}'.format(result['error']), file=sys.stderr)
+            else:
+                print('\n'.join(format_diff(result['profile'], result['differences'])))
+
+    return status
+
+
+def load_profiles(paths, jobs=PrivacyProfiles.DEFAULT_JOBS):
+    """Returns (name, profile dict or exception) for each profile file, and each .mobileconfig under each directory, in
+    paths. Profiles are read by jobs threads, as signed profiles each need a `security` call."""
+    files = list()
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(profile for _, profile in sorted(find_profiles(path).items()))
+        else:
+            files.append(path)
+
+    def _read(filepath):
+        try:
+            return filepath, read_profile(filepath)
+        except (PrivacyProfilesException, EnvironmentError) as e:
+            return filepath, e
+
+    if jobs > 1 and len(files) > 1:
+        from multiprocessing.pool import ThreadPool  # Only imported when needed, as it's slow to import
+
+        pool = ThreadPool(min(jobs, len(files)))
+        try:
+            return pool.map(_read, files)
+        finally:
+            pool.close()
+            pool.join()
+
+    return [_read(filepath) for filepath in files]
+
+
+def coverage_index(profiles):
+    """Returns a dict of service_entry_key() to [(profile name, entry), ...] for the Services entries of every profile,
+    given as (name, profile dict) pairs. The profiles are from read_profile, which has checked their structure."""
+    index = dict()
+    for name, profile in profiles:
+        for payload in profile.get('PayloadContent') or []:
+            for service, entries in (payload.get('Services') or {}).items():
+                for entry in entries:
+                    index.setdefault(service_entry_key(service, entry), list()).append((name, entry))
+
+    return index
+
+
+def _entry_allowed(entry):
+    """Returns whether a Services entry allows access. Newer profiles use Authorization instead of Allowed."""
+    if 'Allowed' in entry:
+        return bool(entry['Allowed'])
+    return entry.get('Authorization') in ['Allow', 'AllowStandardUserToSetSystemService']
+
+
+def _same_requirement(csreq, requirement, decoded):
+    """Returns False if the requirement decoded from a csreq blob differs from a profile's CodeRequirement. A blob that
+    is missing or can't be decoded is not held against the profile. decoded is a dict of the requirements already
+    decoded, keyed by blob, as the same client usually has the same blob for every service."""
+    if csreq is None or requirement is None:
+        return True
+
+    csreq = bytes(csreq)
+    if csreq not in decoded:
+        try:
+            decoded[csreq] = ' '.join(RequirementDecoder(csreq).decode().split())
+        except (CodeSignatureException, struct.error):
+            decoded[csreq] = None
+
+    return decoded[csreq] is None or decoded[csreq] == ' '.join(requirement.split())
+
+
+def tcc_db_coverage(tcc_db_path, index, services=None):
+    """Yields (status, row, reasons, profile names) for each row of a TCC.db's access table, in one pass, where status is:
+        covered       a profile entry for the service, client and AppleEvents receiver has the same Allowed value and
+                      code requirements
+        contradicted  every profile entry for it differs, and reasons says how
+        uncovered     no profile has an entry for it
+        deny_only     it allows a service that profiles can only deny, so no profile could cover it
+        unsupported   the service can't be managed by profiles
+    row is a dict of service, client, receiver and allowed. Only the given payloads are checked, if services is given."""
+    import tccdbRead  # Only imported when a TCC.db is read
+
+    reader = tccdbRead.ReadTCC(tcc_db_path=tcc_db_path)
+    available = set(reader.table_columns())
+    columns = [column for column in ['service', 'client', 'allowed', 'auth_value', 'csreq', 'indirect_object_identifier',
+                                     'indirect_object_code_identity'] if column in available]
+    decoded = dict()
+
+    try:
+        for values in reader.rows(columns=columns):
+            values = dict(zip(columns, values))
+            service = values['service']
+            payload = service[len(TCC_SERVICE_PREFIX):] if service.startswith(TCC_SERVICE_PREFIX) else service
+            if services and payload not in services:
+                continue
+
+            receiver = values.get('indirect_object_identifier') if payload == 'AppleEvents' else None
+            allowed = bool(values['allowed']) if 'allowed' in values else values.get('auth_value') in TCC_ALLOWED_AUTH_VALUES
+            row = OrderedDict([('service', payload), ('client', values['client']), ('receiver', receiver), ('allowed', allowed)])
+
+            if payload not in PrivacyProfiles.PAYLOADS:
+                yield 'unsupported', row, [], []
+                continue
+
+            entries = index.get((payload, values['client'], receiver))
+            if not entries:
+                yield 'deny_only' if allowed and payload in PrivacyProfiles.DENY_PAYLOADS else 'uncovered', row, [], []
+                continue
+
+            reasons = list()
+            for name, entry in entries:
+                entry_reasons = list()
+                if _entry_allowed(entry) != allowed:
+                    entry_reasons.append('{} in the profile'.format('allowed' if _entry_allowed(entry) else 'denied'))
+                if not _same_requirement(values.get('csreq'), entry.get('CodeRequirement'), decoded):
+                    entry_reasons.append('CodeRequirement differs')
+                if receiver is not None and not _same_requirement(values.get('indirect_object_code_identity'), entry.get('AEReceiverCodeRequirement'), decoded):
+                    entry_reasons.append('AEReceiverCodeRequirement differs')
+                if not entry_reasons:
+                    yield 'covered', row, [], [name]
+                    break
+                reasons.extend(entry_reasons)
+            else:
+                yield 'contradicted', row, sorted(set(reasons)), sorted(set(name for name, _ in entries))
+    finally:
+        reader.sqlite.disconnect(reader.tcc_db)
+
+
+def coverage_main(argv):
+    """Checks which rows of a TCC.db are covered by a set of profiles.
+    Returns 0 if every supported row is covered, 1 if any is uncovered or contradicted, and 2 if a profile can't be read."""
+    parser = argparse.ArgumentParser(prog='tccprofile.py coverage',
+                                     description='Check which rows of a TCC.db are covered by a set of profiles, which contradict them, and which are '
+                                                 'not in any profile. Rows are matched to Services entries by service, Identifier and AEReceiverIdentifier.')
+    parser.add_argument('tcc_db', metavar='<TCC.db>', help='The TCC database to check.')
+    parser.add_argument('profiles', nargs='+', metavar='<profile.mobileconfig|dir>', help='Profiles, or directories of profiles, to check against.')
+    parser.add_argument('--services', nargs='+', dest='services', metavar='<payload>', choices=PrivacyProfiles.PAYLOADS,
+                        help='Only check the rows for these payloads, for example: SystemPolicyAllFiles Accessibility')
+    parser.add_argument('--show-covered', action='store_true', dest='show_covered', default=False, help='Also list the covered rows.')
+    parser.add_argument('--json', action='store_true', dest='json', default=False, help='Output the results as JSON.')
+    parser.add_argument('-j', '--jobs', type=int, default=PrivacyProfiles.DEFAULT_JOBS, metavar='N',
+                        help='Number of profiles to read concurrently. Defaults to {}.'.format(PrivacyProfiles.DEFAULT_JOBS))
+    args = parser.parse_args(argv)
+
+    status = 0
+    profiles = list()
+    for name, profile in load_profiles(args.profiles, jobs=args.jobs):
+        if isinstance(profile, Exception):
+            print('Error: {}'.format(profile), file=sys.stderr)
+            status = 2
+        else:
+            profiles.append((name, profile))
+    index = coverage_index(profiles)
+
+    if not os.path.isfile(args.tcc_db):
+        print('Error: {} does not exist'.format(args.tcc_db), file=sys.stderr)
+        return 2
+
+    counts = OrderedDict((status_name, 0) for status_name in ['covered', 'uncovered', 'contradicted', 'deny_only', 'unsupported'])
+    results = OrderedDict((status_name, list()) for status_name in ['covered', 'uncovered', 'contradicted'])
+
+    import tccdbRead  # Only imported when a TCC.db is read
+    try:
+        for row_status, row, reasons, names in tcc_db_coverage(args.tcc_db, index, services=args.services):
+            counts[row_status] += 1
+            if row_status in ['deny_only', 'unsupported'] or (row_status == 'covered' and not args.show_covered):
+                continue
+
+            if args.json:
+                result = OrderedDict(row)
+                if names:
+                    result['profiles'] = names
+                if reasons:
+                    result['reasons'] = reasons
+                results[row_status].append(result)
+            else:
+                name = '{} {}'.format(row['service'], row['client'])
+                if row['receiver'] is not None:
+                    name = '{} -> {}'.format(name, row['receiver'])
+                line = '{:<13}{} ({})'.format(row_status.upper(), name, 'allowed' if row['allowed'] else 'denied')
+                if reasons:
+                    line = '{}: {}'.format(line, ', '.join(reasons))
+                if names:
+                    line = '{} [{}]'.format(line, ', '.join(names))
+                print(line)
+    except (sqlite3.DatabaseError, tccdbRead.TCCDatabaseException) as e:
+        print('Error: Unable to read {}: {}'.format(args.tcc_db, e), file=sys.stderr)
+        return 2
+
+    if counts['uncovered'] or counts['contradicted']:
+        status = max(status, 1)
+
+    if args.json:
+        if not args.show_covered:
+            del results['covered']
+        results['summary'] = OrderedDict([('profiles', len(profiles))] + list(counts.items()))
+        print(json.dumps(results, indent=2, default=str))
+    else:
+        print('{} profiles: {} covered, {} uncovered, {} contradicted, {} allowed but can only be denied by profiles, '
+              '{} not supported by profiles'.format(len(profiles), counts['covered'], counts['uncovered'], counts['contradicted'],
+                                                    counts['deny_only'], counts['unsupported']), file=sys.stderr)
+
+    return status
+
+
+def main():
+    if len(sys.argv) == 1:
+        launch_gui()
+        sys.exit(0)
+    elif sys.argv[1] == 'diff':
+        sys.exit(diff_main(sys.argv[2:]))
+    elif sys.argv[1] == 'coverage':
+        sys.exit(coverage_main(sys.argv[2:]))
+    elif sys.argv[1] == 'serve':
+        # Imported here so the HTTP server modules are only loaded when serving
+        import tccprofile_serve
+        sys.exit(tccprofile_serve.main(sys.argv[2:]))
+    else:
+        args = parse_args()
+
+        # if args.launch_gui:
+        #     launch_gui(args)
+
+    if args.trace or args.timings:
+        TRACER.enable()
+
+    cache = None if args.no_cache else CodeSignCache(cache_dir=args.cache_dir)
+
+    try:
+        if args.manifest:
+            succeeded = build_manifest(args.manifest, cache=cache, jobs=args.jobs)
+        elif args.scan:
+            succeeded = build_scan(args, cache=cache)
+        elif args.from_tccdb:
+            succeeded = build_tcc_db(args, cache=cache)
+        else:
+            tcc_profile = profile_from_args(args, cache=cache)
+
+            # Iterate over the payloads dict to build payloads
+            tcc_profile.build_profile(allow=args.allow_app)
+
+            tcc_profile.write()
+            if tcc_profile._previous_filename:
+                print(tcc_profile.update_summary(), file=sys.stderr)
+            succeeded = True
+    except (PrivacyProfilesException, TCCProfileException) as e:
+        print(e)
+        succeeded = False
+    finally:
+        if cache:
+            cache.close()
+
+        if args.trace:
+            TRACER.write_trace(args.trace)
+        if args.timings:
+            print(TRACER.timings(), file=sys.stderr)
+
+    if not succeeded:
+        sys.exit(1)
+
 
 if __name__ == '__main__':
+    # tccprofile_gui and tccprofile_serve import this module by name. Make that this module, rather than a second copy
+    # with its own exception classes and class attributes such as PrivacyProfiles.CODESIGN.
+    sys.modules.setdefault('tccprofile', sys.modules[__name__])
     main()
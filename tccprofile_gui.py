@@ -0,0 +1,601 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""GUI for tccprofile.py. This is kept separate so the Tkinter and AppKit imports are only loaded when the GUI is launched."""
+
+# pylint: disable=line-too-long
+# pylint: disable=superfluous-parens
+from __future__ import absolute_import, print_function
+
+import errno
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+# Tkinter
+try:
+    # Python 3
+    import queue
+    import tkinter as tk
+    from tkinter import ttk
+    from tkinter import filedialog as tkFileDialog
+except ImportError:
+    # Python 2
+    import Queue as queue
+    import Tkinter as tk
+    import ttk
+    import tkFileDialog
+
+# PyLint cannot properly find names inside Cocoa libraries, so issues bogus
+# No name 'Foo' in module 'Bar' warnings. Disable them.
+# pylint: disable=E0611
+import AppKit
+# pylint: enable=E0611
+
+from tccprofile import BuildCancelledException, CodeSignCache, PrivacyProfiles
+
+
+class App(tk.Frame):
+    POLL_INTERVAL = 100  # Milliseconds between checks for messages from the build and identity threads
+    IDENTITIES_CACHE_FILENAME = 'signing_identities.json'  # Stored in the same directory as the code sign requirements cache
+    IDENTITIES_TTL = 300  # Seconds the cached signing identities are used for without being listed again
+
+    def __init__(self, master):
+        tk.Frame.__init__(self, master)
+        self.pack()
+        self.master.title("TCC Profile Generator")
+        self.master.resizable(False, False)
+        self.master.tk_setPalette(background='#ececec')
+
+        self.master.protocol('WM_DELETE_WINDOW', self.click_quit)
+        self.master.bind('<Return>', self.click_save)
+
+        x = (self.master.winfo_screenwidth() - self.master.winfo_reqwidth()) // 2
+        y = (self.master.winfo_screenheight() - self.master.winfo_reqheight()) // 4
+        self.master.geometry("+{}+{}".format(x, y))
+
+        self.master.config(menu=tk.Menu(self.master))
+
+        # Payload Details UI
+
+        payload_frame = tk.Frame(self)
+        payload_frame.pack(padx=15, pady=15, fill=tk.BOTH)
+
+        tk.Label(
+            payload_frame,
+            text='Payload Details',
+            font=('System', 18)
+        ).grid(row=0, column=0, columnspan=5, sticky='w')
+
+        tk.Label(payload_frame, text="Name").grid(
+            row=1, column=0, sticky='w'
+        )
+        self._payload_name = tk.Entry(payload_frame, bg='white', width=30)
+        self._payload_name.insert(0, 'TCC Whitelist')
+        self._payload_name.grid(row=2, column=0, columnspan=2, sticky='we')
+
+        # This is an empty spacer for the grid layout of the frame
+        tk.Label(
+            payload_frame,
+            text='',
+            width=6
+        ).grid(row=1, column=2)
+
+        tk.Label(payload_frame, text="Organization").grid(
+            row=1, column=3, sticky='w'
+        )
+        self._payload_org = tk.Entry(payload_frame, bg='white', width=30)
+        self._payload_org.insert(0, 'My Org Name')
+        self._payload_org.grid(row=2, column=3, columnspan=2, sticky='we')
+
+        tk.Label(payload_frame, text="Identifier").grid(
+            row=3, column=0, sticky='w'
+        )
+        self._payload_id = tk.Entry(payload_frame, bg='white')
+        self._payload_id.insert(0, 'com.my.tccprofile')
+        self._payload_id.grid(row=4, column=0, columnspan=2, sticky='we')
+
+        tk.Label(payload_frame, text="Description").grid(
+            row=5, column=0, sticky='w'
+        )
+        self._payload_desc = tk.Entry(payload_frame, bg='white')
+        self._payload_desc.insert(0, 'TCC Whitelist for various applications')
+        self._payload_desc.grid(row=6, column=0, columnspan=5, sticky='we')
+
+        self._payload_sign = tk.StringVar()
+        self._payload_sign.set('No')
+
+        tk.Label(payload_frame, text="Sign Profile?").grid(
+            row=7, column=0, sticky='e'
+        )
+
+        # Listing the signing identities can take seconds, so start with the cached list (if any) and refresh it in the
+        # background unless the cache is still fresh
+        identities, fresh = self._cached_signing_certs()
+        self._sign_menu = tk.OptionMenu(
+            payload_frame,
+            self._payload_sign,
+            *(identities or ['No'])
+        )
+        self._sign_menu.grid(row=7, column=1, columnspan=4, sticky='we')
+
+        self._identities_queue = queue.Queue()
+        if not fresh:
+            identities_thread = threading.Thread(target=self._load_signing_certs)
+            identities_thread.daemon = True
+            identities_thread.start()
+            self.after(self.POLL_INTERVAL, self._poll_signing_certs)
+
+        # UI Feedback Section
+
+        feedback_frame = tk.Frame(self)
+        feedback_frame.pack(padx=15, fill=tk.BOTH)
+
+        self._feedback_label = tk.Label(
+            feedback_frame,
+            font=("System", 12, "italic"),
+            fg='red'
+        )
+        self._feedback_label.grid(row=0, column=0, sticky='we')
+
+        # Shown while a profile is being built, with one step per app
+        self._progress = ttk.Progressbar(
+            feedback_frame,
+            orient='horizontal',
+            mode='determinate',
+            length=400
+        )
+
+        # The build runs on a background thread, which sends ('progress', done, total), ('done', filename),
+        # ('error', message) and ('cancelled',) messages back through this queue
+        self._build_queue = queue.Queue()
+        self._build_thread = None
+        self._cancel_build = threading.Event()
+
+        # Services UI
+
+        services_frame = tk.Frame(self)
+        services_frame.pack(padx=15, pady=15, fill=tk.BOTH)
+
+        self._services_target_var = tk.StringVar()
+        self._services_target_var_display = tk.StringVar()
+
+        tk.Label(
+            services_frame,
+            text='Setup Service Permissions',
+            font=('System', 18)
+        ).grid(row=0, column=0, columnspan=5, sticky='w')
+
+        tk.Label(services_frame, text="Target App...").grid(
+            row=1, column=0, sticky='w'
+        )
+        self.app_env_source_btn = tk.Button(
+            services_frame,
+            text='Choose...',
+            command=lambda: self._app_picker('_services_target_var')
+        )
+        self.app_env_source_btn.grid(row=2, column=0, sticky='w')
+
+        tk.Label(
+            services_frame,
+            textvariable=self._services_target_var_display,
+            width=20
+        ).grid(row=2, column=1, sticky='w')
+
+        self._available_services = {
+            'AddressBook': True,
+            'Calendar': True,
+            'Reminders': True,
+            'Photos': True,
+            'Camera': False,
+            'Microphone': False,
+            'Accessibility': True,
+            'PostEvent': True,
+            'SystemPolicyAllFiles': True,
+            'SystemPolicySysAdminFiles': True
+        }
+
+        self._selected_service = tk.StringVar()
+        self._selected_service.set('AddressBook')
+
+        tk.Label(services_frame, text="Service...").grid(
+            row=1, column=2, sticky='w'
+        )
+        tk.OptionMenu(
+            services_frame,
+            self._selected_service,
+            *sorted([i for i in self._available_services.keys()])
+        ).grid(row=2, column=2, sticky='w')
+
+        # This is an empty spacer for the grid layout of the frame
+        tk.Label(
+            services_frame,
+            text='',
+            width=14
+        ).grid(row=2, column=3)
+
+        tk.Button(
+            services_frame,
+            text='Add +',
+            command=self._add_service
+        ).grid(row=2, column=4, sticky='e')
+
+        self.services_table = ttk.Treeview(
+            services_frame,
+            columns=('target', 'service', 'allow_deny'),
+            height=5
+        )
+        self.services_table['show'] = 'headings'
+
+        self.services_table.heading('target', text='Target')
+
+        self.services_table.heading('service', text='Service')
+        self.services_table.column('service', anchor='center')
+
+        self.services_table.heading('allow_deny', text='Allow/Deny')
+        self.services_table.column('allow_deny', anchor='center')
+
+        self.services_table.grid(row=3, column=0, columnspan=5, sticky='we')
+
+        tk.Button(
+            services_frame,
+            text='Remove -',
+            command=lambda: self._remove_table_item('services_table')
+        ).grid(row=4, column=4, sticky='e')
+
+        # Apple Events UI
+
+        apple_events_frame = tk.Frame(self)
+        apple_events_frame.pack(padx=15, pady=15, fill=tk.BOTH)
+
+        self._app_env_source_var = tk.StringVar()
+        self._app_env_target_var = tk.StringVar()
+        self._app_env_source_var_display = tk.StringVar()
+        self._app_env_target_var_display = tk.StringVar()
+
+        tk.Label(
+            apple_events_frame,
+            text='Setup Apple Events',
+            font=('System', 18)
+        ).grid(row=0, column=0, columnspan=5, sticky='w')
+
+        tk.Label(apple_events_frame, text="Source App...").grid(
+            row=1, column=0, sticky='w'
+        )
+
+        self.app_env_source_btn = tk.Button(
+            apple_events_frame,
+            text='Choose...',
+            command=lambda: self._app_picker('_app_env_source_var')
+        )
+        self.app_env_source_btn.grid(row=2, column=0, sticky='w')
+
+        tk.Label(
+            apple_events_frame,
+            textvariable=self._app_env_source_var_display,
+            width=20
+        ).grid(row=2, column=1, sticky='w')
+
+        tk.Label(apple_events_frame, text="Target App...").grid(
+            row=1, column=2, sticky='w'
+        )
+
+        self.app_env_target_btn = tk.Button(
+            apple_events_frame,
+            text='Choose...',
+            command=lambda: self._app_picker('_app_env_target_var')
+        )
+        self.app_env_target_btn.grid(row=2, column=2, sticky='w')
+
+        tk.Label(
+            apple_events_frame,
+            textvariable=self._app_env_target_var_display,
+            width=20
+        ).grid(row=2, column=3, sticky='w')
+
+        tk.Button(
+            apple_events_frame,
+            text='Add +',
+            command=self._add_apple_event
+        ).grid(row=2, column=4, sticky='e')
+
+        self.app_env_table = ttk.Treeview(
+            apple_events_frame, columns=('source', 'target'), height=5
+        )
+        self.app_env_table['show'] = 'headings'
+        self.app_env_table.heading('source', text='Source')
+        self.app_env_table.heading('target', text='Target')
+        self.app_env_table.grid(row=3, column=0, columnspan=5, sticky='we')
+
+        tk.Button(
+            apple_events_frame,
+            text='Remove -',
+            command=lambda: self._remove_table_item('app_env_table')
+        ).grid(row=4, column=4, sticky='e')
+
+        # Bottom frame for "Save' and 'Quit' buttons
+        button_frame = tk.Frame(self)
+        button_frame.pack(padx=15, pady=(0, 15), anchor='e')
+
+        self._save_button = tk.Button(button_frame, text='Save', command=self.click_save)
+        self._save_button.pack(side='right')
+        self._cancel_button = tk.Button(button_frame, text='Cancel', command=self.click_cancel, state='disabled')
+        self._cancel_button.pack(side='right')
+        tk.Button(button_frame, text='Quit', command=self.click_quit).pack(
+            side='right'
+        )
+
+    def click_save(self, event=None):
+        print("The user clicked 'Save'")
+
+        if self._build_thread and self._build_thread.is_alive():
+            return
+
+        payload = dict()
+        payload['Description'] = self._payload_desc.get()
+        payload['Name'] = self._payload_name.get()
+        payload['Identifier'] = self._payload_id.get()
+        payload['Organization'] = self._payload_org.get()
+
+        for k, v in payload.items():
+            if not v:
+                self._feedback_label.config(text="Missing input for '{}'".format(k), fg='red')
+                return
+
+        app_lists = dict()
+
+        for child in self.services_table.get_children():
+            values = self.services_table.item(child)["values"]
+            if not app_lists.get(values[1]):
+                app_lists[values[1]] = {'_apps': list(), 'apps': list()}
+
+            # app_lists[values[1]].append(values[0])
+            app_lists[values[1]]['_apps'].append(values[0])
+
+        for child in self.app_env_table.get_children():
+            if not app_lists.get('AppleEvents'):
+                app_lists['AppleEvents'] = {'_apps': list(), 'apps': list()}
+
+            app_lists['AppleEvents']['_apps'].append(
+                ','.join(self.app_env_table.item(child)["values"])
+            )
+
+        if not any(app_lists.keys()):
+            self._feedback_label.config(text='You must provide at least one '
+                                             'payload type to create a profile!', fg='red')
+            return
+
+        sign = self._payload_sign.get()
+
+        desktop_path = os.path.expanduser('~/Desktop')
+        filename = tkFileDialog.asksaveasfilename(
+            parent=self,
+            defaultextension='.mobileconfig',
+            initialdir=desktop_path,
+            initialfile='tccprofile.mobileconfig',
+            title='Save TCC Profile...'
+        )
+
+        if not filename:
+            return
+
+        # Build on a background thread so the window stays responsive, and poll for its progress
+        self._cancel_build.clear()
+        self._feedback_label.config(text='Checking apps...', fg='black')
+        self._progress['value'] = 0
+        self._progress.grid(row=1, column=0, sticky='we')
+        self._save_button['state'] = 'disabled'
+        self._cancel_button['state'] = 'normal'
+
+        self._build_thread = threading.Thread(target=self._build_profile, args=(payload, app_lists, sign, filename))
+        self._build_thread.daemon = True
+        self._build_thread.start()
+        self.after(self.POLL_INTERVAL, self._poll_build)
+
+    def _build_profile(self, payload, app_lists, sign, filename):
+        """Builds and writes the profile. Runs on the build thread, so only reports back through the queue."""
+        cache = None
+        try:
+            # Opening the cache can fail too, such as when its directory can't be created
+            cache = CodeSignCache()
+            tcc_profile = PrivacyProfiles(
+                payload_description=payload['Description'],
+                payload_name=payload['Name'],
+                payload_identifier=payload['Identifier'],
+                payload_organization=payload['Organization'],
+                profile_removal_password=None,
+                sign_cert=None if sign == 'No' else sign,
+                filename=filename,
+                removal_date=None,
+                timezone=None,
+                cache=cache,
+            )
+
+            tcc_profile.set_services_dict(app_lists)
+            tcc_profile.build_profile(allow=True,
+                                      progress=lambda done, total: self._build_queue.put(('progress', done, total)),
+                                      cancel=self._cancel_build)
+            tcc_profile.write()
+        except BuildCancelledException:
+            self._build_queue.put(('cancelled',))
+        except Exception as e:
+            self._build_queue.put(('error', str(e)))
+        else:
+            self._build_queue.put(('done', filename))
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def _poll_build(self):
+        """Handles the messages from the build thread, and checks again until the build has finished."""
+        finished = False
+        try:
+            while True:
+                message = self._build_queue.get_nowait()
+                if message[0] == 'progress':
+                    self._progress['maximum'] = max(message[2], 1)
+                    self._progress['value'] = message[1]
+                    self._feedback_label.config(text='Checked {} of {} apps'.format(message[1], message[2]), fg='black')
+                elif message[0] == 'done':
+                    self._feedback_label.config(text='Saved {}'.format(os.path.basename(message[1])), fg='black')
+                    finished = True
+                elif message[0] == 'cancelled':
+                    self._feedback_label.config(text='Cancelled', fg='black')
+                    finished = True
+                elif message[0] == 'error':
+                    self._feedback_label.config(text=message[1], fg='red')
+                    finished = True
+        except queue.Empty:
+            pass
+
+        if finished:
+            self._progress.grid_remove()
+            self._save_button['state'] = 'normal'
+            self._cancel_button['state'] = 'disabled'
+        else:
+            self.after(self.POLL_INTERVAL, self._poll_build)
+
+    def click_cancel(self, event=None):
+        print("The user clicked 'Cancel'")
+        self._cancel_build.set()
+        self._cancel_button['state'] = 'disabled'
+        self._feedback_label.config(text='Cancelling...', fg='black')
+
+    def click_quit(self, event=None):
+        print("The user clicked 'Quit'")
+        self._cancel_build.set()
+        self.master.destroy()
+
+    @staticmethod
+    def _list_signing_certs():
+        output = subprocess.check_output(
+            [PrivacyProfiles.SECURITY, 'find-identity', '-p', 'codesigning', '-v']
+        ).decode('utf-8', 'replace').split('\n')
+
+        cert_list = ['No']
+        for i in output:
+            r = re.findall(r'"(.*?)"', i)
+            if r:
+                cert_list.extend(r)
+
+        return cert_list
+
+    @classmethod
+    def _identities_cache_path(cls):
+        return os.path.join(os.path.expanduser(CodeSignCache.DEFAULT_CACHE_DIR), cls.IDENTITIES_CACHE_FILENAME)
+
+    @classmethod
+    def _cached_signing_certs(cls):
+        """Returns the cached list of signing identities and whether it is younger than IDENTITIES_TTL, or (None, False) if there is no cache."""
+        try:
+            with open(cls._identities_cache_path(), 'r') as f:
+                cached = json.load(f)
+            return cached['identities'], time.time() - cached['time'] < cls.IDENTITIES_TTL
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None, False
+
+    @classmethod
+    def _save_signing_certs(cls, identities):
+        """Caches the list of signing identities. The cache is only an optimisation, so failing to write it is ignored."""
+        try:
+            try:
+                os.makedirs(os.path.dirname(cls._identities_cache_path()))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(cls._identities_cache_path(), 'w') as f:
+                json.dump({'time': time.time(), 'identities': identities}, f)
+        except (IOError, OSError):
+            pass
+
+    def _load_signing_certs(self):
+        """Lists the signing identities and caches them. Runs on the identity thread, so only reports back through the
+        queue. None is sent if they can't be listed."""
+        try:
+            identities = self._list_signing_certs()
+        except (OSError, subprocess.CalledProcessError) as e:
+            print('Unable to list signing identities: {}'.format(e))
+            self._identities_queue.put(None)
+            return
+
+        self._save_signing_certs(identities)
+        self._identities_queue.put(identities)
+
+    def _poll_signing_certs(self):
+        """Replaces the signing identities in the menu once they have been listed."""
+        try:
+            identities = self._identities_queue.get_nowait()
+        except queue.Empty:
+            self.after(self.POLL_INTERVAL, self._poll_signing_certs)
+            return
+
+        if identities is None:
+            return
+
+        menu = self._sign_menu['menu']
+        menu.delete(0, 'end')
+        for identity in identities:
+            menu.add_command(label=identity, command=tk._setit(self._payload_sign, identity))
+
+        if self._payload_sign.get() not in identities:
+            self._payload_sign.set('No')
+
+    def _app_picker(self, var_name):
+        app_name = tkFileDialog.askopenfilename(
+            parent=self,
+            # filetypes=[('App', '.app')],
+            initialdir='/Applications',
+            title='Select App'
+        )
+        getattr(self, var_name).set(app_name)
+        getattr(self, var_name + '_display').set(os.path.basename(app_name))
+
+    def _add_apple_event(self):
+        source_app = self._app_env_source_var.get()
+        target_app = self._app_env_target_var.get()
+
+        if not all([source_app, target_app]):
+            print('Source and Target not both provided')
+            return
+
+        self.app_env_table.insert('', 'end', values=(source_app, target_app))
+        self._app_env_target_var.set('')
+        self._app_env_source_var.set('')
+        self._app_env_source_var_display.set('')
+        self._app_env_target_var_display.set('')
+
+    def _add_service(self):
+        target_app = self._services_target_var.get()
+        selected_service = self._selected_service.get()
+        allow_deny = 'Allow' if \
+            self._available_services.get(selected_service) else 'Deny'
+
+        if not target_app:
+            print('Target app not provided')
+            return
+
+        self.services_table.insert(
+            '', 'end',
+            values=(target_app, selected_service, allow_deny)
+        )
+        self._services_target_var.set('')
+        self._services_target_var_display.set('')
+
+    def _remove_table_item(self, table):
+        treeview_obj = getattr(self, table)
+        selected_items = treeview_obj.selection()
+
+        for item in selected_items:
+            treeview_obj.delete(item)
+
+
+def launch_gui(args=None):
+    info = AppKit.NSBundle.mainBundle().infoDictionary()
+    info['LSUIElement'] = True
+
+    root = tk.Tk()
+    app = App(root)
+    AppKit.NSApplication.sharedApplication().activateIgnoringOtherApps_(True)
+    app.mainloop()
@@ -0,0 +1,311 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Long running profile service for tccprofile.py. Profiles are built on request over localhost HTTP or a Unix socket,
+keeping the apps resolved by earlier requests in memory. This is kept separate so the HTTP server modules are only
+loaded when serving.
+
+Requests:
+    POST /profile   A JSON object of profile fields, using the long argument names of tccprofile.py as keys, the same
+                    as a --manifest entry. Only the payloads, --allow, the --payload-* fields, --removable,
+                    --removal-date and --timezone are accepted. Add "sign": "Certificate Name" to sign the profile.
+                    Returns the profile.
+    GET /stats      Returns JSON with the number of requests, their latency, and the hit rate of the resolved apps.
+"""
+
+# pylint: disable=line-too-long
+from __future__ import absolute_import, print_function
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict, deque
+
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+from tccprofile import (__version__, PROFILE_FIELDS, AppInspection, CodeSignCache, PrivacyProfiles, PrivacyProfilesException,
+                        TCCProfileException, manifest_entry_arguments, parse_args, percentile, profile_from_args)
+
+
+class InspectionCache(object):
+    """In-memory LRU of resolved apps, shared by every request. Holds at most max_entries AppInspections, evicting the
+    least recently used. An entry is only used while the app's fingerprint, from PrivacyProfiles._app_fingerprint(), is
+    unchanged, so an app that is updated or re-signed in place is resolved again."""
+    MAX_ENTRIES = 1000
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (path, override_path): (fingerprint, AppInspection), least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(path, mimetype):
+        return PrivacyProfiles._app_fingerprint(path, mimetype=mimetype) if path else None
+
+    def get(self, app):
+        """Returns the AppInspection for app, or None if it isn't cached or the app has changed."""
+        with self._lock:
+            entry = self._entries.get(app)
+        # Fingerprinted outside the lock, as it reads the app, with the mimetype of the cached inspection, so a script's
+        # interpreter is included. If the script has become a different type of file its own fingerprint differs.
+        fingerprint = self._fingerprint(app[0], entry[1].mimetype) if entry is not None else None
+        with self._lock:
+            # Unless another request has replaced the entry meanwhile, it is either stale or now the most recently used
+            if entry is not None and self._entries.get(app) is entry:
+                del self._entries[app]
+                if fingerprint is not None and entry[0] == fingerprint:
+                    self._entries[app] = entry
+                    self.hits += 1
+                    return entry[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, app, inspection):
+        """Caches the AppInspection for app, evicting the least recently used entries past max_entries. The fingerprint
+        taken when the app was inspected is used, so a change made while it was being resolved isn't missed."""
+        fingerprint = inspection.fingerprint if app[0] else None
+        if fingerprint is None:
+            return
+
+        with self._lock:
+            self._entries.pop(app, None)
+            self._entries[app] = (fingerprint, inspection)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / float(lookups), 4) if lookups else None,
+            }
+
+
+class ProfileService(object):
+    """Builds profiles from JSON requests, sharing the resolved apps and the requirements cache between requests."""
+    LATENCY_SAMPLES = 1000  # Number of recent requests the latency percentiles are calculated from
+
+    # The only fields a request can use. Anything else, such as --update or --output, refers to files or settings of
+    # the server rather than the profile, so is rejected.
+    PROFILE_FIELDS = PROFILE_FIELDS
+
+    def __init__(self, cache=None, jobs=PrivacyProfiles.DEFAULT_JOBS, max_entries=InspectionCache.MAX_ENTRIES):
+        self.inspections = InspectionCache(max_entries=max_entries)
+        self._cache = cache
+        self._jobs = jobs
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._requests = 0
+        self._errors = 0
+
+    def build(self, entry):
+        """Returns the bytes of the profile described by entry, a dict of profile fields. Signed if entry has a 'sign' field."""
+        if not isinstance(entry, dict):
+            raise TCCProfileException('The request must be a JSON object of profile fields.')
+
+        args = parse_args(manifest_entry_arguments(entry, fields=self.PROFILE_FIELDS) + ['--jobs', str(self._jobs)],
+                          raise_errors=True, allow_abbrev=False)
+
+        # Each request has its own inspections, filled from the shared LRU, so eviction by another request can't
+        # remove an app this profile is using.
+        inspections = dict()
+        tcc_profile = profile_from_args(args, cache=self._cache, inspections=inspections)
+        for app in OrderedDict.fromkeys(tcc_profile._apps_to_inspect()):
+            inspection = self.inspections.get(app)
+            if inspection is not None:
+                inspections[app] = inspection
+
+        try:
+            tcc_profile.build_profile(allow=args.allow_app)
+        finally:
+            # Keep what this request resolved, rather than holding it in one transaction until the server stops
+            if self._cache:
+                self._cache.commit()
+
+        for app, inspection in inspections.items():
+            if isinstance(inspection, AppInspection):
+                self.inspections.put(app, inspection)
+
+        if not args.sign_profile:
+            output = io.BytesIO()
+            tcc_profile.write_to(output)
+            return output.getvalue()
+
+        # Signing works on files, so write the profile to a temporary directory and return the signed copy
+        directory = tempfile.mkdtemp(prefix='tccprofile-serve-')
+        try:
+            tcc_profile._filename = os.path.join(directory, 'profile.mobileconfig')
+            tcc_profile.write()
+            signed = os.path.join(directory, 'profile_Signed.mobileconfig')
+            if not os.path.exists(signed):
+                raise PrivacyProfilesException('Unable to sign the profile with {}'.format(args.sign_profile))
+            with open(signed, 'rb') as f:
+                return f.read()
+        finally:
+            shutil.rmtree(directory)
+
+    def record(self, seconds, error=False):
+        """Records the latency of a request."""
+        with self._lock:
+            self._requests += 1
+            self._errors += 1 if error else 0
+            self._latencies.append(seconds * 1000.0)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests = self._requests
+            errors = self._errors
+
+        return {
+            'uptime_seconds': round(time.time() - self._started, 1),
+            'requests': requests,
+            'errors': errors,
+            'latency_ms': {
+                'samples': len(latencies),
+                'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                'p50': round(percentile(latencies, 50), 3) if latencies else None,
+                'p95': round(percentile(latencies, 95), 3) if latencies else None,
+                'max': round(latencies[-1], 3) if latencies else None,
+            },
+            'inspection_cache': self.inspections.stats(),
+        }
+
+
+class ProfileRequestHandler(BaseHTTPRequestHandler):
+    """Handles the HTTP requests of the profile service."""
+    server_version = 'tccprofile/{}'.format(__version__)
+    MAX_REQUEST_SIZE = 1024 * 1024
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, value):
+        self._send(status, json.dumps(value, indent=2, sort_keys=True).encode('utf-8'))
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/stats':
+            self._send_json(200, self.server.service.stats())
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/profile':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        start = time.time()
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > self.MAX_REQUEST_SIZE:
+                raise TCCProfileException('The request is larger than {} bytes.'.format(self.MAX_REQUEST_SIZE))
+            entry = json.loads(self.rfile.read(length).decode('utf-8'))
+            profile = self.server.service.build(entry)
+        except (PrivacyProfilesException, TCCProfileException, EnvironmentError, ValueError) as e:
+            self.server.service.record(time.time() - start, error=True)
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.server.service.record(time.time() - start, error=True)
+            self._send_json(500, {'error': '{}: {}'.format(type(e).__name__, e)})
+        else:
+            self.server.service.record(time.time() - start)
+            self._send(200, profile, content_type='application/x-apple-aspen-config')
+
+    def address_string(self):
+        # Unix socket clients don't have an address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            sys.stderr.write('{} - [{}] {}\n'.format(self.address_string(), self.log_date_time_string(), format % args))
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, socket_path=None, host='127.0.0.1', port=8642, quiet=False):
+    """Returns a threaded HTTP server for service, listening on a Unix socket if socket_path is given, otherwise on host:port."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Left over from a server that didn't shut down cleanly
+        server = ThreadingUnixHTTPServer(socket_path, ProfileRequestHandler)
+        os.chmod(socket_path, 0o600)  # Only the user running the service can request profiles
+    else:
+        server = ThreadingHTTPServer((host, port), ProfileRequestHandler)
+
+    server.service = service
+    server.quiet = quiet
+
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tccprofile.py serve',
+                                     description='Build profiles on request over localhost HTTP or a Unix socket, keeping resolved apps in memory between requests. '
+                                                 'POST a JSON object of profile fields to /profile, using the long argument names as keys. GET /stats for latency and cache hit rate.')
+    parser.add_argument('--socket', dest='socket_path', metavar='<path>', help='Listen on a Unix socket at this path, instead of localhost HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Defaults to 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8642, help='Port to listen on. Defaults to 8642.')
+    parser.add_argument('--max-apps', type=int, dest='max_apps', default=InspectionCache.MAX_ENTRIES, metavar='N',
+                        help='Maximum number of resolved apps kept in memory. Defaults to {}.'.format(InspectionCache.MAX_ENTRIES))
+    parser.add_argument('-j', '--jobs', type=int, default=PrivacyProfiles.DEFAULT_JOBS, metavar='N',
+                        help='Number of apps to resolve concurrently for each request. Defaults to {}.'.format(PrivacyProfiles.DEFAULT_JOBS))
+    parser.add_argument('--no-cache', action='store_true', dest='no_cache', default=False, help='Do not read or write the code sign requirements cache.')
+    parser.add_argument('--cache-dir', dest='cache_dir', metavar='<path>', help='Directory to store the code sign requirements cache in.')
+    parser.add_argument('--quiet', action='store_true', default=False, help='Do not log each request to stderr.')
+    args = parser.parse_args(argv)
+
+    cache = None if args.no_cache else CodeSignCache(cache_dir=args.cache_dir)
+    service = ProfileService(cache=cache, jobs=args.jobs, max_entries=args.max_apps)
+    server = make_server(service, socket_path=args.socket_path, host=args.host, port=args.port, quiet=args.quiet)
+
+    print('Serving profiles on {}'.format(args.socket_path or 'http://{}:{}'.format(args.host, server.server_address[1])), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket_path and os.path.exists(args.socket_path):
+            os.remove(args.socket_path)
+        if cache:
+            cache.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Tests that PrivacyProfiles sets aside the apps that need codesign while inspecting them, resolves them with batched
+codesign calls, and falls back to a codesign call per path for any a batch couldn't resolve, with the stand-in codesign
+from benchmarks/fixtures.py."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import CodesignDeferredException, PrivacyProfiles, PrivacyProfilesException  # noqa: E402
+
+# Wraps the stand-in codesign, running it for one path at a time. Paths with 'broken' in their name are reported as an
+# invalid signature, and paths with 'noisy' in their name get a warning line first, which isn't attributed to any path.
+CODESIGN_WRAPPER = '''#!{python}
+import os
+import subprocess
+import sys
+
+with open(os.environ['{log_variable}'], 'a') as log:
+    log.write(' '.join(['codesign'] + sys.argv[1:]) + '\\n')
+env = dict(os.environ)
+del env['{log_variable}']
+
+status = 0
+for path in sys.argv[3:]:
+    name = os.path.basename(path.rstrip('/')).lower()
+    if 'noisy' in name:
+        sys.stderr.write('warning: {{}} has a resource fork\\n'.format(name))
+    if 'broken' in name:
+        sys.stderr.write('{{}}: invalid signature (code or signature have been modified)\\n'.format(path))
+        status = 1
+    else:
+        sys.stderr.flush()
+        status = subprocess.call([{codesign!r}, '-dr', '-', path], env=env) or status
+    sys.stderr.flush()
+sys.exit(status)
+'''
+
+
+def requirement(identifier):
+    return 'identifier "{}" and anchor apple generic and certificate leaf[subject.OU] = BENCH000000'.format(identifier)
+
+
+class CodesignBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'tools.log')
+        self.codesign = fixtures.make_fake_tools(os.path.join(self.directory, 'bin'))['codesign']
+        self.original_codesign = PrivacyProfiles.CODESIGN
+        PrivacyProfiles.CODESIGN = self.codesign
+        os.environ[fixtures.LOG_VARIABLE] = self.log
+
+        # An interpreter that isn't a Mach-O binary, so its requirement comes from the stand-in codesign
+        self.interpreter = os.path.join(self.directory, 'bin', 'zsh')
+        with open(self.interpreter, 'w') as f:
+            f.write('interpreter\n')
+
+    def tearDown(self):
+        PrivacyProfiles.CODESIGN = self.original_codesign
+        del os.environ[fixtures.LOG_VARIABLE]
+        shutil.rmtree(self.directory)
+
+    def use_wrapper(self):
+        """Runs the stand-in codesign through CODESIGN_WRAPPER."""
+        path = os.path.join(self.directory, 'bin', 'codesign_wrapper')
+        with open(path, 'w') as f:
+            f.write(CODESIGN_WRAPPER.format(python=sys.executable, log_variable=fixtures.LOG_VARIABLE, codesign=self.codesign))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        PrivacyProfiles.CODESIGN = path
+
+    def make_profile(self, jobs=1):
+        return PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                               payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                               removal_date=None, timezone=None, jobs=jobs)
+
+    def codesign_calls(self):
+        """Returns the paths passed to each codesign call since the last call."""
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            calls = [line.split()[3:] for line in f.read().splitlines()]
+        os.remove(self.log)
+        return calls
+
+    def inspect(self, profile, paths):
+        """Inspects paths, and returns the requirement of each, or the exception raised for it."""
+        profile._inspect_apps(apps=[(path, False) for path in paths])
+        results = [profile._inspections[(path, False)] for path in paths]
+        return [result if isinstance(result, Exception) else result.codesign_result for result in results]
+
+    def test_chunk_attribution(self):
+        app = fixtures.make_app(self.directory, 'App')
+        unsigned = fixtures.make_script(self.directory, 'script', signed=False)
+        missing = os.path.join(self.directory, 'Missing.app')
+
+        # The path codesign can't find is left out, so its own codesign call can report the error
+        self.assertEqual(PrivacyProfiles._codesign_chunk([app, unsigned, missing]),
+                         {app: requirement('com.example.bench.app'), unsigned: None})
+
+    def test_ambiguous_chunk(self):
+        self.use_wrapper()
+        apps = [fixtures.make_app(self.directory, name) for name in ['App', 'Noisy']]
+        broken = fixtures.make_app(self.directory, 'Broken')
+
+        self.assertEqual(PrivacyProfiles._codesign_chunk(apps), {})
+        self.assertEqual(PrivacyProfiles._codesign_chunk([broken, apps[0]]), {apps[0]: requirement('com.example.bench.app')})
+
+        PrivacyProfiles.CODESIGN = os.path.join(self.directory, 'bin', 'missing')
+        self.assertEqual(PrivacyProfiles._codesign_chunk(apps), {})
+
+    def test_deferred_until_batched(self):
+        app = fixtures.make_app(self.directory, 'App')
+        profile = self.make_profile()
+        profile._defer_codesign = True
+
+        with self.assertRaises(CodesignDeferredException) as context:
+            profile._codesign_requirement(app)
+        self.assertEqual(context.exception.path, app)
+        self.assertEqual(self.codesign_calls(), [])
+
+        # A path that has been in a batch isn't deferred again, even if the batch couldn't resolve it
+        profile._codesign_batched.add(app)
+        self.assertEqual(profile._codesign_requirement(app), requirement('com.example.bench.app'))
+        self.assertEqual(self.codesign_calls(), [[app]])
+
+        profile._codesign_results[app] = 'identifier "batched"'
+        self.assertEqual(profile._codesign_requirement(app), 'identifier "batched"')
+        self.assertEqual(self.codesign_calls(), [])
+
+    def test_batched_inspection(self):
+        apps = [fixtures.make_app(self.directory, 'App{}'.format(i)) for i in range(5)]
+        scripts = [fixtures.make_script(self.directory, 'script{}'.format(i), signed=False, interpreter=self.interpreter) for i in range(2)]
+
+        for jobs in [1, 4]:
+            profile = self.make_profile(jobs=jobs)
+            profile.CODESIGN_BATCH_SIZE = 4
+            self.assertEqual(self.inspect(profile, apps + scripts),
+                             [requirement('com.example.bench.app{}'.format(i)) for i in range(5)] + [requirement('zsh')] * 2)
+            self.assertFalse(profile._defer_codesign)
+
+            # The apps and scripts are batched in chunks, then the interpreter of the unsigned scripts is inspected again
+            calls = self.codesign_calls()
+            self.assertEqual(sorted(calls[:2]), sorted([apps[:4], [apps[4]] + scripts]), jobs)
+            self.assertEqual(calls[2:], [[self.interpreter]], jobs)
+
+    def test_single_app_is_not_deferred(self):
+        app = fixtures.make_app(self.directory, 'App')
+        self.assertEqual(self.inspect(self.make_profile(), [app]), [requirement('com.example.bench.app')])
+        self.assertEqual(self.codesign_calls(), [[app]])
+
+    def test_unresolved_paths_fall_back_to_codesign(self):
+        self.use_wrapper()
+        app = fixtures.make_app(self.directory, 'App')
+        broken = fixtures.make_app(self.directory, 'Broken')
+        noisy = fixtures.make_app(self.directory, 'Noisy')
+
+        # codesign reports the error for the broken app itself
+        results = self.inspect(self.make_profile(), [broken, app])
+        self.assertIsInstance(results[0], PrivacyProfilesException)
+        self.assertIn('invalid signature', str(results[0]))
+        self.assertEqual(results[1], requirement('com.example.bench.app'))
+        self.assertEqual(self.codesign_calls(), [[broken, app], [broken]])
+
+        # Nothing in an ambiguous batch is resolved, so every path gets its own codesign call
+        self.assertEqual(self.inspect(self.make_profile(), [app, noisy]), [requirement('com.example.bench.app'), requirement('com.example.bench.noisy')])
+        self.assertEqual(self.codesign_calls(), [[app, noisy], [app], [noisy]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+"""Tests CodeSignCache, and how PrivacyProfiles and the command line use it, with the stand-in codesign from
+benchmarks/fixtures.py."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import CodeSignCache, PrivacyProfiles  # noqa: E402
+
+
+def make_profile(cache, jobs=1):
+    return PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                           payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                           removal_date=None, timezone=None, cache=cache, jobs=jobs)
+
+
+def touch_later(path):
+    """Changes the modification and change times of path, without changing its contents."""
+    later = os.stat(path).st_mtime + 10
+    os.utime(path, (later, later))
+
+
+class CodeSignCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.app = fixtures.make_app(self.directory, 'CacheApp')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit_and_miss(self):
+        cache = CodeSignCache(cache_dir=self.cache_dir)
+        try:
+            self.assertIsNone(cache.get(self.app, 'codesign'))
+            cache.set(self.app, 'codesign', {'requirement': 'identifier "a"', 'signed': True})
+            self.assertEqual(cache.get(self.app, 'codesign'), {'requirement': 'identifier "a"', 'signed': True})
+            self.assertIsNone(cache.get(self.app, 'identifier:'))  # Each kind of value has its own entry
+
+            missing = os.path.join(self.directory, 'Missing.app')
+            cache.set(missing, 'codesign', {'signed': True})
+            self.assertIsNone(cache.get(missing, 'codesign'))
+        finally:
+            cache.close()
+
+        # Entries are kept on disk between runs
+        cache = CodeSignCache(cache_dir=self.cache_dir)
+        try:
+            self.assertEqual(cache.get(self.app, 'codesign'), {'requirement': 'identifier "a"', 'signed': True})
+        finally:
+            cache.close()
+
+    def test_changed_app_is_a_miss(self):
+        executable = os.path.join(self.app, 'Contents/MacOS/CacheApp')
+        code_resources = os.path.join(self.app, 'Contents/_CodeSignature/CodeResources')
+        script = fixtures.make_script(self.directory, 'script')
+
+        cache = CodeSignCache(cache_dir=self.cache_dir)
+        try:
+            # Re-signing in place rewrites the executable and CodeResources, but not Info.plist
+            for changed in [os.path.join(self.app, 'Contents/Info.plist'), executable]:
+                cache.set(self.app, 'codesign', {'signed': True})
+                touch_later(changed)
+                self.assertIsNone(cache.get(self.app, 'codesign'), changed)
+
+            cache.set(self.app, 'codesign', {'signed': True})
+            os.makedirs(os.path.dirname(code_resources))
+            with open(code_resources, 'w') as f:
+                f.write('<plist/>')
+            self.assertIsNone(cache.get(self.app, 'codesign'))
+
+            # Signing a script only adds extended attributes, which changes nothing but its change time
+            cache.set(script, 'codesign', {'signed': False, 'interpreter': '/bin/sh'})
+            time.sleep(0.01)
+            os.chmod(script, 0o700)
+            self.assertIsNone(cache.get(script, 'codesign'))
+        finally:
+            cache.close()
+
+    def test_eviction(self):
+        paths = [fixtures.make_script(self.directory, 'script{}'.format(i)) for i in range(3)]
+        cache = CodeSignCache(cache_dir=self.cache_dir, max_entries=2)
+        try:
+            for path in paths:
+                cache.set(path, 'codesign', {'signed': True})
+                cache.commit()
+
+            # The first entry hasn't been used for longer than max_age, then the least recently used past max_entries go
+            connection = sqlite3.connect(os.path.join(self.cache_dir, CodeSignCache.CACHE_FILENAME))
+            connection.execute('UPDATE codesign SET accessed = ? WHERE path = ?', (time.time() - CodeSignCache.MAX_AGE - 60, paths[0]))
+            connection.execute('UPDATE codesign SET accessed = ? WHERE path = ?', (time.time() - 60, paths[1]))
+            connection.commit()
+            connection.close()
+
+            cache.set(self.app, 'codesign', {'signed': True})
+            cache.evict()
+            self.assertEqual([cache.get(path, 'codesign') is not None for path in paths + [self.app]], [False, False, True, True])
+        finally:
+            cache.close()
+
+    def test_earlier_schema_is_dropped(self):
+        os.makedirs(self.cache_dir)
+        connection = sqlite3.connect(os.path.join(self.cache_dir, CodeSignCache.CACHE_FILENAME))
+        connection.execute('CREATE TABLE codesign (path TEXT NOT NULL, kind TEXT NOT NULL, inode INTEGER, size INTEGER, mtime REAL, '
+                           'version TEXT, value TEXT NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (path, kind))')
+        connection.execute("INSERT INTO codesign VALUES (?, 'codesign', 1, 1, 1.0, NULL, '{}', 1.0)", (self.app,))
+        connection.commit()
+        connection.close()
+
+        cache = CodeSignCache(cache_dir=self.cache_dir)
+        try:
+            self.assertIsNone(cache.get(self.app, 'codesign'))
+            cache.set(self.app, 'codesign', {'signed': True})
+            self.assertEqual(cache.get(self.app, 'codesign'), {'signed': True})
+        finally:
+            cache.close()
+
+
+class ProfileCacheTests(unittest.TestCase):
+    """The entries PrivacyProfiles adds to the cache, and the calls to codesign they save."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tools = fixtures.make_fake_tools(os.path.join(self.directory, 'bin'))
+        self.log = os.path.join(self.directory, 'tools.log')
+        self.original_codesign = PrivacyProfiles.CODESIGN
+        PrivacyProfiles.CODESIGN = self.tools['codesign']
+        os.environ[fixtures.LOG_VARIABLE] = self.log
+        self.cache = CodeSignCache(cache_dir=os.path.join(self.directory, 'cache'))
+
+        # An interpreter that isn't a Mach-O binary, so its requirement comes from the stand-in codesign
+        self.interpreter = os.path.join(self.directory, 'bin', 'zsh')
+        with open(self.interpreter, 'w') as f:
+            f.write('interpreter\n')
+        self.script = fixtures.make_script(self.directory, 'script', signed=False, interpreter=self.interpreter)
+
+    def tearDown(self):
+        self.cache.close()
+        PrivacyProfiles.CODESIGN = self.original_codesign
+        del os.environ[fixtures.LOG_VARIABLE]
+        shutil.rmtree(self.directory)
+
+    def codesign_calls(self):
+        """Returns the paths codesign has been run for since the last call."""
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            calls = [line.split()[-1] for line in f.read().splitlines()]
+        os.remove(self.log)
+        return calls
+
+    def test_unsigned_script_is_cached_by_interpreter(self):
+        requirement = 'identifier "zsh" and anchor apple generic and certificate leaf[subject.OU] = BENCH000000'
+        expected = {'requirement': requirement, 'signed': False, 'interpreter': self.interpreter}
+
+        self.assertEqual(make_profile(self.cache)._get_code_sign_details(self.script), expected)
+        self.assertEqual(self.codesign_calls(), [self.script, self.interpreter])
+        self.assertEqual(self.cache.get(self.script, 'codesign'), {'signed': False, 'interpreter': self.interpreter})
+        self.assertEqual(self.cache.get(self.interpreter, 'codesign'), {'requirement': requirement, 'signed': True})
+
+        self.assertEqual(make_profile(self.cache)._get_code_sign_details(self.script), expected)
+        self.assertEqual(self.codesign_calls(), [])
+
+        # Updating the interpreter only resolves the interpreter again
+        with open(self.interpreter, 'a') as f:
+            f.write('updated\n')
+        self.assertEqual(make_profile(self.cache)._get_code_sign_details(self.script), expected)
+        self.assertEqual(self.codesign_calls(), [self.interpreter])
+
+    def test_changed_shebang_uses_the_new_interpreter(self):
+        make_profile(self.cache)._get_code_sign_details(self.script)
+        self.codesign_calls()
+
+        with open(self.script, 'r+') as f:
+            contents = f.read()
+            f.seek(0)
+            f.write(contents.replace('/zsh\n', '/ksh\n'))
+        ksh = os.path.join(self.directory, 'bin', 'ksh')
+        shutil.copy(self.interpreter, ksh)
+
+        details = make_profile(self.cache)._get_code_sign_details(self.script)
+        self.assertEqual(details['interpreter'], ksh)
+
+
+class CommandLineCacheTests(unittest.TestCase):
+    """--cache-dir and --no-cache, counting the calls to the stand-in codesign."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tools = fixtures.make_fake_tools(os.path.join(self.directory, 'bin'))
+        self.log = os.path.join(self.directory, 'tools.log')
+        self.app = fixtures.make_app(self.directory, 'CacheApp')
+        self.env = dict(os.environ, HOME=self.directory, TCCPROFILE_CODESIGN=self.tools['codesign'])
+        self.env[fixtures.LOG_VARIABLE] = self.log
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, *arguments):
+        """Builds a profile for the app, and returns the number of times codesign was run."""
+        if os.path.exists(self.log):
+            os.remove(self.log)
+        subprocess.check_call([sys.executable, os.path.join(REPO_DIR, 'tccprofile.py'), '--acc', self.app, '--pd', 'Test', '--pi', 'com.example.test',
+                               '--pn', 'Test', '--po', 'Example', '-o', os.path.join(self.directory, 'Test.mobileconfig')] + list(arguments), env=self.env)
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            return len(f.read().splitlines())
+
+    def test_cache_dir(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        self.assertEqual(self.build('--cache-dir', cache_dir), 1)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, CodeSignCache.CACHE_FILENAME)))
+        self.assertEqual(self.build('--cache-dir', cache_dir), 0)
+
+    def test_no_cache(self):
+        self.assertEqual(self.build('--no-cache'), 1)
+        self.assertEqual(self.build('--no-cache'), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'Library')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests that tcc_db_coverage matches the rows of a TCC.db to the Services entries of profiles."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from fixtures import TCC_SCHEMA, requirement_blob  # noqa: E402
+from tccprofile import coverage_index, tcc_db_coverage  # noqa: E402
+
+
+def make_tcc_db(path, rows):
+    """Creates a TCC.db with an access row for each (service, client, allowed, receiver), with the requirement blob
+    'identifier "<client>" and anchor apple'."""
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(TCC_SCHEMA)
+        for service, client, allowed, receiver in rows:
+            indirect = (0, receiver, sqlite3.Binary(requirement_blob(receiver))) if receiver else (0, 'UNUSED', None)
+            connection.execute('INSERT INTO access VALUES ({})'.format(', '.join(['?'] * 12)),
+                               ('kTCCService' + service, client, 0, int(allowed), 0, sqlite3.Binary(requirement_blob(client)), None) + indirect + (0, 1570000000))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def entry(identifier, allowed=True, requirement=None, receiver=None):
+    result = {'Identifier': identifier, 'IdentifierType': 'bundleID', 'Allowed': allowed,
+              'CodeRequirement': requirement or 'identifier "{}" and anchor apple'.format(identifier)}
+    if receiver:
+        result['AEReceiverIdentifier'] = receiver
+        result['AEReceiverIdentifierType'] = 'bundleID'
+        result['AEReceiverCodeRequirement'] = 'identifier "{}" and anchor apple'.format(receiver)
+    return result
+
+
+class CoverageTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tcc_db = os.path.join(self.directory, 'TCC.db')
+        make_tcc_db(self.tcc_db, [
+            ('Accessibility', 'com.example.covered', True, None),
+            ('Accessibility', 'com.example.denied', True, None),
+            ('Accessibility', 'com.example.requirement', True, None),
+            ('Accessibility', 'com.example.uncovered', True, None),
+            ('AppleEvents', 'com.example.covered', True, 'com.apple.finder'),
+            ('AppleEvents', 'com.example.covered', True, 'com.apple.systemevents'),
+            ('Camera', 'com.example.camera', True, None),
+            ('Camera', 'com.example.camera.denied', False, None),
+            ('ScreenCapture', 'com.example.recorder', True, None),
+            ('Siri', 'com.example.siri', True, None),
+        ])
+
+        profile = {'PayloadContent': [{'Services': {
+            'Accessibility': [entry('com.example.covered'), entry('com.example.denied', allowed=False),
+                              entry('com.example.requirement', requirement='identifier "com.example.requirement" and anchor apple generic')],
+            'AppleEvents': [entry('com.example.covered', receiver='com.apple.finder')],
+            'ScreenCapture': [entry('com.example.recorder', allowed=False)],
+        }}]}
+        self.index = coverage_index([('Example.mobileconfig', profile)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def coverage(self, services=None):
+        return dict(((row['service'], row['client'], row['receiver']), (status, reasons, names))
+                    for status, row, reasons, names in tcc_db_coverage(self.tcc_db, self.index, services=services))
+
+    def test_statuses(self):
+        coverage = self.coverage()
+        self.assertEqual(coverage[('Accessibility', 'com.example.covered', None)], ('covered', [], ['Example.mobileconfig']))
+        self.assertEqual(coverage[('Accessibility', 'com.example.denied', None)],
+                         ('contradicted', ['denied in the profile'], ['Example.mobileconfig']))
+        self.assertEqual(coverage[('Accessibility', 'com.example.requirement', None)],
+                         ('contradicted', ['CodeRequirement differs'], ['Example.mobileconfig']))
+        self.assertEqual(coverage[('Accessibility', 'com.example.uncovered', None)], ('uncovered', [], []))
+        self.assertEqual(coverage[('AppleEvents', 'com.example.covered', 'com.apple.finder')][0], 'covered')
+        self.assertEqual(coverage[('AppleEvents', 'com.example.covered', 'com.apple.systemevents')][0], 'uncovered')
+        self.assertEqual(coverage[('Siri', 'com.example.siri', None)][0], 'unsupported')
+
+    def test_deny_only_services(self):
+        coverage = self.coverage()
+        # Profiles can only deny Camera, so an allowed row can't be covered, but a denied one can still be missing
+        self.assertEqual(coverage[('Camera', 'com.example.camera', None)][0], 'deny_only')
+        self.assertEqual(coverage[('Camera', 'com.example.camera.denied', None)][0], 'uncovered')
+        # A profile entry that denies it still contradicts an allowed row
+        self.assertEqual(coverage[('ScreenCapture', 'com.example.recorder', None)][0], 'contradicted')
+
+    def test_services(self):
+        self.assertEqual(sorted(set(key[0] for key in self.coverage(services=['Camera', 'AppleEvents']))), ['AppleEvents', 'Camera'])
+
+
+if __name__ == '__main__':
+    unittest.main()
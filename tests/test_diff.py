@@ -0,0 +1,78 @@
+"""Tests that diff_profiles finds the changed fields and Services entries of two profiles, ignoring UUIDs."""
+
+from __future__ import absolute_import, print_function
+
+import copy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tccprofile import diff_profiles, format_diff  # noqa: E402
+
+
+def profile(payload_uuid, services, name='Example'):
+    return {
+        'PayloadDisplayName': name,
+        'PayloadIdentifier': 'com.example.tcc',
+        'PayloadUUID': payload_uuid.lower(),
+        'PayloadContent': [{
+            'PayloadIdentifier': 'com.example.tcc.{}'.format(payload_uuid),
+            'PayloadUUID': payload_uuid,
+            'PayloadType': 'com.apple.TCC.configuration-profile-policy',
+            'Services': services,
+        }],
+    }
+
+
+def entry(identifier, allowed=True, receiver=None):
+    result = {'Identifier': identifier, 'IdentifierType': 'bundleID', 'Allowed': allowed,
+              'CodeRequirement': 'identifier "{}" and anchor apple'.format(identifier)}
+    if receiver:
+        result['AEReceiverIdentifier'] = receiver
+    return result
+
+
+class DiffProfilesTests(unittest.TestCase):
+    SERVICES = {
+        'Accessibility': [entry('com.example.a'), entry('com.example.b')],
+        'AppleEvents': [entry('com.example.a', receiver='com.apple.finder'), entry('com.example.a', receiver='com.apple.systemevents')],
+    }
+
+    def test_only_uuids_differ(self):
+        differences = diff_profiles(profile('AAAA', self.SERVICES), profile('BBBB', copy.deepcopy(self.SERVICES)))
+        self.assertEqual(differences, {'fields': [], 'added': [], 'removed': [], 'changed': []})
+
+    def test_entries(self):
+        services = copy.deepcopy(self.SERVICES)
+        del services['Accessibility'][1]
+        services['Accessibility'].append(entry('com.example.c'))
+        services['AppleEvents'][1]['Allowed'] = False
+
+        differences = diff_profiles(profile('AAAA', self.SERVICES), profile('BBBB', services, name='Renamed'))
+        self.assertEqual(differences['fields'], [('PayloadDisplayName', 'Example', 'Renamed')])
+        self.assertEqual([key for key, _ in differences['added']], [('Accessibility', 'com.example.c', None, 1)])
+        self.assertEqual([key for key, _ in differences['removed']], [('Accessibility', 'com.example.b', None, 1)])
+        self.assertEqual(differences['changed'], [(('AppleEvents', 'com.example.a', 'com.apple.systemevents', 1), [('Allowed', True, False)])])
+
+        self.assertEqual(format_diff('Example.mobileconfig', differences), [
+            '--- Example.mobileconfig',
+            '  PayloadDisplayName: "Example" -> "Renamed"',
+            '- Accessibility com.example.b',
+            '+ Accessibility com.example.c',
+            '~ AppleEvents com.example.a -> com.apple.systemevents',
+            '    Allowed: True -> False',
+        ])
+
+    def test_repeated_entries(self):
+        services = {'Accessibility': [entry('com.example.a'), entry('com.example.a', allowed=False)]}
+        changed = copy.deepcopy(services)
+        changed['Accessibility'][1]['Allowed'] = True
+
+        differences = diff_profiles(profile('AAAA', services), profile('AAAA', changed))
+        self.assertEqual(differences['changed'], [(('Accessibility', 'com.example.a', None, 2), [('Allowed', False, True)])])
+
+
+if __name__ == '__main__':
+    unittest.main()
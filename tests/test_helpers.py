@@ -0,0 +1,124 @@
+"""Tests that find_helpers finds the signed code nested in an app bundle's HELPER_LOCATIONS, and that include_helpers
+adds it to the app lists after the app it belongs to."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import PrivacyProfiles  # noqa: E402
+
+
+def write(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.chmod(path, 0o755)
+    return path
+
+
+def make_bundle(directory, name, signed=True):
+    """Creates an app bundle, or another kind of bundle if name has an extension other than .app. Returns its path."""
+    base, extension = os.path.splitext(name)
+    app = fixtures.make_app(directory, base, signed=signed)
+    if extension and extension != '.app':
+        os.rename(app, os.path.join(directory, name))
+    return os.path.join(directory, name if extension else app)
+
+
+class FindHelpersTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = fixtures.make_app(self.directory, 'Main', signed=True)
+        contents = os.path.join(self.app, 'Contents')
+        framework = os.path.join(contents, 'Frameworks/Electron Framework.framework')
+
+        self.login_item = make_bundle(os.path.join(contents, 'Library/LoginItems'), 'Login.app')
+        self.login_tool = write(os.path.join(self.login_item, 'Contents/MacOS/login_tool'), fixtures.SIGNED_MACHO)
+        self.service = make_bundle(os.path.join(contents, 'XPCServices'), 'Service.xpc')
+        self.helper = make_bundle(os.path.join(contents, 'Helpers'), 'Helper.app')
+        self.tool = write(os.path.join(contents, 'MacOS/tool'), fixtures.SIGNED_MACHO)
+        self.framework_app = make_bundle(os.path.join(contents, 'Frameworks'), 'Main Helper.app')
+        self.crashpad = write(os.path.join(framework, 'Versions/A/Helpers/chrome_crashpad_handler'), fixtures.SIGNED_MACHO)
+        os.symlink('Versions/A/Helpers', os.path.join(framework, 'Helpers'))
+
+        # Not helpers: unsigned code, scripts, bundles that aren't apps or XPC services, files directly in Frameworks,
+        # other locations, the main executable, and symlinks to a helper already found
+        make_bundle(os.path.join(contents, 'XPCServices'), 'Unsigned.xpc', signed=False)
+        make_bundle(os.path.join(contents, 'Helpers'), 'Plugin.bundle')
+        write(os.path.join(contents, 'MacOS/unsigned'), fixtures.MACHO_HEADER)
+        fixtures.make_script(os.path.join(contents, 'MacOS'), 'script')
+        write(os.path.join(contents, 'Frameworks/libhelper.dylib'), fixtures.SIGNED_MACHO)
+        make_bundle(os.path.join(contents, 'Resources'), 'Resource.app')
+        os.symlink('../MacOS/Main', os.path.join(contents, 'Helpers/Main'))
+        os.symlink('tool', os.path.join(contents, 'MacOS/tool_link'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_find_helpers(self):
+        # Each location in HELPER_LOCATIONS order, then framework Helpers, then inside each bundle found
+        self.assertEqual(PrivacyProfiles.find_helpers(self.app + '/'),
+                         [self.login_item, self.service, self.helper, self.tool, self.framework_app,
+                          os.path.join(self.app, 'Contents/Frameworks/Electron Framework.framework/Helpers/chrome_crashpad_handler'),
+                          self.login_tool])
+
+    def test_no_helpers(self):
+        self.assertEqual(PrivacyProfiles.find_helpers(fixtures.make_app(self.directory, 'Plain', signed=True)), [])
+        self.assertEqual(PrivacyProfiles.find_helpers(os.path.join(self.directory, 'Missing.app')), [])
+
+
+class IncludeHelpersTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Two apps shipping a helper bundle with the same identifier, such as an Electron helper
+        self.apps = [fixtures.make_app(self.directory, name, signed=True) for name in ['First', 'Second']]
+        for app in self.apps:
+            make_bundle(os.path.join(app, 'Contents/Frameworks'), 'Shared Helper.app')
+        self.tool = write(os.path.join(self.apps[1], 'Contents/MacOS/tool'), fixtures.SIGNED_MACHO)
+        self.receiver = fixtures.make_app(self.directory, 'Receiver', signed=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def app_lists(self, services):
+        profile = PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                                  payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                                  removal_date=None, timezone=None, jobs=1)
+        profile.set_services_dict(dict((payload, {'_apps': apps, 'apps': list()}) for payload, apps in services.items()))
+        profile.include_helpers()
+        return dict((payload, [(app.sending_app_path, app.sending_app_path_override, app.receiving_app_path) for app in apps])
+                    for payload, apps in profile._app_lists.items())
+
+    def test_include_helpers(self):
+        shared = [os.path.join(app, 'Contents/Frameworks/Shared Helper.app') for app in self.apps]
+        app_lists = self.app_lists({
+            'Accessibility': self.apps + [self.receiver],
+            'AppleEvents': ['{},{}'.format(self.apps[1], self.receiver)],
+        })
+
+        # The shared helper is only added after the first app shipping it, as it has the same identifier in both
+        self.assertEqual(app_lists['Accessibility'], [(self.apps[0], False, False), (shared[0], False, False), (self.apps[1], False, False),
+                                                      (self.tool, False, False), (self.receiver, False, False)])
+        # AppleEvents helpers send to the same app as their bundle
+        self.assertEqual(app_lists['AppleEvents'], [(self.apps[1], False, self.receiver), (self.tool, False, self.receiver), (shared[1], False, self.receiver)])
+
+    def test_override_path(self):
+        app_lists = self.app_lists({'Accessibility': ['{}:/Applications/Second.app'.format(self.apps[1])]})
+        # Only helpers that aren't bundles are identified by path, so only they use the override path
+        self.assertEqual(app_lists['Accessibility'], [(self.apps[1], '/Applications/Second.app', False),
+                                                      (self.tool, '/Applications/Second.app/Contents/MacOS/tool', False),
+                                                      (os.path.join(self.apps[1], 'Contents/Frameworks/Shared Helper.app'), False, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests that resolving apps concurrently builds the same profile, and raises the same first error, as resolving them one
+at a time, with the stand-in codesign from benchmarks/fixtures.py."""
+
+from __future__ import absolute_import, print_function
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import PrivacyProfiles  # noqa: E402
+
+
+class JobsTests(unittest.TestCase):
+    JOBS = [1, 2, 8]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.original_codesign = PrivacyProfiles.CODESIGN
+        PrivacyProfiles.CODESIGN = fixtures.make_fake_tools(os.path.join(self.directory, 'bin'))['codesign']
+        self.apps = fixtures.make_apps(os.path.join(self.directory, 'apps'), 12, scripts=3, unsigned_scripts=3)
+
+    def tearDown(self):
+        PrivacyProfiles.CODESIGN = self.original_codesign
+        shutil.rmtree(self.directory)
+
+    def build(self, services, jobs):
+        """Builds a profile of services, a dict of the apps for each payload, and returns the profile written as bytes
+        with its UUIDs replaced, or the exception raised building it."""
+        profile = PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                                  payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                                  removal_date=None, timezone=None, jobs=jobs)
+        profile.set_services_dict(dict((payload, {'_apps': apps, 'apps': list()}) for payload, apps in services.items()))
+        try:
+            profile.build_profile(allow=True)
+        except Exception as e:
+            return e
+
+        output = io.BytesIO()
+        profile.write_to(output)
+        return output.getvalue().replace(profile.profile_uuid.encode('utf-8'), b'PROFILE-UUID').replace(profile.payload_uuid.encode('utf-8'), b'PAYLOAD-UUID')
+
+    def test_same_profile(self):
+        services = {
+            'Accessibility': self.apps,
+            'AppleEvents': ['{},{}'.format(app, self.apps[0]) for app in self.apps[1:6]],
+            'SystemPolicyAllFiles': list(reversed(self.apps)),
+        }
+        profiles = [self.build(services, jobs) for jobs in self.JOBS]
+        self.assertIsInstance(profiles[0], bytes)
+        self.assertIn(b'com.example.bench.benchapp11', profiles[0])
+        for jobs, profile in zip(self.JOBS[1:], profiles[1:]):
+            self.assertEqual(profile, profiles[0], jobs)
+
+    def test_same_first_error(self):
+        missing = [os.path.join(self.directory, 'Missing{}.app'.format(i)) for i in range(2)]
+        # Accessibility comes before SystemPolicyAllFiles in PAYLOADS, so the first error is for the app missing from Accessibility,
+        # however quickly the other is found to be missing
+        services = {
+            'Accessibility': self.apps[:8] + [missing[1]],
+            'SystemPolicyAllFiles': [missing[0]] + self.apps[8:],
+        }
+        errors = [self.build(services, jobs) for jobs in self.JOBS]
+        self.assertIsInstance(errors[0], OSError)
+        self.assertEqual(errors[0].filename, missing[1])
+        for jobs, error in zip(self.JOBS[1:], errors[1:]):
+            self.assertEqual((type(error), str(error)), (type(errors[0]), str(errors[0])), jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Tests that PrivacyProfiles._get_file_mime_type sniffs the same mimetypes as `file --mime-type` for the files
+tccprofile.py is given."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import PrivacyProfiles  # noqa: E402
+
+
+class MimeTypeTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def mimetype(self, data):
+        path = os.path.join(self.directory, 'file')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return PrivacyProfiles._get_file_mime_type(path)
+
+    def test_shebangs(self):
+        for shebang, expected in [
+            (b'#!/bin/sh', 'x-shellscript'),
+            (b'#!/bin/zsh -f', 'x-shellscript'),
+            (b'#! /usr/local/bin/bash', 'x-shellscript'),
+            (b'#!/usr/bin/python', 'x-python'),
+            (b'#!/usr/bin/perl -w', 'x-perl'),
+            (b'#!/usr/bin/ruby', 'x-ruby'),
+            (b'#!/usr/bin/env python3', 'x-python'),
+            (b'#!/usr/bin/env -S PYTHONPATH=lib python3 -u', 'x-python'),
+            (b'#!/usr/local/bin/python3.11', 'x-python'),
+            (b'#!/opt/perl5.30/bin/perl5.30.3', 'x-perl'),
+            (b'#!/usr/local/bin/pythonista', 'plain'),
+            (b'#!/usr/local/bin/shellcheck', 'plain'),
+            (b'#!/usr/local/bin/python3-config', 'plain'),
+            (b'#!/usr/bin/env', 'plain'),
+            (b'#!', 'plain'),
+            (b'#!\n/bin/sh', 'plain'),
+        ]:
+            self.assertEqual(self.mimetype(shebang + b'\necho\n'), expected, shebang)
+
+    def test_mach_o(self):
+        self.assertEqual(self.mimetype(fixtures.MACHO_HEADER), 'x-mach-binary')
+        for magic, endian in [(0xfeedface, '<'), (0xfeedface, '>'), (0xfeedfacf, '>')]:
+            self.assertEqual(self.mimetype(struct.pack(endian + '7I', magic, 7, 3, 2, 0, 0, 0)), 'x-mach-binary', hex(magic))
+
+    def test_fat(self):
+        for magic in [0xcafebabe, 0xcafebabf]:
+            self.assertEqual(self.mimetype(struct.pack('>2I', magic, 2) + b'\0' * 40), 'x-mach-binary', hex(magic))
+        # A Java class file has the same magic, followed by its version rather than a number of architectures
+        self.assertEqual(self.mimetype(struct.pack('>I2H', 0xcafebabe, 0, 52) + b'\0' * 40), 'octet-stream')
+
+    def test_other_files(self):
+        self.assertEqual(self.mimetype(b''), 'x-empty')
+        self.assertEqual(self.mimetype(b'just some text\n'), 'plain')
+        self.assertEqual(self.mimetype(b'\x7fELF\x02\x01\x01\0'), 'octet-stream')
+        # Only the start of the file is read
+        self.assertEqual(self.mimetype(b'a' * PrivacyProfiles.MIME_SNIFF_LENGTH + b'\0'), 'plain')
+
+    def test_directories(self):
+        app = fixtures.make_app(self.directory, 'App')
+        self.assertEqual(PrivacyProfiles._get_file_mime_type(app), 'directory')
+        self.assertEqual(PrivacyProfiles._get_file_mime_type(app + '/'), 'directory')
+        self.assertIsNone(PrivacyProfiles._get_file_mime_type(os.path.join(self.directory, 'Missing.app')))
+
+
+if __name__ == '__main__':
+    unittest.main()
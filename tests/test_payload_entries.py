@@ -0,0 +1,100 @@
+"""Tests AppEntry and PayloadEntry equality, and how set_services_dict and build_profile de-duplicate apps and entries.
+Apps are given pre-made AppInspections, the same as benchmarks/payload_model.py, so nothing is resolved."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tccprofile import AppEntry, AppInspection, PayloadEntry, PrivacyProfiles  # noqa: E402
+
+
+def inspection(path, identifier):
+    result = AppInspection(path=path)
+    result.app_name = os.path.basename(os.path.splitext(path)[0])
+    result.mimetype = 'x-mach-binary'
+    result.signed = True
+    result.codesign_result = 'identifier "{}" and anchor apple'.format(identifier)
+    result.identifier = identifier
+    result.identifier_type = 'bundleID'
+    return result
+
+
+class EntryTests(unittest.TestCase):
+    def test_app_entry(self):
+        app = AppEntry('/Applications/A.app', receiving_app_path='/Applications/B.app')
+        self.assertEqual(app, AppEntry('/Applications/A.app', False, '/Applications/B.app', False))
+        self.assertEqual(hash(app), hash(AppEntry('/Applications/A.app', False, '/Applications/B.app', False)))
+        self.assertNotEqual(app, AppEntry('/Applications/A.app', '/Volumes/Disk/A.app', '/Applications/B.app', False))
+        self.assertNotEqual(app, AppEntry('/Applications/A.app'))
+        self.assertNotEqual(app, app.key())
+        self.assertEqual(len(set([app, AppEntry('/Applications/A.app', receiving_app_path='/Applications/B.app')])), 1)
+
+        self.assertEqual(app.sending_app, ('/Applications/A.app', False))
+        self.assertEqual(app.receiving_app, ('/Applications/B.app', False))
+        self.assertFalse(hasattr(app, '__dict__'))
+
+    def test_payload_entry(self):
+        entry = PayloadEntry(True, 'identifier "a"', 'Allow a', 'a', 'bundleID')
+        self.assertEqual(entry, PayloadEntry(True, 'identifier "a"', 'Allow a', 'a', 'bundleID'))
+        self.assertEqual(len(set([entry, PayloadEntry(True, 'identifier "a"', 'Allow a', 'a', 'bundleID')])), 1)
+        self.assertNotEqual(entry, PayloadEntry(False, 'identifier "a"', 'Allow a', 'a', 'bundleID'))
+        self.assertNotEqual(entry, PayloadEntry(True, 'identifier "a"', 'Allow a', 'a', 'bundleID', 'b', 'bundleID', 'identifier "b"'))
+        self.assertFalse(hasattr(entry, '__dict__'))
+
+        self.assertEqual(entry.as_dict(), {'Allowed': True, 'CodeRequirement': 'identifier "a"', 'Comment': 'Allow a',
+                                           'Identifier': 'a', 'IdentifierType': 'bundleID'})
+        receiver = PayloadEntry(True, 'identifier "a"', 'Allow a', 'a', 'bundleID', 'b', 'bundleID', 'identifier "b"').as_dict()
+        self.assertEqual((receiver['AEReceiverIdentifier'], receiver['AEReceiverIdentifierType'], receiver['AEReceiverCodeRequirement']),
+                         ('b', 'bundleID', 'identifier "b"'))
+
+
+class DeduplicationTests(unittest.TestCase):
+    APPS = ['/Applications/A.app', '/Applications/B.app', '/Applications/A.app', '/Applications/C.app', '/Applications/B.app']
+
+    def make_profile(self, services):
+        inspections = dict()
+        for path, identifier in [('/Applications/A.app', 'com.example.a'), ('/Applications/B.app', 'com.example.b'),
+                                 ('/Applications/C.app', 'com.example.a'), ('/Volumes/Disk/A.app', 'com.example.a')]:
+            inspections[(path, False)] = inspection(path, identifier)
+
+        profile = PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                                  payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                                  removal_date=None, timezone=None, jobs=1, inspections=inspections)
+        profile.set_services_dict(dict((payload, {'_apps': apps, 'apps': list()}) for payload, apps in services.items()))
+        return profile
+
+    def test_repeated_apps(self):
+        profile = self.make_profile({'Accessibility': self.APPS, 'AppleEvents': ['{},/Applications/B.app'.format(app) for app in self.APPS]})
+        self.assertEqual([app.sending_app_path for app in profile._app_lists['Accessibility']],
+                         ['/Applications/A.app', '/Applications/B.app', '/Applications/C.app'])
+        self.assertEqual([app.sending_app for app in profile._app_lists['AppleEvents']],
+                         [('/Applications/A.app', False), ('/Applications/B.app', False), ('/Applications/C.app', False)])
+
+        # An override path makes a different app entry
+        profile = self.make_profile({'Accessibility': ['/Volumes/Disk/A.app', '/Volumes/Disk/A.app:/Applications/A.app']})
+        self.assertEqual(len(profile._app_lists['Accessibility']), 2)
+
+    def test_repeated_entries(self):
+        profile = self.make_profile({'Accessibility': self.APPS})
+        profile.build_profile(allow=True)
+
+        # C.app has the same identifier and requirement as A.app, but a different name in its Comment
+        services = profile.template['PayloadContent'][0]['Services']
+        self.assertEqual([(entry['Identifier'], entry['Comment']) for entry in services['Accessibility']],
+                         [('com.example.a', 'Allow Accessibility control for A'), ('com.example.b', 'Allow Accessibility control for B'),
+                          ('com.example.a', 'Allow Accessibility control for C')])
+
+    def test_identical_entries_from_different_paths(self):
+        # The same app on another volume builds an identical entry, which is only written once
+        profile = self.make_profile({'Accessibility': ['/Applications/A.app', '/Volumes/Disk/A.app']})
+        profile.build_profile(allow=True)
+        self.assertEqual(len(profile._app_lists['Accessibility']), 2)
+        self.assertEqual(len(profile.template['PayloadContent'][0]['Services']['Accessibility']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
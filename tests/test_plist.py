@@ -0,0 +1,144 @@
+"""Tests that BinaryPlistReader reads what plistlib writes, that PlistStreamWriter writes the same bytes as plistlib, and
+that profiles are written the same as their template."""
+
+from __future__ import absolute_import, print_function
+
+import datetime
+import glob
+import io
+import os
+import plistlib
+import shutil
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from tccprofile import (AppInspection, BinaryPlistReader, NSPropertyListSerializationException, PlistStreamWriter, PrivacyProfiles,  # noqa: E402
+                        read_plist, read_plist_keys)
+
+GENERATED_PROFILES = sorted(glob.glob(os.path.join(REPO_DIR, 'generated_profiles', '*.mobileconfig')))
+
+
+def plistlib_bytes(value):
+    if hasattr(plistlib, 'dumps'):
+        return plistlib.dumps(value)
+    return plistlib.writePlistToString(value)
+
+
+def streamed_bytes(value):
+    output = io.BytesIO()
+    PlistStreamWriter(output).write(value)
+    return output.getvalue()
+
+
+@unittest.skipUnless(hasattr(plistlib, 'FMT_BINARY'), 'plistlib only writes binary plists from Python 3.4')
+class BinaryPlistReaderTests(unittest.TestCase):
+    VALUE = {
+        'string': u'caf\xe9 \u2603',
+        'ascii': 'Info',
+        'integers': [0, 1, 255, 256, 65536, 2 ** 32, 2 ** 63 - 1, -1, -2 ** 63],
+        'real': 0.25,
+        'booleans': [True, False],
+        'date': datetime.datetime(2019, 10, 1, 12, 30, 15),
+        'data': b'\x00\x01\xfe\xff',
+        'nested': {'array': [{'a': [u'x', 1]}], 'empty': {}},
+        'long': ['item{}'.format(i) for i in range(20)],  # More objects than fit in the marker byte
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'Info.plist')
+        with open(self.path, 'wb') as f:
+            f.write(plistlib.dumps(self.VALUE, fmt=plistlib.FMT_BINARY))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def _plain(value):
+        """Returns value with any plistlib.Data replaced by its bytes."""
+        if isinstance(value, dict):
+            return dict((key, BinaryPlistReaderTests._plain(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [BinaryPlistReaderTests._plain(item) for item in value]
+        return getattr(value, 'data', value)
+
+    def test_read_object(self):
+        self.assertEqual(self._plain(read_plist(self.path)), self.VALUE)
+
+    def test_read_keys(self):
+        self.assertEqual(read_plist_keys(self.path, ['string', 'nested', 'missing']),
+                         {'string': self.VALUE['string'], 'nested': self.VALUE['nested']})
+
+    def test_not_binary(self):
+        with self.assertRaises(NSPropertyListSerializationException):
+            BinaryPlistReader(io.BytesIO(plistlib.dumps(self.VALUE)))
+
+
+class PlistStreamWriterTests(unittest.TestCase):
+    def test_generated_profiles(self):
+        self.assertTrue(GENERATED_PROFILES)
+        for path in GENERATED_PROFILES:
+            profile = read_plist(path)
+            self.assertEqual(streamed_bytes(profile), plistlib_bytes(profile), path)
+
+    def test_values(self):
+        value = {
+            'string': u'<a & b>\r\n caf\xe9',
+            'integer': -3,
+            'real': 0.5,
+            'booleans': [True, False],
+            'empty': {'array': [], 'dict': {}},
+            'nested': [{'b': 1, 'a': [u'x']}],
+        }
+        self.assertEqual(streamed_bytes(value), plistlib_bytes(value))
+
+    def test_generators_are_written_as_arrays(self):
+        value = {'Services': {'Accessibility': ({'Identifier': str(i)} for i in range(3)), 'Camera': iter([])}}
+        expected = {'Services': {'Accessibility': [{'Identifier': str(i)} for i in range(3)], 'Camera': []}}
+        self.assertEqual(streamed_bytes(value), plistlib_bytes(expected))
+
+    def test_control_characters(self):
+        with self.assertRaises(ValueError):
+            streamed_bytes({'key': u'\x01'})
+
+
+class WriteProfileTests(unittest.TestCase):
+    def test_written_profile_matches_template(self):
+        inspections = dict()
+        paths = ['/Applications/App{}.app'.format(i) for i in range(20)]
+        for index, path in enumerate(paths):
+            inspection = AppInspection(path=path)
+            inspection.app_name = 'App{}'.format(index)
+            inspection.signed = True
+            inspection.codesign_result = 'identifier "com.example.app{}" and anchor apple generic'.format(index)
+            inspection.identifier = 'com.example.app{}'.format(index)
+            inspection.identifier_type = 'bundleID'
+            inspections[(path, False)] = inspection
+
+        profile = PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                                  payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                                  removal_date=None, timezone=None, jobs=1, inspections=inspections)
+        profile.set_services_dict({
+            'Accessibility': {'_apps': paths + paths[:5], 'apps': list()},  # Repeated apps are only added once
+            'Camera': {'_apps': paths[:2], 'apps': list()},
+            'AppleEvents': {'_apps': ['{},{}'.format(path, paths[0]) for path in paths[1:4]], 'apps': list()},
+        })
+        profile.build_profile(allow=True)
+
+        output = io.BytesIO()
+        profile.write_to(output)
+        template = profile.template
+        self.assertEqual(output.getvalue(), plistlib_bytes(template))
+
+        services = template['PayloadContent'][0]['Services']
+        self.assertEqual(len(services['Accessibility']), 20)
+        self.assertEqual([entry['Allowed'] for entry in services['Camera']], [False, False])
+        self.assertEqual(services['AppleEvents'][0]['AEReceiverIdentifier'], 'com.example.app0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+"""Tests RequirementDecoder and MachOCodeSignature against the text `codesign -dr -` prints for the same designated
+requirements.
+
+The blobs are built here in the compiled requirement format (the same bytes as `csreq -b` writes, and TCC.db stores in
+its csreq column), and embedded in synthetic Mach-O binaries laid out the same way as signed ones, so the tests don't
+need codesign or signed apps to run. Where the signature can't be read, the stand-in codesign from
+benchmarks/fixtures.py is used instead.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import CodeSignatureException, MachOCodeSignature, PrivacyProfiles, RequirementDecoder  # noqa: E402
+
+# Requirement expression opcodes and match operations, from Security's requirement.h
+OP_IDENT, OP_APPLE_ANCHOR, OP_INFO_KEY_VALUE, OP_AND, OP_OR, OP_CERT_FIELD, OP_CERT_GENERIC, OP_APPLE_GENERIC_ANCHOR = 2, 3, 5, 6, 7, 11, 14, 15
+MATCH_EXISTS, MATCH_EQUAL = 0, 1
+LEAF = 0
+
+# DER encoded OIDs of Apple's certificate extensions
+OID_DEVELOPER_ID_CA = b'\x2a\x86\x48\x86\xf7\x63\x64\x06\x02\x06'  # 1.2.840.113635.100.6.2.6
+OID_DEVELOPER_ID_APPLICATION = b'\x2a\x86\x48\x86\xf7\x63\x64\x06\x01\x0d'  # 1.2.840.113635.100.6.1.13
+OID_MAC_APP_STORE = b'\x2a\x86\x48\x86\xf7\x63\x64\x06\x01\x09'  # 1.2.840.113635.100.6.1.9
+
+
+def _int(value):
+    return struct.pack('>i', value)
+
+
+def _data(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return _int(len(value)) + value + b'\0' * (-len(value) % 4)
+
+
+def ident(identifier):
+    return _int(OP_IDENT) + _data(identifier)
+
+
+def anchor_apple():
+    return _int(OP_APPLE_ANCHOR)
+
+
+def anchor_apple_generic():
+    return _int(OP_APPLE_GENERIC_ANCHOR)
+
+
+def and_(*expressions):
+    """Joins expressions the same way the requirement parser does, so 'a and b and c' is and(and(a, b), c)."""
+    result = expressions[0]
+    for expression in expressions[1:]:
+        result = _int(OP_AND) + result + expression
+    return result
+
+
+def or_(left, right):
+    return _int(OP_OR) + left + right
+
+
+def cert_field(slot, field, value):
+    return _int(OP_CERT_FIELD) + _int(slot) + _data(field) + _int(MATCH_EQUAL) + _data(value)
+
+
+def cert_generic_exists(slot, oid):
+    return _int(OP_CERT_GENERIC) + _int(slot) + _data(oid) + _int(MATCH_EXISTS)
+
+
+def info_key_value(key, value):
+    return _int(OP_INFO_KEY_VALUE) + _data(key) + _data(value)
+
+
+def requirement(expression):
+    return struct.pack('>3I', 0xfade0c00, 12 + len(expression), 1) + expression
+
+
+def developer_id(identifier, team):
+    """The designated requirement codesign generates for a Developer ID signed app."""
+    return and_(ident(identifier), anchor_apple_generic(), cert_generic_exists(1, OID_DEVELOPER_ID_CA),
+                cert_generic_exists(LEAF, OID_DEVELOPER_ID_APPLICATION), cert_field(LEAF, 'subject.OU', team))
+
+
+# Mach-O constants, from mach-o/loader.h and mach-o/fat.h
+MH_EXECUTE, MH_DYLIB = 0x2, 0x6
+LC_UUID, LC_CODE_SIGNATURE = 0x1b, 0x1d
+CPU_TYPE_X86_64, CPU_TYPE_ARM64 = 0x01000007, 0x0100000c
+# Code signing blob magics and slots, from Security's cscdefs.h
+CSMAGIC_CODEDIRECTORY, CSMAGIC_REQUIREMENTS, CSMAGIC_EMBEDDED_SIGNATURE = 0xfade0c02, 0xfade0c01, 0xfade0cc0
+CSSLOT_CODEDIRECTORY, CSSLOT_REQUIREMENTS = 0, 2
+HOST_REQUIREMENT, DESIGNATED_REQUIREMENT = 1, 3
+
+
+def super_blob(magic, blobs):
+    """Returns a SuperBlob (or requirements set) of (type, blob) pairs, with its index of offsets."""
+    header_length = 12 + 8 * len(blobs)
+    index = b''
+    data = b''
+    for blob_type, blob in blobs:
+        index += struct.pack('>2I', blob_type, header_length + len(data))
+        data += blob
+    return struct.pack('>3I', magic, header_length + len(data), len(blobs)) + index + data
+
+
+def embedded_signature(requirements):
+    """Returns an embedded signature with a placeholder CodeDirectory and the given (type, requirement blob) pairs, or
+    no requirements slot at all if requirements is None."""
+    blobs = [(CSSLOT_CODEDIRECTORY, struct.pack('>2I', CSMAGIC_CODEDIRECTORY, 8))]
+    if requirements is not None:
+        blobs.append((CSSLOT_REQUIREMENTS, super_blob(CSMAGIC_REQUIREMENTS, requirements)))
+    return super_blob(CSMAGIC_EMBEDDED_SIGNATURE, blobs)
+
+
+def macho(signature, bits=64, endian='<', filetype=MH_EXECUTE, cputype=CPU_TYPE_X86_64):
+    """Returns a thin Mach-O binary with an LC_UUID command, then an LC_CODE_SIGNATURE command pointing to signature at
+    the end of the file, as codesign lays it out. Without a signature it has no LC_CODE_SIGNATURE command."""
+    header_length = 32 if bits == 64 else 28
+    commands = struct.pack(endian + '2I', LC_UUID, 24) + b'\x11' * 16
+    ncmds = 1
+    if signature is not None:
+        ncmds += 1
+        dataoff = header_length + len(commands) + 16
+        dataoff += -dataoff % 16
+        commands += struct.pack(endian + '4I', LC_CODE_SIGNATURE, 16, dataoff, len(signature))
+
+    header = struct.pack(endian + '7I', 0xfeedfacf if bits == 64 else 0xfeedface, cputype, 3, filetype, ncmds, len(commands), 0)
+    binary = header + (b'\0' * 4 if bits == 64 else b'') + commands
+    if signature is not None:
+        binary += b'\0' * (dataoff - len(binary)) + signature
+    return binary
+
+
+def fat(slices, bits=32):
+    """Returns a fat binary of the thin binaries in slices, each aligned to 4096 bytes."""
+    offsets = list()
+    offset = 4096
+    for binary in slices:
+        offsets.append(offset)
+        offset += len(binary) + (-len(binary) % 4096)
+
+    header = struct.pack('>2I', 0xcafebabe if bits == 32 else 0xcafebabf, len(slices))
+    for cputype, offset, binary in zip([CPU_TYPE_X86_64, CPU_TYPE_ARM64], offsets, slices):
+        if bits == 32:
+            header += struct.pack('>5I', cputype, 3, offset, len(binary), 12)
+        else:
+            header += struct.pack('>2I2Q2I', cputype, 3, offset, len(binary), 12, 0)
+
+    data = header
+    for offset, binary in zip(offsets, slices):
+        data += b'\0' * (offset - len(data)) + binary
+    return data
+
+
+SLACK = developer_id('com.tinyspeck.slackmacgap', 'BQR82RBBHL')
+# codesign -dr - /Applications/Slack.app
+SLACK_TEXT = ('identifier "com.tinyspeck.slackmacgap" and anchor apple generic and '
+              'certificate 1[field.1.2.840.113635.100.6.2.6] /* exists */ and '
+              'certificate leaf[field.1.2.840.113635.100.6.1.13] /* exists */ and '
+              'certificate leaf[subject.OU] = BQR82RBBHL')
+LS = and_(ident('com.apple.ls'), anchor_apple())
+# codesign -dr - /bin/ls
+LS_TEXT = 'identifier "com.apple.ls" and anchor apple'
+
+
+class RequirementDecoderTests(unittest.TestCase):
+    def assertDecodes(self, expression, expected):
+        self.assertEqual(RequirementDecoder(requirement(expression)).decode(), expected)
+
+    def test_apple_binary(self):
+        # codesign -dr - /bin/ls
+        self.assertDecodes(and_(ident('com.apple.ls'), anchor_apple()), 'identifier "com.apple.ls" and anchor apple')
+
+    def test_developer_id_numeric_team(self):
+        # codesign -dr - "/Applications/1Password 7.app"
+        self.assertDecodes(developer_id('com.agilebits.onepassword7', '2BUA8C4S2C'),
+                           'identifier "com.agilebits.onepassword7" and anchor apple generic and '
+                           'certificate 1[field.1.2.840.113635.100.6.2.6] /* exists */ and '
+                           'certificate leaf[field.1.2.840.113635.100.6.1.13] /* exists */ and '
+                           'certificate leaf[subject.OU] = "2BUA8C4S2C"')
+
+    def test_developer_id_alphabetic_team(self):
+        # codesign -dr - /Applications/Slack.app
+        self.assertDecodes(developer_id('com.tinyspeck.slackmacgap', 'BQR82RBBHL'),
+                           'identifier "com.tinyspeck.slackmacgap" and anchor apple generic and '
+                           'certificate 1[field.1.2.840.113635.100.6.2.6] /* exists */ and '
+                           'certificate leaf[field.1.2.840.113635.100.6.1.13] /* exists */ and '
+                           'certificate leaf[subject.OU] = BQR82RBBHL')
+
+    def test_mac_app_store(self):
+        # codesign -dr - /Applications/Xcode.app, where 'or' binds looser than 'and', so it is parenthesised
+        app_store = and_(anchor_apple_generic(), cert_generic_exists(LEAF, OID_MAC_APP_STORE))
+        self.assertDecodes(and_(or_(app_store, and_(anchor_apple_generic(), cert_generic_exists(1, OID_DEVELOPER_ID_CA),
+                                                    cert_generic_exists(LEAF, OID_DEVELOPER_ID_APPLICATION),
+                                                    cert_field(LEAF, 'subject.OU', 'APPLECOMPUTER'))),
+                                ident('com.apple.dt.Xcode')),
+                           '(anchor apple generic and certificate leaf[field.1.2.840.113635.100.6.1.9] /* exists */ or '
+                           'anchor apple generic and certificate 1[field.1.2.840.113635.100.6.2.6] /* exists */ and '
+                           'certificate leaf[field.1.2.840.113635.100.6.1.13] /* exists */ and '
+                           'certificate leaf[subject.OU] = APPLECOMPUTER) and identifier "com.apple.dt.Xcode"')
+
+    def test_keywords_and_leading_digits_are_quoted(self):
+        self.assertDecodes(info_key_value('CFBundleName', 'leaf'), 'info[CFBundleName] = "leaf"')
+        self.assertDecodes(info_key_value('CFBundleVersion', '1'), 'info[CFBundleVersion] = "1"')
+        self.assertDecodes(info_key_value('CFBundleVersion', ''), 'info[CFBundleVersion] = ""')
+        self.assertDecodes(info_key_value('CFBundleName', 'Leaf1'), 'info[CFBundleName] = Leaf1')
+
+    def test_quoting_and_hex(self):
+        self.assertDecodes(info_key_value('CFBundleName', 'My "App"'), 'info[CFBundleName] = "My \\"App\\""')
+        self.assertDecodes(info_key_value('CFBundleName', b'\x01\x02'), 'info[CFBundleName] = 0x0102')
+
+    def test_unsupported_blob(self):
+        with self.assertRaises(CodeSignatureException):
+            RequirementDecoder(struct.pack('>3I', 0xfade0c01, 12, 1)).decode()
+        with self.assertRaises(CodeSignatureException):
+            RequirementDecoder(requirement(_int(OP_IDENT) + _int(64))).decode()
+
+
+class MachOCodeSignatureTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def assertRequirement(self, data, expected):
+        signature = MachOCodeSignature(self.write('binary', data))
+        self.assertEqual(signature.designated_requirement(), expected)
+        self.assertTrue(signature.is_signed_executable())
+
+    def assertUnreadable(self, data, signed=True):
+        signature = MachOCodeSignature(self.write('binary', data))
+        with self.assertRaises(CodeSignatureException):
+            signature.designated_requirement()
+        self.assertEqual(signature.is_signed_executable(), signed)
+
+    def test_thin(self):
+        signature = embedded_signature([(HOST_REQUIREMENT, requirement(anchor_apple())), (DESIGNATED_REQUIREMENT, requirement(SLACK))])
+        for bits in [32, 64]:
+            for endian in ['<', '>']:
+                self.assertRequirement(macho(signature, bits=bits, endian=endian), SLACK_TEXT)
+
+    def test_fat(self):
+        # Only the first architecture is read, as every architecture of a signed app has the same designated requirement
+        slices = [macho(embedded_signature([(DESIGNATED_REQUIREMENT, requirement(LS))])),
+                  macho(embedded_signature([(DESIGNATED_REQUIREMENT, requirement(SLACK))]), cputype=CPU_TYPE_ARM64)]
+        self.assertRequirement(fat(slices), LS_TEXT)
+        self.assertRequirement(fat(slices, bits=64), LS_TEXT)
+
+    def test_app_bundle(self):
+        app = fixtures.make_app(self.directory, 'Slack')
+        self.write('Slack.app/Contents/MacOS/Slack', macho(embedded_signature([(DESIGNATED_REQUIREMENT, requirement(SLACK))])))
+        self.assertEqual(MachOCodeSignature(app).designated_requirement(), SLACK_TEXT)
+
+    def test_library_is_not_an_executable(self):
+        signature = MachOCodeSignature(self.write('library', macho(embedded_signature([(DESIGNATED_REQUIREMENT, requirement(LS))]), filetype=MH_DYLIB)))
+        self.assertEqual(signature.designated_requirement(), LS_TEXT)
+        self.assertFalse(signature.is_signed_executable())
+
+    def test_unreadable_signatures(self):
+        signature = embedded_signature([(DESIGNATED_REQUIREMENT, requirement(LS))])
+        self.assertUnreadable(macho(None), signed=False)  # Not signed
+        self.assertUnreadable(macho(signature)[:-len(signature) // 2])  # Truncated
+        self.assertUnreadable(macho(embedded_signature(None)))  # No requirements
+        self.assertUnreadable(macho(embedded_signature([(HOST_REQUIREMENT, requirement(LS))])))  # No designated requirement
+        self.assertUnreadable(macho(struct.pack('>3I', CSMAGIC_REQUIREMENTS, 12, 0)))  # Not an embedded signature
+        self.assertUnreadable(struct.pack('>2I', 0xcafebabe, 50) + b'\0' * 64, signed=False)  # A Java class file
+        self.assertUnreadable(b'#!/bin/sh\n', signed=False)
+
+
+class CodesignFallbackTests(unittest.TestCase):
+    """Binaries whose signature can't be read in-process are checked with codesign instead."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'tools.log')
+        self.original_codesign = PrivacyProfiles.CODESIGN
+        PrivacyProfiles.CODESIGN = fixtures.make_fake_tools(os.path.join(self.directory, 'bin'))['codesign']
+        os.environ[fixtures.LOG_VARIABLE] = self.log
+        self.profile = PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                                       payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                                       removal_date=None, timezone=None, jobs=1)
+
+    def tearDown(self):
+        PrivacyProfiles.CODESIGN = self.original_codesign
+        del os.environ[fixtures.LOG_VARIABLE]
+        shutil.rmtree(self.directory)
+
+    def codesign_calls(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            return len(f.read().splitlines())
+
+    def test_readable_signature_does_not_run_codesign(self):
+        app = fixtures.make_app(self.directory, 'Slack')
+        with open(os.path.join(app, 'Contents/MacOS/Slack'), 'wb') as f:
+            f.write(macho(embedded_signature([(DESIGNATED_REQUIREMENT, requirement(SLACK))])))
+
+        self.assertEqual(self.profile._read_code_sign_details(app), {'requirement': SLACK_TEXT, 'signed': True})
+        self.assertEqual(self.codesign_calls(), 0)
+
+    def test_malformed_signature_runs_codesign(self):
+        app = fixtures.make_app(self.directory, 'Broken')
+        signature = embedded_signature([(DESIGNATED_REQUIREMENT, requirement(SLACK))])
+        with open(os.path.join(app, 'Contents/MacOS/Broken'), 'wb') as f:
+            f.write(macho(signature)[:-8])
+
+        details = self.profile._read_code_sign_details(app)
+        self.assertEqual(details['requirement'], 'identifier "{}.broken" and anchor apple generic and certificate leaf[subject.OU] = BENCH000000'.format(
+            fixtures.BUNDLE_ID_PREFIX))
+        self.assertEqual(self.codesign_calls(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
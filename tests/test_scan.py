@@ -0,0 +1,121 @@
+"""Tests that --scan finds app bundles, executable scripts and signed executables, resolves them, and adds them to a
+profile and an inventory, with the stand-in codesign from benchmarks/fixtures.py."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fixtures  # noqa: E402
+from tccprofile import PrivacyProfiles, TCCProfileException, parse_args, read_plist, scan_apps, scan_tree  # noqa: E402
+
+
+def write(path, data, mode=0o755):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.chmod(path, mode)
+    return path
+
+
+class ScanTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, 'root')
+        self.tools = fixtures.make_fake_tools(os.path.join(self.directory, 'bin'))
+
+        self.found = [
+            fixtures.make_app(os.path.join(self.root, 'Applications'), 'Alpha'),
+            write(os.path.join(self.root, 'Applications/Utilities/tool'), fixtures.SIGNED_MACHO),
+            fixtures.make_script(os.path.join(self.root, 'Applications/Utilities'), 'zscript'),
+            fixtures.make_app(os.path.join(self.root, 'Applications'), 'Zulu'),
+            fixtures.make_script(self.root, 'run', signed=False, interpreter=os.path.join(self.directory, 'missing', 'sh')),
+        ]
+        # An app bundle is not searched inside
+        fixtures.make_script(os.path.join(self.found[0], 'Contents/MacOS'), 'helper')
+        # Files that aren't scripts or signed executables
+        write(os.path.join(self.root, 'Applications/Utilities/unsigned'), fixtures.MACHO_HEADER)
+        write(os.path.join(self.root, 'Applications/Utilities/readme.sh'), b'#!/bin/sh\necho\n', mode=0o644)
+        write(os.path.join(self.root, 'Applications/Utilities/notes'), b'notes\n')
+        # Symlinks are not followed
+        os.symlink(os.path.join(self.root, 'Applications'), os.path.join(self.root, 'link'))
+        os.symlink(self.found[2], os.path.join(self.root, 'script_link'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scan_tree(self):
+        counts = dict()
+        self.assertEqual(list(scan_tree([self.root], counts=counts)),
+                         [(self.found[0], 'app'), (self.found[1], 'binary'), (self.found[2], 'script'), (self.found[3], 'app'), (self.found[4], 'script')])
+        self.assertEqual(counts, {'directories': 3, 'files': 6, 'unreadable': 0})
+
+        # Each root is scanned in turn, in the order given
+        self.assertEqual([path for path, _ in scan_tree([self.found[3], os.path.join(self.root, 'Applications/Utilities')])],
+                         [self.found[3], self.found[1], self.found[2]])
+
+        with self.assertRaises(TCCProfileException):
+            list(scan_tree([os.path.join(self.directory, 'missing')]))
+
+    def test_scan_apps(self):
+        original_codesign = PrivacyProfiles.CODESIGN
+        PrivacyProfiles.CODESIGN = self.tools['codesign']
+        try:
+            for keep in [True, False]:
+                inspector = PrivacyProfiles(payload_description='Test', payload_name='Test', payload_identifier='com.example.test',
+                                            payload_organization='Example', profile_removal_password=None, sign_cert=None, filename=None,
+                                            removal_date=None, timezone=None, jobs=2)
+                results = list(scan_apps([self.root], inspector, keep=keep, chunk_size=2))
+                self.assertEqual([path for path, _, _ in results], self.found)
+                self.assertEqual([result.identifier for _, _, result in results[:4]],
+                                 ['com.example.bench.alpha', self.found[1], self.found[2], 'com.example.bench.zulu'])
+                self.assertIsInstance(results[4][2], Exception)  # Its interpreter doesn't exist
+                self.assertEqual(len(inspector._inspections), 5 if keep else 0)
+        finally:
+            PrivacyProfiles.CODESIGN = original_codesign
+
+    def test_command_line(self):
+        profile = os.path.join(self.directory, 'Scan.mobileconfig')
+        inventory = os.path.join(self.directory, 'inventory.json')
+        env = dict(os.environ, TCCPROFILE_CODESIGN=self.tools['codesign'])
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, os.path.join(REPO_DIR, 'tccprofile.py'), '--scan', self.root, '--services', 'Accessibility',
+                                   'SystemPolicyAllFiles', '--inventory', inventory, '--no-cache', '--pd', 'Test', '--pi', 'com.example.test',
+                                   '--pn', 'Test', '--po', 'Example', '-o', profile], env=env, stderr=devnull)
+
+        services = read_plist(profile)['PayloadContent'][0]['Services']
+        self.assertEqual(sorted(services), ['Accessibility', 'SystemPolicyAllFiles'])
+        self.assertEqual([entry['Identifier'] for entry in services['Accessibility']],
+                         ['com.example.bench.alpha', self.found[1], self.found[2], 'com.example.bench.zulu'])
+
+        with open(inventory) as f:
+            entries = json.load(f)
+        self.assertEqual([(entry['path'], entry['kind']) for entry in entries],
+                         [(self.found[0], 'app'), (self.found[1], 'binary'), (self.found[2], 'script'), (self.found[3], 'app'), (self.found[4], 'script')])
+        self.assertEqual(entries[0]['code_requirement'], 'identifier "com.example.bench.alpha" and anchor apple generic and certificate leaf[subject.OU] = BENCH000000')
+        self.assertIn('error', entries[4])
+
+    def test_arguments(self):
+        required = ['--pd', 'Test', '--pi', 'com.example.test', '--pn', 'Test', '--po', 'Example']
+        self.assertEqual(parse_args(['--scan', self.root, '--inventory', 'inventory.json'], raise_errors=True).scan, [self.root])
+        for arguments in [['--scan', self.root] + required,
+                          ['--scan', self.root, '--services', 'AppleEvents'] + required,
+                          ['--scan', self.root, '--services', 'Accessibility'],
+                          ['--services', 'Accessibility'] + required,
+                          ['--inventory', 'inventory.json'] + required]:
+            with self.assertRaises(TCCProfileException):
+                parse_args(arguments, raise_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
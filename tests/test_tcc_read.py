@@ -0,0 +1,208 @@
+"""Tests that ReadTCC reads the access table of a TCC.db through a read-only connection, in batches, filtered by service
+and client, and writes it as a table, CSV, JSON or NDJSON, and that watch() reports the rows changed in it."""
+
+from __future__ import absolute_import, print_function
+
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from fixtures import make_tcc_db  # noqa: E402
+from tccdbRead import ReadTCC, Sqlite_db  # noqa: E402
+
+COLUMNS = ['service', 'client', 'client_type', 'allowed', 'prompt_count', 'indirect_object_identifier', 'last_modified']
+
+
+class ReadTCCTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tcc_db = make_tcc_db(os.path.join(self.directory, 'TCC.db'), 24)
+        self.output = os.path.join(self.directory, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, output_format, **kwargs):
+        with open(self.output, 'w') as output:
+            ReadTCC(self.tcc_db).read_db(output_format=output_format, output=output, **kwargs)
+        with open(self.output) as f:
+            return f.read()
+
+    def test_iterate(self):
+        sqlite = Sqlite_db()
+        sqlite.connect(self.tcc_db, read_only=True)
+        try:
+            rows = list(sqlite.iterate('SELECT client FROM access WHERE client_type = ? ORDER BY last_modified', (0,), batch_size=5))
+            self.assertEqual(len(rows), 21)
+            self.assertEqual(rows[0], ('com.example.bench.client1',))
+            self.assertEqual(list(sqlite.iterate('SELECT client FROM access WHERE client_type = 2', batch_size=5)), [])
+        finally:
+            sqlite.disconnect(self.tcc_db)
+
+    def test_read_only(self):
+        for immutable in [False, True]:
+            tcc = ReadTCC(self.tcc_db, immutable=immutable)
+            self.assertEqual(len(list(tcc.rows())), 24)
+            with self.assertRaises(sqlite3.OperationalError):
+                tcc.sqlite.query('DELETE FROM access')
+            tcc.sqlite.disconnect(self.tcc_db)
+
+        connection = sqlite3.connect(self.tcc_db)
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM access').fetchone()[0], 24)
+        connection.close()
+
+    def test_filters(self):
+        tcc = ReadTCC(self.tcc_db)
+        tcc.BATCH_SIZE = 5
+        self.assertEqual(tcc.columns(), COLUMNS)
+        self.assertEqual(len(list(tcc.rows())), 24)
+
+        # Services can be given with or without the kTCCService prefix
+        rows = list(tcc.rows(services=['Camera', 'kTCCServiceAccessibility'], columns=['service', 'client']))
+        self.assertEqual(sorted(rows), [('kTCCServiceAccessibility', '/usr/local/bin/bench0'), ('kTCCServiceAccessibility', 'com.example.bench.client12'),
+                                        ('kTCCServiceCamera', 'com.example.bench.client16'), ('kTCCServiceCamera', 'com.example.bench.client4')])
+        self.assertEqual(list(tcc.rows(services=['Camera'], clients=['com.example.bench.client4'], columns=['client'])), [('com.example.bench.client4',)])
+        self.assertEqual(list(tcc.rows(clients=['com.example.missing'])), [])
+        self.assertEqual(tcc.count(services=['Camera']), 2)
+
+    def test_formats(self):
+        lines = self.read('csv', services=['Camera']).splitlines()
+        self.assertEqual(lines[0], ','.join(COLUMNS))
+        self.assertEqual(sorted(row[1] for row in csv.reader(lines[1:])), ['com.example.bench.client16', 'com.example.bench.client4'])
+
+        rows = json.loads(self.read('json'))
+        self.assertEqual(len(rows), 24)
+        self.assertEqual(sorted(rows[0]), sorted(COLUMNS))
+        self.assertEqual(json.loads(self.read('json', clients=['com.example.missing'])), [])
+
+        rows = [json.loads(line) for line in self.read('ndjson', services=['AppleEvents']).splitlines()]
+        self.assertEqual(set(row['indirect_object_identifier'] for row in rows), set(['com.apple.finder']))
+        self.assertEqual(len(rows), 2)
+
+        lines = self.read('table', services=['Camera']).splitlines()
+        self.assertEqual(lines[1].split(), ['Service', '|', 'Client'])
+        self.assertEqual(sorted(line.split() for line in lines[3:]), [['kTCCServiceCamera', '|', 'com.example.bench.client16'],
+                                                                      ['kTCCServiceCamera', '|', 'com.example.bench.client4']])
+
+    def test_command_line(self):
+        output = subprocess.check_output([sys.executable, os.path.join(REPO_DIR, 'tccdbRead.py'), self.tcc_db, '--service', 'Camera',
+                                          '--client', 'com.example.bench.client4', '--format', 'ndjson'], universal_newlines=True)
+        self.assertEqual([json.loads(line)['client'] for line in output.splitlines()], ['com.example.bench.client4'])
+
+        subprocess.check_call([sys.executable, os.path.join(REPO_DIR, 'tccdbRead.py'), self.tcc_db, '--format', 'csv', '-o', self.output])
+        with open(self.output) as f:
+            self.assertEqual(len(f.read().splitlines()), 25)
+
+
+class WatchTests(unittest.TestCase):
+    INTERVAL = 0.02
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tcc_db = make_tcc_db(os.path.join(self.directory, 'TCC.db'), 24)
+        self.output = os.path.join(self.directory, 'events')
+        self.stop = threading.Event()
+        self.thread = None
+        self.reads = [0]
+
+    def tearDown(self):
+        self.stop.set()
+        if self.thread:
+            self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def watch(self, **kwargs):
+        """Starts watching the database in a thread, counting the times its rows are read."""
+        tcc = ReadTCC(self.tcc_db)
+        rows = tcc.rows
+
+        def _rows(*args, **kwargs):
+            self.reads[0] += 1
+            return rows(*args, **kwargs)
+        tcc.rows = _rows
+
+        def _watch():
+            with open(self.output, 'w') as output:
+                tcc.watch(interval=self.INTERVAL, output=output, stop=self.stop, **kwargs)
+        self.thread = threading.Thread(target=_watch)
+        self.thread.start()
+        self.wait(lambda: self.reads[0] == 1)
+
+    def wait(self, condition):
+        deadline = time.time() + 10
+        while not condition():
+            self.assertLess(time.time(), deadline, 'Timed out waiting for watch()')
+            time.sleep(self.INTERVAL / 2)
+
+    def change(self, *statements):
+        connection = sqlite3.connect(self.tcc_db)
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def events(self, count):
+        """Waits for count events in total, and returns them as (event, client, previous client) tuples."""
+        def _events():
+            if not os.path.exists(self.output):
+                return []
+            with open(self.output) as f:
+                return [json.loads(line) for line in f.read().splitlines()]
+        self.wait(lambda: len(_events()) >= count)
+        return [(event['event'], event['row']['client'], event.get('previous', {}).get('allowed')) for event in _events()]
+
+    def test_unchanged_database_is_not_read(self):
+        self.watch()
+        time.sleep(self.INTERVAL * 10)
+        self.assertEqual(self.reads[0], 1)
+        self.assertFalse(os.path.getsize(self.output))
+
+    def test_added_and_modified_rows(self):
+        self.watch()
+        self.change("INSERT INTO access (service, client, client_type, allowed, prompt_count, indirect_object_identifier, last_modified) "
+                    "VALUES ('kTCCServiceCamera', 'com.example.new', 0, 1, 0, 'UNUSED', 1580000000)",
+                    "UPDATE access SET allowed = 0, last_modified = 1580000000 WHERE client = 'com.example.bench.client4'")
+        self.assertEqual(sorted(self.events(2)), [('added', 'com.example.new', None), ('modified', 'com.example.bench.client4', 1)])
+
+        # Only the rows modified since the last change are read, without counting or comparing every row
+        self.change("UPDATE access SET allowed = 1, last_modified = 1580000001 WHERE client = 'com.example.bench.client4'")
+        self.assertEqual(self.events(3)[2:], [('modified', 'com.example.bench.client4', 0)])
+        self.assertEqual(self.reads[0], 3)
+
+    def test_removed_rows(self):
+        self.watch(services=['Camera'])
+        self.change("DELETE FROM access WHERE client IN ('com.example.bench.client4', 'com.example.bench.client5')")
+        # Only the removed row of the watched service is reported, found by comparing every row
+        self.assertEqual(self.events(1), [('removed', 'com.example.bench.client4', None)])
+        self.wait(lambda: self.reads[0] == 3)
+
+    def test_full_compare_without_last_modified(self):
+        connection = sqlite3.connect(self.tcc_db)
+        connection.execute('CREATE TABLE copy AS SELECT service, client, client_type, allowed, prompt_count, indirect_object_identifier FROM access')
+        connection.execute('DROP TABLE access')
+        connection.execute('ALTER TABLE copy RENAME TO access')
+        connection.commit()
+        connection.close()
+
+        self.watch()
+        self.change("UPDATE access SET allowed = 0 WHERE client = 'com.example.bench.client4'",
+                    "DELETE FROM access WHERE client = 'com.example.bench.client5'")
+        self.assertEqual(sorted(self.events(2)), [('modified', 'com.example.bench.client4', 1), ('removed', 'com.example.bench.client5', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Tests that TCCStore.ingest tags snapshots by host and user, and skips files already in the store."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from fixtures import make_tcc_db  # noqa: E402
+from tccdbRead import TCCStore  # noqa: E402
+
+
+class TCCStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fleet = os.path.join(self.directory, 'fleet')
+        self.store = TCCStore(os.path.join(self.directory, 'store.db'))
+        for host, user, rows in [('mac1', None, 12), ('mac1', 'alice', 5), ('mac2', None, 7)]:
+            self.make_snapshot(host, user, rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_snapshot(self, host, user, rows, last_modified=1570000000):
+        directory = os.path.join(self.fleet, host, *(['Users', user] if user else []))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, 'TCC.db')
+        if os.path.exists(path):
+            os.remove(path)
+        return make_tcc_db(path, rows, last_modified=last_modified)
+
+    def test_ingest_skips_known_files(self):
+        result = self.store.ingest(self.fleet, jobs=2)
+        self.assertEqual((result['ingested'], result['skipped'], result['failed'], result['rows']), (3, 0, 0, 24))
+
+        # Nothing has changed, so every file is skipped by its sha256
+        result = self.store.ingest(self.fleet, jobs=2)
+        self.assertEqual((result['ingested'], result['skipped'], result['rows']), (0, 3, 0))
+
+        # Only the changed file is ingested again
+        self.make_snapshot('mac2', None, 9, last_modified=1580000000)
+        result = self.store.ingest(self.fleet, jobs=2)
+        self.assertEqual((result['ingested'], result['skipped'], result['rows']), (1, 2, 9))
+
+    def test_query_latest_snapshots(self):
+        self.store.ingest(self.fleet)
+        self.make_snapshot('mac2', None, 9, last_modified=1580000000)
+        # The snapshot time is the modification time of the file, so make the new snapshot the later one
+        later = int(time.time()) + 3600
+        os.utime(os.path.join(self.fleet, 'mac2', 'TCC.db'), (later, later))
+        self.store.ingest(self.fleet)
+
+        columns = TCCStore.QUERY_COLUMNS
+        rows = [dict(zip(columns, row)) for row in self.store.query()]
+        self.assertEqual(len(rows), 12 + 5 + 9)
+        self.assertEqual(set((row['host'], row['user']) for row in rows), set([('mac1', None), ('mac1', 'alice'), ('mac2', None)]))
+
+        self.assertEqual(len(list(self.store.query(hosts=['mac2'], all_snapshots=True))), 7 + 9)
+        self.assertEqual(len(list(self.store.query(users=['alice']))), 5)
+
+    def test_unreadable_file(self):
+        with open(os.path.join(self.fleet, 'mac2', 'broken.db'), 'wb') as f:
+            f.write(b'not a database')
+
+        result = self.store.ingest(self.fleet)
+        self.assertEqual((result['ingested'], result['failed']), (3, 1))
+        self.assertEqual(os.path.basename(result['errors'][0][0]), 'broken.db')
+
+
+if __name__ == '__main__':
+    unittest.main()